@@ -0,0 +1,83 @@
+"""
+Messages per second through TwilioSecretary.on_sms, for a mix of commands, with texts going to a
+fake outbox instead of Twilio.
+
+    python -m benchmarks.commands [messages]
+"""
+import sys
+import time
+import random
+
+from twilio_secretary.secretary import TwilioSecretary, SecretaryState, SecretarySettings
+
+ADMIN = '+13125550000'
+SETTINGS = {
+    'SID': 'ACbenchmark',
+    'TOKEN': 'token',
+    'PHONE_NUMBER': '+13125551234',
+    'MASTERS': [ADMIN],
+    'MASTERS_NAME': 'the benchmark',
+    'STORE_JSON': '/dev/null',
+}
+
+
+class FakeOutbox(object):
+
+    def __init__(self):
+        self.sent = 0
+
+    def put(self, to, text):
+        self.sent += len(to)
+        return len(to)
+
+
+class BenchSecretary(TwilioSecretary):
+
+    def __init__(self, outbox):
+        self.settings = SETTINGS
+        self.outbox = outbox
+
+
+def texts(count):
+    subscribers = ['+1312555%04d' % i for i in range(1000)]
+    mix = [
+        (40, lambda: (random.choice(subscribers), random.choice(['1', '2', '3']))),
+        (20, lambda: (random.choice(subscribers), random.choice(['subscribe', 'SUBSCRIBE', 'stop']))),
+        (15, lambda: (random.choice(subscribers), 'info')),
+        (10, lambda: (random.choice(subscribers), 'help')),
+        (5, lambda: (random.choice(subscribers), 'msg hello there')),
+        (5, lambda: (ADMIN, 'responses')),
+        (5, lambda: (ADMIN, 'tell red1 hi')),
+    ]
+    choices = []
+    for (weight, make) in mix:
+        choices += [make] * weight
+    return [random.choice(choices)() for i in range(count)]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    random.seed(0)
+
+    SecretarySettings.SETTINGS_DATA = SETTINGS
+    SecretaryState.add_update('benchmark update')
+    SecretaryState.add_poll('benchmark?', ['yes', 'no', 'maybe'])
+
+    outbox = FakeOutbox()
+    secretary = BenchSecretary(outbox)
+    work = texts(count)
+
+    # on_sms prints a line per text; don't time the terminal
+    stdout = sys.stdout
+    sys.stdout = open('/dev/null', 'w')
+    start = time.time()
+    for (from_number, text) in work:
+        secretary.on_sms(from_number, text)
+    elapsed = time.time() - start
+    sys.stdout = stdout
+
+    print '%d texts in %.2fs: %.0f texts/sec, %d replies' % (count, elapsed, count / elapsed, outbox.sent)
+
+
+if __name__ == '__main__':
+    main()
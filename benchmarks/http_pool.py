@@ -0,0 +1,67 @@
+"""
+Requests per second sending texts to a local fake Twilio, with a new connection for every request (the
+way the old TwilioRestClient did it) and with the shared keep-alive pool.
+
+    python -m benchmarks.http_pool [messages] [threads]
+"""
+import sys
+import time
+import httplib
+import threading
+
+import twilio_api
+from twilio_api.fake import FakeTwilio
+
+
+def new_connection_each_time(sender, base, to_number, text):
+    host, port = base[len('http://'):].split(':')
+    conn = httplib.HTTPConnection(host, int(port))
+    conn.request('POST', '/2010-04-01/Accounts/%s/Messages.json' % sender.settings['SID'],
+                 'To=%s&From=%s&Body=%s' % (to_number, sender.settings['PHONE_NUMBER'], text),
+                 {'Authorization': sender.auth, 'Connection': 'close'})
+    conn.getresponse().read()
+    conn.close()
+
+
+def pooled(sender, base, to_number, text):
+    sender.deliver_sms(to_number, text)
+
+
+def run(send, sender, base, messages, threads):
+    def worker(count):
+        for i in range(count):
+            send(sender, base, '3125550000', 'benchmark')
+
+    workers = [threading.Thread(target=worker, args=(messages / threads,)) for i in range(threads)]
+    start = time.time()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return (messages / threads * threads) / (time.time() - start)
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    fake = FakeTwilio().start()
+    sender = twilio_api.Twilio({
+        'SID': 'ACbenchmark',
+        'TOKEN': 'token',
+        'PHONE_NUMBER': '+13125551234',
+        'API_BASE': fake.base,
+        'HTTP_POOL_SIZE': threads,
+    })
+
+    for (name, send) in [('new connection each time', new_connection_each_time), ('pooled', pooled)]:
+        connections = fake.connections
+        rate = run(send, sender, fake.base, messages, threads)
+        print '%-26s %8.0f requests/sec, %d connections' % (name, rate, fake.connections - connections)
+
+    twilio_api.Twilio.close_pools()
+    fake.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Load test of the whole bot: synthetic Twilio webhooks posted to /inbound-sms/ (through Flask's test
+client), with replies and broadcasts going out through the outbox to a local fake Twilio that can be
+made slow and unreliable. Then the memory SecretaryState takes for 1k to 1M subscribers.
+
+    python -m benchmarks.load [subscribers] [latency] [error rate] [json|sqlite]
+
+For each scenario it reports webhooks handled a second, p50 and p99 of how long each one took, and how
+long saving the state took per webhook. Saves happen in the background (see FLUSH_DEBOUNCE), so that's
+counted once they've all finished, and isn't in the latencies.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+
+from twilio_api.fake import FakeTwilio
+
+ADMIN = '+13125550000'
+
+
+def rss():
+    # bytes of memory in use right now
+    try:
+        return int(open('/proc/self/statm').read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except IOError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class LoadTest(object):
+
+    def __init__(self, client, fake):
+        self.client = client
+        self.fake = fake
+
+    def post(self, from_number, text):
+        start = time.time()
+        self.client.post('/inbound-sms/', data={'AccountSid': 'ACbenchmark', 'From': from_number, 'Body': text})
+        return time.time() - start
+
+    def saves(self):
+        # how many saves there have been, and how long they took altogether
+        from twilio_secretary import metrics
+        value = metrics.SAVE_SECONDS.values.get(())
+        return (sum(value[0]), value[1]) if value is not None else (0, 0.0)
+
+    def wait_for_saves(self):
+        # the flusher saves in the background, after the webhooks have returned
+        from twilio_secretary.secretary import SecretaryState
+        if SecretaryState.FLUSHER is not None:
+            SecretaryState.FLUSHER.flush()
+
+    def wait_for_outbox(self, timeout=600):
+        from twilio_secretary.secretary import TwilioSecretary
+        outbox = TwilioSecretary.get_outbox()
+        deadline = time.time() + timeout
+        while outbox.depth() > 0 and time.time() < deadline:
+            time.sleep(0.01)
+
+    def run(self, name, texts):
+        self.wait_for_saves()
+        saves, saving = self.saves()
+        stdout = sys.stdout
+        # on_sms prints a line per text; don't time the terminal
+        sys.stdout = open(os.devnull, 'w')
+        start = time.time()
+        try:
+            latencies = [self.post(from_number, text) for (from_number, text) in texts]
+        finally:
+            elapsed = time.time() - start
+            sys.stdout = stdout
+        self.wait_for_saves()
+        saves_after, saving_after = self.saves()
+
+        print '%-20s %7d webhooks %8.0f/sec  p50 %6.2fms  p99 %6.2fms  saving %6.3fms each (%d saves)' % (
+            name, len(texts), len(texts) / elapsed, percentile(latencies, 0.5) * 1000,
+            percentile(latencies, 0.99) * 1000, (saving_after - saving) / len(texts) * 1000, saves_after - saves)
+
+    def broadcast(self, text):
+        from twilio_secretary.secretary import TwilioSecretary
+        requests = len(self.fake.messages) + self.fake.errors
+        self.run('update broadcast', [(ADMIN, 'update %s' % text)])
+        jobs = TwilioSecretary.get_jobs()
+        while jobs.progress()['finished'] is None:
+            time.sleep(0.01)
+        progress = jobs.progress()
+        print '%-20s %7d texts    %8.0f/sec  %d failed, %d requests to twilio' % (
+            'delivering it', progress['total'], progress['per_second'], progress['failed'],
+            len(self.fake.messages) + self.fake.errors - requests)
+
+
+def memory(sizes):
+    from twilio_secretary.secretary import SecretaryState
+
+    print
+    print 'subscribers    memory    from_doc   snapshot'
+    for size in sizes:
+        SecretaryState.from_doc({'subscribers': [], 'updates': [], 'number_map': [], 'polls': []})
+        gc.collect()
+        before = rss()
+
+        doc = {'subscribers': ['+1%010d' % (2000000000 + i * 7) for i in xrange(size)], 'updates': [],
+               'number_map': [], 'polls': []}
+        start = time.time()
+        SecretaryState.from_doc(doc)
+        loaded = time.time() - start
+        del doc
+        gc.collect()
+        used = rss() - before
+
+        start = time.time()
+        SecretaryState.STORE.compact(SecretaryState.to_doc())
+        snapshot = time.time() - start
+
+        print '%11d %7.1fMB %9.2fs %9.2fs' % (size, used / 1e6, loaded, snapshot)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    error_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    backend = sys.argv[4] if len(sys.argv) > 4 else 'json'
+
+    random.seed(0)
+    fake = FakeTwilio(latency=latency, error_rate=error_rate).start()
+    tmp = tempfile.mkdtemp()
+    settings = {
+        'SID': 'ACbenchmark',
+        'TOKEN': 'token',
+        'PHONE_NUMBER': '+13125551234',
+        'MASTERS': [ADMIN],
+        'MASTERS_NAME': 'the benchmark',
+        'STORE_JSON': os.path.join(tmp, 'state.json'),
+        'STATE_BACKEND': backend,
+        'API_BASE': fake.base,
+        'BROADCAST_CONCURRENCY': 16,
+        'HTTP_POOL_SIZE': 16,
+        'OUTBOX_BACKOFF': 0.05,
+    }
+    json.dump(settings, open(os.path.join(tmp, 'settings.json'), 'w'))
+    os.environ['SETTINGS_JSON'] = os.path.join(tmp, 'settings.json')
+
+    try:
+        # reads the settings when it's imported
+        from twilio_secretary.web import app
+
+        print '%d subscribers, %.0fms twilio latency, %.0f%% twilio errors, %s backend' % (
+            count, latency * 1000, error_rate * 100, backend)
+        test = LoadTest(app.test_client(), fake)
+        numbers = ['+1312%07d' % i for i in range(count)]
+
+        test.run('subscribe storm', [(number, 'subscribe') for number in numbers])
+        test.wait_for_outbox()
+        test.run('open poll', [(ADMIN, 'poll benchmark? yes / no / maybe')])
+        test.wait_for_outbox()
+        test.run('vote flood', [(number, random.choice(['1', '2', '3'])) for number in numbers])
+        test.wait_for_outbox()
+        test.broadcast('benchmark update')
+
+        memory([1000, 10000, 100000, 1000000])
+    finally:
+        fake.shutdown()
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Time taken to normalize 100k phone numbers, one at a time the way Twilio.process_number used to and
+as one batch, for numbers already in E.164 and for numbers typed in every which way.
+
+    python -m benchmarks.numbers [numbers]
+"""
+import sys
+import time
+import random
+
+from twilio_api import numbers
+
+
+def process_number(num):
+    # what Twilio.process_number did before numbers.py
+    num = str(num)
+    num = num.replace('-', '').replace(' ', '').replace('(', '').replace(')', '').replace('+', '')
+    if len(num) == 10:
+        num = '1' + num
+    return '+' + num
+
+
+def timed(name, f):
+    start = time.time()
+    f()
+    print '  %-28s %.1fms' % (name, (time.time() - start) * 1000)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    random.seed(0)
+    e164 = ['+1%010d' % random.randrange(2000000000, 9999999999) for i in range(count)]
+    formats = ['(%s) %s-%s', '%s-%s-%s', '1 %s %s %s', '+1%s%s%s']
+    typed = [random.choice(formats) % (n[2:5], n[5:8], n[8:]) for n in e164]
+
+    print '%d numbers' % count
+    timed('e164: one at a time', lambda: [process_number(n) for n in e164])
+    timed('e164: batch', lambda: numbers.normalize_all(e164))
+    timed('typed: one at a time', lambda: [process_number(n) for n in typed])
+    timed('typed: batch', lambda: numbers.normalize_all(typed))
+    timed('same 100, one at a time', lambda: [process_number(n) for n in typed[:100] * (count / 100)])
+    timed('same 100, cached', lambda: [numbers.normalize(n) for n in typed[:100] * (count / 100)])
+
+
+if __name__ == '__main__':
+    main()
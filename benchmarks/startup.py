@@ -0,0 +1,79 @@
+"""
+How long a new worker takes to start and answer its first webhook, for state stores of 1k to 1M
+subscribers, with the subscribers in the snapshot as a list of numbers (how they used to be kept) and
+packed (how they are now).
+
+    python -m benchmarks.startup [json|sqlite]
+
+Each start is a fresh python process: it reports the time to import the app, to answer the first request
+(which starts loading the state and waits for it), and to answer the one after that.
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+
+WORKER = '''
+import time
+start = time.time()
+from twilio_secretary.web import app
+imported = time.time()
+client = app.test_client()
+client.post('/inbound-call/')
+first = time.time()
+client.post('/inbound-call/')
+print imported - start, first - imported, time.time() - first
+'''
+
+
+def write_state(settings, size, packed):
+    from twilio_secretary.secretary import SecretaryState
+    from twilio_secretary.backends import get_backend
+
+    SecretaryState.from_doc({'subscribers': ['+1%010d' % (2000000000 + i * 7) for i in xrange(size)],
+                             'updates': [[0, 'benchmark update']], 'number_map': [], 'polls': []})
+    doc = SecretaryState.to_doc()
+    if not packed:
+        doc['subscribers'] = SecretaryState.SUBSCRIBERS.to_list()
+        del doc['subscribers_packed']
+    get_backend(settings).compact(doc)
+
+
+def start_worker(env):
+    output = subprocess.check_output([sys.executable, '-c', WORKER], env=env)
+    return [float(seconds) for seconds in output.split()[-3:]]
+
+
+def main():
+    backend = sys.argv[1] if len(sys.argv) > 1 else 'json'
+
+    print '%s backend' % backend
+    print 'subscribers  snapshot     import  first request  next request'
+    for size in [1000, 10000, 100000, 1000000]:
+        for packed in [False, True]:
+            tmp = tempfile.mkdtemp()
+            try:
+                settings = {
+                    'SID': 'ACbenchmark',
+                    'TOKEN': 'token',
+                    'PHONE_NUMBER': '+13125551234',
+                    'MASTERS': ['+13125550000'],
+                    'MASTERS_NAME': 'the benchmark',
+                    'STORE_JSON': os.path.join(tmp, 'state.json'),
+                    'STATE_BACKEND': backend,
+                }
+                write_state(settings, size, packed)
+                json.dump(settings, open(os.path.join(tmp, 'settings.json'), 'w'))
+                env = dict(os.environ, SETTINGS_JSON=os.path.join(tmp, 'settings.json'),
+                           PYTHONPATH=os.pathsep.join(sys.path))
+                imported, first, after = start_worker(env)
+                print '%11d  %-8s %8.0fms %12.0fms %11.1fms' % (
+                    size, 'packed' if packed else 'list', imported * 1000, first * 1000, after * 1000)
+            finally:
+                shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Memory and time taken by 100k subscribers, as a set of strings and as a SubscriberStore.
+
+    python -m benchmarks.subscribers [subscribers]
+"""
+import sys
+import time
+import random
+
+from twilio_secretary.subscribers import SubscriberStore
+
+
+def set_size(numbers):
+    return sys.getsizeof(numbers) + sum(sys.getsizeof(n) for n in numbers)
+
+
+def store_size(store):
+    return sys.getsizeof(store.packed) + sys.getsizeof(store.others)
+
+
+def timed(name, f):
+    start = time.time()
+    f()
+    print '  %-28s %.1fms' % (name, (time.time() - start) * 1000)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    random.seed(0)
+    numbers = ['+1%010d' % random.randrange(2000000000, 9999999999) for i in range(count)]
+    extra = ['+1%010d' % random.randrange(2000000000, 9999999999) for i in range(1000)]
+
+    as_set = set(numbers)
+    store = SubscriberStore(numbers)
+    print '%d subscribers' % len(store)
+    print '  set of strings              %.1fMB' % (set_size(as_set) / 1e6)
+    print '  SubscriberStore             %.1fMB' % (store_size(store) / 1e6)
+
+    timed('set: iterate', lambda: [n for n in as_set])
+    timed('store: iterate', lambda: [n for n in store])
+    timed('store: 1000 shards of 100', lambda: [s for s in store.shards(100)])
+    timed('set: 1000 lookups', lambda: [n in as_set for n in extra])
+    timed('store: 1000 lookups', lambda: [n in store for n in extra])
+    timed('set: 1000 adds', lambda: [as_set.add(n) for n in extra])
+    timed('store: 1000 adds', lambda: [store.add(n) for n in extra])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import json
+import time
+
+import pytest
+
+import twilio_api
+from twilio_secretary.secretary import SecretaryState, SecretarySettings, TwilioSecretary
+
+ADMIN = '+15551110000'
+EMPTY_DOC = {'subscribers': [], 'updates': [], 'number_map': [], 'polls': []}
+
+
+@pytest.fixture
+def settings(tmpdir, monkeypatch):
+    """
+    Settings for a bot with its state in tmpdir, starting from nothing. They're only read when something
+    needs them, so a test can change them first.
+    """
+    settings = {
+        'SID': 'ACtest',
+        'TOKEN': 'token',
+        'PHONE_NUMBER': '+15550000000',
+        'MASTERS': [ADMIN],
+        'MASTERS_NAME': 'the test',
+        'STORE_JSON': str(tmpdir.join('state.json')),
+        'STATE_FSYNC': False,
+        'FLUSH_DEBOUNCE': 0,
+        'OUTBOX_BACKOFF': 0.01,
+    }
+    fn = tmpdir.join('settings.json')
+    fn.write(json.dumps(settings))
+    monkeypatch.setenv('SETTINGS_JSON', str(fn))
+    monkeypatch.setattr(SecretarySettings, 'SETTINGS_DATA', settings)
+
+    for (name, value) in [('STORE', None), ('CHANGES', []), ('DIRTY', False), ('FLUSHER', None),
+                          ('SCHEDULER', None), ('ARCHIVE_PENDING', []), ('POLL_ARCHIVE_PENDING', [])]:
+        monkeypatch.setattr(SecretaryState, name, value)
+    for name in ['SUBSCRIBERS', 'UPDATES', 'NUMBER_MAP', 'POLLS', 'SCHEDULED', 'UPDATES_RETAIN', 'LOCKS',
+                 'SUBSCRIBERS_LOCK', 'UPDATES_LOCK', 'NAMES_LOCK', 'POLLS_LOCK', 'SCHEDULE_LOCK']:
+        monkeypatch.setattr(SecretaryState, name, getattr(SecretaryState, name))
+    SecretaryState.from_doc(EMPTY_DOC)
+    for (name, value) in [('OUTBOX', None), ('JOBS', None), ('DELIVERY', None), ('HELP_TEXTS', {})]:
+        monkeypatch.setattr(TwilioSecretary, name, value)
+    return settings
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """
+    Texts sent (as tuples of number, text) instead of going to Twilio.
+    """
+    sent = []
+    monkeypatch.setattr(twilio_api.Twilio, 'deliver_sms', lambda self, to, text: sent.append((to, text)))
+    return sent
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('timed out waiting')
+        time.sleep(0.005)
+
+
+def start_worker(monkeypatch):
+    """
+    Makes an app as a newly started worker would, with nothing loaded or started yet.
+    """
+    # the web module makes an app of its own when it's first imported, which needs the settings
+    from twilio_secretary import web
+    if web.STATE_LOADER is not None:
+        # still loading the last one's state, maybe
+        web.STATE_LOADER.join()
+    for (name, value) in [('STATE_LOADED', False), ('STATE_LOADER', None), ('BACKGROUND_PID', None),
+                          ('SEEN_MESSAGES', None)]:
+        monkeypatch.setattr(web, name, value)
+    return web.create_app()
+
+
+@pytest.fixture
+def client(settings, sent, monkeypatch):
+    return start_worker(monkeypatch).test_client()
+
+
+def text(client, from_number, body, sid=None):
+    data = {'AccountSid': 'ACtest', 'From': from_number, 'Body': body}
+    if sid is not None:
+        data['MessageSid'] = sid
+    return client.post('/inbound-sms/', data=data)
@@ -0,0 +1,141 @@
+import time
+import sqlite3
+import threading
+
+from conftest import start_worker
+from twilio_secretary.backends import get_backend
+from twilio_secretary.secretary import SecretaryState
+
+
+def other_process(settings):
+    # another worker on the same database, logging changes without keeping any state of its own
+    other = get_backend(settings)
+    other.load()
+    return other
+
+
+def log(backend, *record):
+    backend.log(list(record), lambda doc, records: None)
+
+
+def reloaded(settings):
+    doc, records = get_backend(settings).load()
+    SecretaryState.from_doc(doc or {'subscribers': [], 'updates': [], 'number_map': [], 'polls': []})
+    for record in records:
+        SecretaryState.apply(record)
+    return SecretaryState.to_doc()
+
+
+def test_sqlite_changes_apply_in_log_order(settings):
+    settings['STATE_BACKEND'] = 'sqlite'
+    SecretaryState.from_disk()
+    other = other_process(settings)
+    log(other, 'subscribe', '+15552220001')
+    log(other, 'unsubscribe', '+15552220001')
+
+    # this process hasn't seen either yet, so its subscribe has to come after both
+    assert SecretaryState.add_subscriber('+15552220001')
+    assert '+15552220001' in SecretaryState.SUBSCRIBERS
+    here = SecretaryState.to_doc()
+    assert reloaded(settings) == here
+
+
+def test_sqlite_answer_after_poll_closed_elsewhere(settings):
+    settings['STATE_BACKEND'] = 'sqlite'
+    SecretaryState.from_disk()
+    SecretaryState.add_poll('Lunch?', ['yes', 'no'])
+    opened = SecretaryState.POLLS[-1].opened
+
+    other = other_process(settings)
+    log(other, 'close_poll', opened + 1)
+    SecretaryState.answer_poll('+15552220001', 1)
+    assert SecretaryState.POLLS == []
+
+    log(other, 'add_poll', 'Dinner?', ['yes', 'no'], opened + 2)
+    log(other, 'answer_poll', '+15552220002', 1, opened + 2)
+    # an answer to the first poll that only gets logged now doesn't count for the second
+    log(other, 'answer_poll', '+15552220001', 0, opened)
+    SecretaryState.sync()
+    assert SecretaryState.POLLS[-1].responses == {'+15552220002': 1}
+    assert reloaded(settings)['polls'] == [SecretaryState.POLLS[-1].to_doc()]
+
+
+def test_sqlite_compacts_with_other_processes_logging(settings):
+    settings['STATE_BACKEND'] = 'sqlite'
+    settings['COMPACT_EVERY'] = 3
+    SecretaryState.from_disk()
+    other = other_process(settings)
+    for i in range(10):
+        SecretaryState.add_subscriber('+1555222%04d' % i)
+        log(other, 'name', '+1555222%04d' % i, 'name%d' % i)
+        SecretaryState.save()
+
+    SecretaryState.sync()
+    here = SecretaryState.to_doc()
+    assert len(SecretaryState.SUBSCRIBERS) == 10
+    assert reloaded(settings) == here
+
+
+def test_sqlite_starts_from_the_json_store(settings):
+    settings['COMPACT_EVERY'] = 2
+    SecretaryState.from_disk()
+    for i in range(4):
+        SecretaryState.add_subscriber('+1555222%04d' % i)
+        SecretaryState.save()
+    SecretaryState.STORE.archive_updates([(1.0, 'old news')])
+    # some of it in the snapshot, some in the log
+    assert SecretaryState.STORE.log_length == 1
+    here = SecretaryState.to_doc()
+
+    settings['STATE_BACKEND'] = 'sqlite'
+    assert reloaded(settings) == here
+    assert get_backend(settings).archived_updates(2.0, 10) == [(1.0, 'old news')]
+
+    # only a new database is seeded
+    log(other_process(settings), 'unsubscribe', '+15552220000')
+    assert '+15552220000' not in reloaded(settings)['subscribers']
+
+
+def test_sqlite_reads_do_not_wait_for_writers(settings, sent, monkeypatch):
+    settings['STATE_BACKEND'] = 'sqlite'
+    client = start_worker(monkeypatch).test_client()
+    client.get('/')
+    log(other_process(settings), 'subscribe', '+15552220001')
+
+    # some other process in the middle of a write, compacting say
+    writer = sqlite3.connect(settings['STORE_JSON'] + '.sqlite', isolation_level=None)
+    writer.execute('BEGIN IMMEDIATE')
+    try:
+        start = time.time()
+        assert client.get('/updates/').status_code == 200
+        assert client.post('/inbound-call/').status_code == 200
+        assert time.time() - start < 1
+        assert '+15552220001' in SecretaryState.SUBSCRIBERS
+    finally:
+        writer.execute('ROLLBACK')
+
+
+def test_sqlite_sync_with_nothing_new_takes_no_locks(settings):
+    settings['STATE_BACKEND'] = 'sqlite'
+    SecretaryState.from_disk()
+    SecretaryState.add_subscriber('+15552220001')
+
+    # something else is changing the state in this process
+    locked, release = threading.Event(), threading.Event()
+
+    def hold():
+        with SecretaryState.SUBSCRIBERS_LOCK:
+            locked.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    locked.wait()
+    try:
+        synced = threading.Thread(target=SecretaryState.sync)
+        synced.start()
+        synced.join(1)
+        assert not synced.is_alive()
+    finally:
+        release.set()
+        thread.join()
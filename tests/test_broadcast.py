@@ -0,0 +1,40 @@
+import time
+import threading
+
+from conftest import ADMIN, text, wait_for
+from twilio_api import TwilioHttpError
+from twilio_secretary.broadcast import Broadcaster, summary
+
+
+def test_broadcaster_sends_to_everyone_at_once():
+    running = []
+    most = []
+    lock = threading.Lock()
+
+    def send(number, text):
+        with lock:
+            running.append(number)
+            most.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(number)
+        if number.endswith('3'):
+            raise TwilioHttpError(400, 'not a mobile number')
+
+    result = Broadcaster(send, concurrency=4).run(['+1555222000%d' % i for i in range(8)], 'hello')
+    assert (result.sent, result.failed) == (7, 1)
+    assert [number for (number, error) in result.failures()] == ['+15552220003']
+    assert 1 < max(most) <= 4
+
+
+def test_summary():
+    assert summary(3, 0) == 'Sent to 3 subscribers.'
+    assert summary(3, 1) == 'Sent to 3 subscribers. Failed to send to 1.'
+
+
+def test_admins_hear_when_a_broadcast_finishes(settings, client, sent):
+    for i in range(3):
+        text(client, '+1555222000%d' % i, 'subscribe')
+    text(client, ADMIN, 'update hello')
+
+    wait_for(lambda: any(to == ADMIN and body.endswith('finished. Sent to 3 subscribers.') for (to, body) in sent))
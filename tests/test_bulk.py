@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from twilio_secretary import bulk
+from twilio_secretary.__main__ import main
+from twilio_secretary.backends import get_backend, StateLocked
+from twilio_secretary.secretary import SecretaryState
+
+
+def test_import_and_export(settings, tmpdir):
+    fn = tmpdir.join('in.csv')
+    fn.write('number,name\n(312) 555-0001,Alice\n+1 312 555 0002,\nnot a number,Bob\n3125550001,Al\n')
+    main(['import', str(fn)])
+
+    SecretaryState.from_disk()
+    assert sorted(SecretaryState.SUBSCRIBERS) == ['+13125550001', '+13125550002']
+    assert SecretaryState.NUMBER_MAP.name_of('+13125550001') == 'Al'
+
+    out = tmpdir.join('out.jsonl')
+    main(['export', str(out)])
+    rows = sorted([json.loads(line) for line in out.readlines()], key=lambda row: row['number'])
+    assert rows == [{'number': '+13125550001', 'name': 'Al'}, {'number': '+13125550002', 'name': None}]
+
+
+def test_names_only_import(settings, tmpdir):
+    fn = tmpdir.join('in.jsonl')
+    fn.write('{"number": "3125550001", "name": "Alice Smith"}\n"3125550002"\n')
+    main(['import', '--names-only', str(fn)])
+
+    SecretaryState.from_disk()
+    assert len(SecretaryState.SUBSCRIBERS) == 0
+    assert SecretaryState.NUMBER_MAP.name_of('+13125550001') == 'Alice'
+
+
+def test_importer_dedupes_in_batches(monkeypatch):
+    monkeypatch.setattr(bulk, 'BATCH_SIZE', 2)
+    importer = bulk.Importer()
+    for batch in bulk.batches([('312555%04d' % (i % 3), None) for i in range(20)], size=2):
+        importer.add(batch)
+    assert importer.rows == 20
+    assert sorted(importer.store()) == ['+13125550000', '+13125550001', '+13125550002']
+
+
+def test_import_refused_while_the_bot_runs(settings, tmpdir):
+    # the bot, in another process
+    running = get_backend(settings)
+    running.lock_state()
+    with pytest.raises(StateLocked):
+        get_backend(settings).lock_state()
+
+    fn = tmpdir.join('in.csv')
+    fn.write('3125550001\n')
+    with pytest.raises(SystemExit):
+        main(['import', str(fn)])
+
+    running.unlock_state()
+    main(['import', str(fn)])
+    SecretaryState.from_disk()
+    assert list(SecretaryState.SUBSCRIBERS) == ['+13125550001']
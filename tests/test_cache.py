@@ -0,0 +1,42 @@
+from twilio_secretary.cache import RenderCache
+from twilio_secretary.secretary import SecretaryState
+
+
+def test_renders_once_per_key():
+    renders = []
+
+    def render():
+        renders.append(1)
+        return u'caf\xe9 %d' % len(renders)
+
+    cache = RenderCache()
+    body, etag, rendered_at = cache.get('a', render)
+    assert body == 'caf\xc3\xa9 1'
+    assert cache.get('a', render) == (body, etag, rendered_at)
+    assert cache.get('b', render)[0] == 'caf\xc3\xa9 2'
+    assert cache.get('b', render)[1] != etag
+    assert len(renders) == 2
+
+
+def test_call_twiml_is_rendered_again_when_the_update_changes(client):
+    response = client.post('/inbound-call/')
+    assert response.status_code == 200
+    assert 'There is no info saved right now.' in response.data
+    etag = response.headers['ETag']
+    assert client.post('/inbound-call/').headers['ETag'] == etag
+
+    SecretaryState.add_update('doors at 7')
+    response = client.post('/inbound-call/')
+    assert response.headers['ETag'] != etag
+    assert 'doors at 7' in response.data
+
+
+def test_updates_page_changes_with_the_updates(client):
+    first = client.get('/updates/')
+    assert first.status_code == 200
+    assert client.get('/updates/', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    SecretaryState.add_update('doors at 7')
+    response = client.get('/updates/', headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 200
+    assert 'doors at 7' in response.data
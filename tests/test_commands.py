@@ -0,0 +1,55 @@
+import pytest
+
+from conftest import ADMIN, text, wait_for
+from twilio_secretary.commands import CommandRegistry, Usage, text_argument, two_arguments
+
+
+def test_registry_looks_commands_up_by_name():
+    registry = CommandRegistry()
+
+    @registry.command('hello', help='HELLO')
+    def on_hello(secretary, from_number):
+        return 'hi'
+
+    @registry.command('secret', admin=True, help='SECRET')
+    def on_secret(secretary, from_number):
+        pass
+
+    assert registry.lookup('hello').handler is on_hello
+    assert registry.lookup('nope') is None
+    assert registry.help_lines(False) == ['HELLO']
+    assert registry.help_lines(True) == ['SECRET']
+
+
+def test_argument_parsers():
+    assert text_argument('say something')('hi there') == ['hi there']
+    with pytest.raises(Usage):
+        text_argument('say something')(None)
+    assert two_arguments('a name and a message')('bob hi there') == ['bob', 'hi there']
+    with pytest.raises(Usage):
+        two_arguments('a name and a message')('bob')
+
+
+def test_commands_are_case_and_punctuation_blind(client, sent):
+    text(client, '+15552220001', 'Subscribe!')
+    wait_for(lambda: sent)
+    assert sent[0][0] == '+15552220001'
+    assert sent[0][1].startswith('Subscribed.')
+
+
+def test_admin_commands_are_refused_to_others(client, sent):
+    text(client, '+15552220001', 'update hello')
+    wait_for(lambda: sent)
+    assert sent == [('+15552220001', "You can't use that feature, sorry.")]
+
+
+def test_usage_is_sent_back(client, sent):
+    text(client, ADMIN, 'tell bob')
+    wait_for(lambda: sent)
+    assert sent == [(ADMIN, 'You have to send name and a message.')]
+
+
+def test_anything_else_gets_help(client, sent):
+    text(client, '+15552220001', 'what is this')
+    wait_for(lambda: sent)
+    assert 'SUBSCRIBE (Get text updates)' in '\n'.join(body for (to, body) in sent)
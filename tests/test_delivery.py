@@ -0,0 +1,65 @@
+import json
+
+from conftest import wait_for
+from twilio_secretary.delivery import DeliveryLog
+from twilio_secretary.secretary import SecretaryState
+
+
+def event(number, status, error_code=None):
+    return {'MessageSid': 'SM1', 'MessageStatus': status, 'To': number, 'ErrorCode': error_code}
+
+
+def test_numbers_are_pruned_after_failures_in_a_row(tmpdir):
+    pruned = []
+    log = DeliveryLog(str(tmpdir.join('delivery')), pruned.append, prune_after=3)
+    log.flush([event('+15552220001', 'failed', '30003'), event('+15552220001', 'undelivered', '30004'),
+               event('+15552220002', 'failed', '30003'), event('+15552220002', 'delivered'),
+               event('+15552220002', 'failed', '30003')])
+    assert pruned == []
+    log.flush([event('+15552220001', 'failed', '30003'), event('+15552220002', 'failed', '30003')])
+    assert pruned == ['+15552220001']
+
+    # the counts survive a restart
+    assert DeliveryLog(str(tmpdir.join('delivery')), pruned.append).failures == {'+15552220002': 2}
+    assert len(open(str(tmpdir.join('delivery'))).readlines()) == 7
+
+
+def test_dead_numbers_are_pruned_straight_away(tmpdir):
+    pruned = []
+    log = DeliveryLog(str(tmpdir.join('delivery')), pruned.append, prune_after=3)
+    log.flush([event('+15552220001', 'undelivered', '30006'), event('+15552220002', 'sent')])
+    assert pruned == ['+15552220001']
+
+
+def test_failures_that_are_not_the_numbers_fault_do_not_count(tmpdir):
+    pruned = []
+    log = DeliveryLog(str(tmpdir.join('delivery')), pruned.append, prune_after=3)
+    numbers = ['+1555222000%d' % i for i in range(5)]
+    for error_code in ['30001', '30001', '30002', '30007', '30008', None]:
+        log.flush([event(number, 'undelivered', error_code) for number in numbers])
+    assert pruned == []
+    assert log.failures == {}
+
+    log.flush([event(numbers[0], 'failed', '30003'), event(numbers[0], 'failed', '30001')])
+    assert log.failures == {numbers[0]: 1}
+
+
+def test_status_callbacks_unsubscribe_dead_numbers(settings, client):
+    # once the state is loaded
+    client.get('/')
+    SecretaryState.add_subscriber('+15552220001')
+    for status in ['failed', 'failed', 'failed']:
+        response = client.post('/sms-status/', data={'AccountSid': 'ACtest', 'MessageSid': 'SM1',
+                                                     'MessageStatus': status, 'To': '+15552220001',
+                                                     'ErrorCode': '30003'})
+        assert response.status_code == 200
+    wait_for(lambda: '+15552220001' not in SecretaryState.SUBSCRIBERS)
+
+    lines = open(settings['STORE_JSON'] + '.outbox.delivery').readlines()
+    assert [json.loads(line)['MessageStatus'] for line in lines] == ['failed', 'failed', 'failed']
+
+
+def test_status_callbacks_need_the_account(client):
+    response = client.post('/sms-status/', data={'AccountSid': 'ACother', 'MessageStatus': 'failed',
+                                                 'To': '+15552220001'})
+    assert response.status_code == 403
@@ -0,0 +1,67 @@
+from twilio_secretary.directory import NumberDirectory
+from twilio_secretary.secretary import SecretaryState
+
+
+def test_names_are_looked_up_either_way():
+    directory = NumberDirectory([['+15552220001', 'Alice'], ['+15552220002', 'bob']])
+    assert directory.name_of('+15552220001') == 'Alice'
+    assert directory.number_of('ALICE') == '+15552220001'
+    assert directory.number_of('Bob') == '+15552220002'
+    assert directory.number_of('carol') is None
+
+
+def test_renaming_drops_the_old_name():
+    directory = NumberDirectory([['+15552220001', 'Alice']])
+    directory.set('+15552220001', 'Al')
+    assert directory.number_of('alice') is None
+    assert directory.number_of('al') == '+15552220001'
+    assert len(directory) == 1
+
+
+def test_a_name_two_numbers_have_goes_to_the_first():
+    directory = NumberDirectory([['+15552220001', 'Alice'], ['+15552220002', 'alice']])
+    assert directory.number_of('Alice') == '+15552220001'
+    directory.set('+15552220003', 'ALICE')
+    assert directory.number_of('Alice') == '+15552220001'
+
+    # renaming the second one leaves the name with the first
+    directory.set('+15552220002', 'bob')
+    assert directory.number_of('alice') == '+15552220001'
+    # and renaming the first gives it to the one named next
+    directory.set('+15552220001', 'Al')
+    assert directory.number_of('alice') == '+15552220003'
+    directory.set('+15552220003', 'carol')
+    assert directory.number_of('alice') is None
+
+
+def test_names_in_use_are_not_generated():
+    directory = NumberDirectory([['+15552220001', 'red1'], ['+15552220002', 'red1']])
+    directory.NAME_PREFIXES = ['red']
+    directory.set('+15552220002', 'bob')
+    assert directory.generate_name() == 'red2'
+
+
+def test_saved_in_the_order_numbers_were_named():
+    pairs = [['+1555222%04d' % i, 'name%d' % (i % 3)] for i in range(20)]
+    directory = NumberDirectory(pairs)
+    directory.set('+15552220005', 'renamed')
+    pairs[5][1] = 'renamed'
+    assert directory.to_list() == pairs
+    assert NumberDirectory(directory.to_list()).number_of('name2') == '+15552220002'
+
+
+def test_generated_names_are_unused():
+    directory = NumberDirectory([['+1555222%04d' % i, '%s1' % prefix]
+                                 for (i, prefix) in enumerate(NumberDirectory.NAME_PREFIXES)])
+    name = directory.generate_name()
+    assert directory.number_of(name) is None
+    assert name.endswith('2')
+
+
+def test_rename_through_the_state(settings):
+    SecretaryState.from_disk()
+    name = SecretaryState.get_number_name('+15552220001')
+    assert SecretaryState.get_number_name('+15552220001') == name
+    assert SecretaryState.rename(name.upper(), 'Alice')
+    assert SecretaryState.NUMBER_MAP.number_of('alice') == '+15552220001'
+    assert not SecretaryState.rename(name, 'Bob')
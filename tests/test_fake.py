@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+from benchmarks import load
+from conftest import ADMIN, start_worker
+from twilio_api import Twilio, TwilioHttpError
+from twilio_api.fake import FakeTwilio
+
+
+@pytest.fixture
+def fake():
+    server = FakeTwilio().start()
+    yield server
+    server.shutdown()
+    Twilio.close_pools()
+
+
+def twilio(fake):
+    return Twilio({'SID': 'ACtest', 'TOKEN': 'token', 'PHONE_NUMBER': '+15550000000', 'API_BASE': fake.base})
+
+
+def test_texts_are_recorded_over_one_connection(fake):
+    client = twilio(fake)
+    for i in range(3):
+        client.deliver_sms('+1555222000%d' % i, u'hello')
+    assert [(to, body) for (to, body, sid) in fake.messages] == [('+1555222000%d' % i, 'hello') for i in range(3)]
+    assert all(sid.startswith('SM') for (to, body, sid) in fake.messages)
+    assert fake.connections == 1
+
+
+def test_errors_on_purpose(fake):
+    fake.error_rate = 1.0
+    with pytest.raises(TwilioHttpError) as e:
+        twilio(fake).deliver_sms('+15552220000', u'hello')
+    assert e.value.status == 500
+    assert fake.errors == 1
+    assert fake.messages == []
+
+
+def test_latency(fake):
+    fake.latency = 0.05
+    start = time.time()
+    twilio(fake).deliver_sms('+15552220000', u'hello')
+    assert time.time() - start >= 0.05
+
+
+def test_unknown_paths(fake):
+    with pytest.raises(TwilioHttpError) as e:
+        twilio(fake).post(fake.base, '/2010-04-01/Accounts/ACtest/Calls.json', [])
+    assert e.value.status == 404
+
+
+def test_percentile():
+    values = range(100, 0, -1)
+    assert load.percentile(values, 0.5) == 51
+    assert load.percentile(values, 0.99) == 100
+    assert load.percentile([3], 0.99) == 3
+
+
+def test_load_test_posts_webhooks(settings, sent, monkeypatch, capsys):
+    settings['SID'] = 'ACbenchmark'
+    test = load.LoadTest(start_worker(monkeypatch).test_client(), None)
+    test.run('subscribe storm', [('+1555222000%d' % i, 'subscribe') for i in range(3)] + [(ADMIN, 'list')])
+    assert 'subscribe storm            4 webhooks' in capsys.readouterr()[0]
+
+    from twilio_secretary.secretary import SecretaryState
+    assert len(SecretaryState.SUBSCRIBERS) == 3
+
+
+def test_load_test_counts_background_saves(settings, sent, monkeypatch, capsys):
+    settings.update(SID='ACbenchmark', FLUSH_DEBOUNCE=10)
+    test = load.LoadTest(start_worker(monkeypatch).test_client(), None)
+    test.run('subscribe storm', [('+1555222000%d' % i, 'subscribe') for i in range(3)])
+    assert '(1 saves)' in capsys.readouterr()[0]
+
+    from twilio_secretary.secretary import SecretaryState
+    SecretaryState.FLUSHER.stop()
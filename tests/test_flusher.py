@@ -0,0 +1,113 @@
+import os
+import time
+
+from conftest import EMPTY_DOC, wait_for
+from twilio_secretary.backends import JsonFileBackend
+from twilio_secretary.flusher import Flusher
+from twilio_secretary.secretary import SecretaryState
+
+
+def start(saves, **kwargs):
+    flusher = Flusher(lambda: saves.append(time.time()), **kwargs)
+    flusher.start()
+    return flusher
+
+
+def test_marks_close_together_are_saved_once():
+    saves = []
+    flusher = start(saves, debounce=0.05)
+    marked = time.time()
+    for i in range(10):
+        flusher.mark()
+    wait_for(lambda: saves)
+    time.sleep(0.1)
+    assert len(saves) == 1
+    assert saves[0] - marked >= 0.05
+    flusher.stop()
+
+
+def test_saves_at_most_max_delay_after_the_first_mark():
+    saves = []
+    flusher = start(saves, debounce=0.05, max_delay=0.2)
+    marked = time.time()
+    while not saves:
+        flusher.mark()
+        time.sleep(0.01)
+    assert 0.2 <= saves[0] - marked < 0.3
+    flusher.stop()
+
+
+def test_stop_saves_what_is_marked():
+    saves = []
+    flusher = start(saves, debounce=10)
+    flusher.stop()
+    assert saves == []
+
+    flusher = start(saves, debounce=10)
+    flusher.mark()
+    flusher.stop()
+    assert len(saves) == 1
+    assert not flusher.thread.is_alive()
+
+
+def test_a_failed_save_does_not_stop_it():
+    saves = []
+
+    def save():
+        saves.append(time.time())
+        if len(saves) == 1:
+            raise IOError('disk full')
+
+    flusher = Flusher(save, debounce=0.01)
+    flusher.start()
+    flusher.mark()
+    wait_for(lambda: saves)
+    flusher.mark()
+    wait_for(lambda: len(saves) == 2)
+    flusher.stop()
+
+
+def test_changes_are_saved_in_the_background(settings):
+    settings['FLUSH_DEBOUNCE'] = 0.01
+    SecretaryState.from_disk()
+    SecretaryState.start_flusher()
+    SecretaryState.add_subscriber('+15552220001')
+    SecretaryState.add_subscriber('+15552220002')
+
+    wait_for(lambda: not SecretaryState.DIRTY)
+    SecretaryState.FLUSHER.stop()
+    doc, records = JsonFileBackend(settings['STORE_JSON'], fsync=False).load()
+    assert records == [['subscribe', '+15552220001'], ['subscribe', '+15552220002']]
+
+
+def test_fsync(tmpdir, monkeypatch):
+    synced = []
+    monkeypatch.setattr(os, 'fsync', lambda fd: synced.append(fd))
+    fn = str(tmpdir.join('state.json'))
+    backend = JsonFileBackend(fn, fsync=False)
+    backend.load()
+    backend.append([['subscribe', '+15552220001']])
+    backend.compact(EMPTY_DOC)
+    assert synced == []
+
+    backend = JsonFileBackend(fn)
+    backend.load()
+    backend.append([['subscribe', '+15552220001']])
+    assert len(synced) == 1
+    backend.compact(EMPTY_DOC)
+    # the snapshot and the directory it's renamed in
+    assert len(synced) == 3
+
+
+def test_flush_saves_now():
+    saves = []
+    flusher = start(saves, debounce=10)
+    flusher.flush()
+    assert saves == []
+
+    flusher.mark()
+    flusher.flush()
+    assert len(saves) == 1
+    flusher.flush()
+    assert len(saves) == 1
+    flusher.stop()
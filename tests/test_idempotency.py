@@ -0,0 +1,85 @@
+import time
+
+from conftest import ADMIN, text
+from twilio_secretary import metrics
+from twilio_secretary.idempotency import SeenCache
+from twilio_secretary.secretary import TwilioSecretary
+
+
+def test_each_id_is_new_once():
+    seen = SeenCache()
+    assert seen.add('SM1')
+    assert not seen.add('SM1')
+    assert seen.add('SM2')
+
+
+def test_ids_are_remembered_for_ttl_seconds():
+    seen = SeenCache(ttl=0.05)
+    assert seen.add('SM1')
+    time.sleep(0.06)
+    assert seen.add('SM1')
+
+
+def test_only_the_last_size_ids_are_remembered():
+    seen = SeenCache(size=2)
+    for sid in ['SM1', 'SM2', 'SM3']:
+        seen.add(sid)
+    assert seen.seen.keys() == ['SM2', 'SM3']
+    assert seen.add('SM1')
+
+
+def test_forgotten_ids_are_new_again():
+    seen = SeenCache()
+    seen.add('SM1')
+    seen.forget('SM1')
+    assert seen.add('SM1')
+
+
+def test_ids_are_remembered_across_restarts(tmpdir):
+    fn = str(tmpdir.join('seen'))
+    seen = SeenCache(size=3, fn=fn)
+    for sid in ['SM1', 'SM2', 'SM3']:
+        seen.add(sid)
+    seen.forget('SM2')
+
+    seen = SeenCache(size=3, fn=fn)
+    assert seen.seen.keys() == ['SM1', 'SM3']
+    assert not seen.add('SM1')
+    assert seen.add('SM2')
+
+
+def test_the_file_is_compacted(tmpdir):
+    fn = str(tmpdir.join('seen'))
+    seen = SeenCache(size=2, fn=fn)
+    for i in range(10):
+        seen.add('SM%d' % i)
+    assert len(open(fn).readlines()) <= 5
+    assert SeenCache(size=2, fn=fn).seen.keys() == ['SM8', 'SM9']
+
+
+def test_retried_texts_are_handled_once(client, sent):
+    duplicates = metrics.WEBHOOK_DUPLICATES.values.get((), 0)
+    text(client, '+15552220001', 'subscribe', sid='SM1')
+    text(client, '+15552220001', 'subscribe', sid='SM1')
+    text(client, '+15552220001', 'unsubscribe', sid='SM2')
+    text(client, '+15552220001', 'subscribe')
+    text(client, '+15552220001', 'subscribe')
+    assert metrics.WEBHOOK_DUPLICATES.values.get(()) == duplicates + 1
+
+    from twilio_secretary.secretary import SecretaryState
+    assert '+15552220001' in SecretaryState.SUBSCRIBERS
+
+
+def test_texts_that_fail_can_be_retried(client, sent, monkeypatch):
+    on_sms = TwilioSecretary.on_sms
+
+    def broken(self, from_number, body):
+        raise IOError('disk full')
+
+    monkeypatch.setattr(TwilioSecretary, 'on_sms', broken)
+    client.application.config['PROPAGATE_EXCEPTIONS'] = False
+    assert text(client, ADMIN, 'list', sid='SM1').status_code == 500
+
+    monkeypatch.setattr(TwilioSecretary, 'on_sms', on_sms)
+    assert text(client, ADMIN, 'list', sid='SM1').status_code == 200
+    assert not client.application.seen_messages.add('SM1')
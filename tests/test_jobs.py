@@ -0,0 +1,132 @@
+import json
+
+import pytest
+
+from conftest import ADMIN, text, wait_for
+from twilio_secretary.jobs import BroadcastJobs, message_id
+from twilio_secretary.secretary import TwilioSecretary
+from twilio_secretary.subscribers import SubscriberStore
+
+
+def test_broadcasts_need_the_status_token(settings, client, sent):
+    settings['STATUS_TOKEN'] = 'sekrit'
+    text(client, '+15552220001', 'subscribe')
+    text(client, ADMIN, 'update top secret')
+
+    assert client.get('/broadcasts/').status_code == 403
+    assert client.get('/broadcasts/?token=wrong').status_code == 403
+    response = client.get('/broadcasts/?token=sekrit')
+    assert response.status_code == 200
+    [job] = json.loads(response.data)['broadcasts']
+    assert job['body'] == 'Broadcast: top secret'
+
+    headers = {'Authorization': 'Bearer sekrit'}
+    assert client.get('/broadcasts/%s/' % job['id'], headers=headers).status_code == 200
+
+
+def test_broadcasts_are_hidden_without_a_token(client):
+    assert client.get('/broadcasts/').status_code == 403
+    assert client.get('/broadcasts/?token=').status_code == 403
+
+
+def test_progress_counts_sent_texts(settings, client, sent):
+    for i in range(3):
+        text(client, '+1555222000%d' % i, 'subscribe')
+    text(client, ADMIN, 'update hello')
+
+    jobs = TwilioSecretary.get_jobs()
+    wait_for(lambda: jobs.progress()['finished'] is not None)
+    progress = jobs.progress()
+    assert (progress['total'], progress['sent'], progress['failed']) == (3, 3, 0)
+
+
+class FakeOutbox(object):
+    # remembers what was put in it, and can stop working partway through like a crashing process
+
+    def __init__(self, crash_after=None, outstanding=()):
+        self.crash_after = crash_after
+        self.outstanding = set(outstanding)
+        self.puts = []
+
+    def put(self, to, body, job=None, first=0):
+        if len(self.puts) == self.crash_after:
+            raise IOError('crashed')
+        if not isinstance(to, list):
+            to = [to]
+        self.puts.append((to, first))
+        self.outstanding.update(message_id(job, first + i) for i in range(len(to)))
+
+    def message_ids(self):
+        return self.outstanding
+
+
+RECIPIENTS = ['+1555222000%d' % i for i in range(4)] + ['TWILIO']
+
+
+def crash_queueing(fn):
+    outbox = FakeOutbox(crash_after=2)
+    jobs = BroadcastJobs(outbox, fn, shard_size=2)
+    job = jobs.start(SubscriberStore(RECIPIENTS), 'hello')
+    with pytest.raises(IOError):
+        jobs.queue(job)
+    return outbox
+
+
+def resume(fn, outstanding):
+    resumed = FakeOutbox(outstanding=outstanding)
+    jobs = BroadcastJobs(resumed, fn, shard_size=2)
+    jobs.resume()
+    job, outstanding = jobs.waiting.popleft()
+    jobs.queue(job, outstanding)
+    return jobs, resumed
+
+
+def test_jobs_are_queued_by_the_thread(tmpdir):
+    fn = str(tmpdir.join('jobs'))
+    outbox = FakeOutbox()
+    jobs = BroadcastJobs(outbox, fn, shard_size=2)
+    job = jobs.start(SubscriberStore(RECIPIENTS), 'hello')
+    assert (job.total, job.cursor, outbox.puts) == (5, 0, [])
+    # the recipients aren't written out one by one
+    assert '+15552220001' not in open(fn).read()
+
+    jobs.start_thread()
+    wait_for(lambda: jobs.progress()['queued'] == 5)
+    assert outbox.puts == [(RECIPIENTS[:2], 0), (RECIPIENTS[2:4], 2), (['TWILIO'], 4)]
+
+
+def test_cut_off_jobs_resume_from_the_cursor(tmpdir):
+    fn = str(tmpdir.join('jobs'))
+    outbox = crash_queueing(fn)
+    assert outbox.puts == [(RECIPIENTS[:2], 0), (RECIPIENTS[2:4], 2)]
+
+    jobs, resumed = resume(fn, outbox.outstanding)
+    assert resumed.puts == [(RECIPIENTS[4:], 4)]
+    assert jobs.progress()['queued'] == 5
+
+
+def test_shards_queued_but_not_in_the_cursor_are_not_queued_twice(tmpdir):
+    fn = str(tmpdir.join('jobs'))
+    outbox = crash_queueing(fn)
+    # the second shard made it into the outbox, but the crash came before its cursor was written
+    lines = open(fn).readlines()
+    open(fn, 'w').write(''.join(lines[:-1]))
+
+    jobs, resumed = resume(fn, outbox.outstanding)
+    assert resumed.puts == [(RECIPIENTS[4:], 4)]
+
+
+def test_statuses_are_replayed(tmpdir):
+    fn = str(tmpdir.join('jobs'))
+    jobs = BroadcastJobs(FakeOutbox(), fn, shard_size=2)
+    job = jobs.start(SubscriberStore(RECIPIENTS), 'hello')
+    jobs.queue(job)
+    messages = [{'job': job.id, 'index': i, 'to': number} for (i, number) in enumerate(RECIPIENTS)]
+    assert jobs.record([(message, None) for message in messages[:3]]) == []
+    assert jobs.record([(messages[3], None), (messages[4], IOError('no'))]) == [job]
+
+    progress = BroadcastJobs(FakeOutbox(), fn).progress(job.id)
+    assert (progress['sent'], progress['failed'], progress['queued']) == (4, 1, 5)
+    assert progress['finished'] is not None
+    # written as finished, so its recipients aren't kept
+    assert not tmpdir.join('jobs.' + job.id).exists()
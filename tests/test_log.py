@@ -0,0 +1,58 @@
+import json
+
+from conftest import EMPTY_DOC
+from twilio_secretary.backends import JsonFileBackend
+from twilio_secretary.secretary import SecretaryState
+
+
+def test_log_replays_after_the_snapshot(tmpdir):
+    fn = str(tmpdir.join('state.json'))
+    backend = JsonFileBackend(fn, fsync=False)
+    backend.load()
+    backend.append([['subscribe', '+15552220001'], ['subscribe', '+15552220002']])
+    backend.compact(dict(EMPTY_DOC, subscribers=['+15552220001', '+15552220002']))
+    backend.append([['unsubscribe', '+15552220001']])
+
+    doc, records = JsonFileBackend(fn, fsync=False).load()
+    assert doc['subscribers'] == ['+15552220001', '+15552220002']
+    assert records == [['unsubscribe', '+15552220001']]
+
+
+def test_records_in_the_snapshot_are_not_applied_twice(tmpdir):
+    fn = str(tmpdir.join('state.json'))
+    backend = JsonFileBackend(fn, fsync=False)
+    backend.load()
+    backend.append([['subscribe', '+15552220001']])
+    # a crash after the snapshot was written but before the log was emptied
+    log = open(fn + '.log').read()
+    backend.compact(dict(EMPTY_DOC, subscribers=['+15552220001']))
+    open(fn + '.log', 'w').write(log)
+
+    doc, records = JsonFileBackend(fn, fsync=False).load()
+    assert records == []
+
+
+def test_torn_write_at_the_end_is_skipped(tmpdir):
+    fn = str(tmpdir.join('state.json'))
+    backend = JsonFileBackend(fn, fsync=False)
+    backend.load()
+    backend.append([['subscribe', '+15552220001']])
+    open(fn + '.log', 'a').write(json.dumps([2, 'subscribe', '+15552220002'])[:-3])
+
+    doc, records = JsonFileBackend(fn, fsync=False).load()
+    assert doc is None
+    assert records == [['subscribe', '+15552220001']]
+
+
+def test_state_compacts_every_so_often(settings):
+    settings['COMPACT_EVERY'] = 5
+    SecretaryState.from_disk()
+    for i in range(12):
+        SecretaryState.add_subscriber('+1555222%04d' % i)
+        SecretaryState.save()
+    here = SecretaryState.to_doc()
+
+    assert len(open(settings['STORE_JSON'] + '.log').readlines()) < 5
+    SecretaryState.from_doc(EMPTY_DOC)
+    SecretaryState.from_disk()
+    assert SecretaryState.to_doc() == here
@@ -0,0 +1,44 @@
+from twilio_secretary import metrics
+
+
+def test_counter():
+    counter = metrics.Counter('things_total', 'Things', labels=('kind',))
+    counter.inc('a')
+    counter.inc('a', amount=2)
+    counter.inc('b"')
+    assert counter.render() == ['# HELP things_total Things', '# TYPE things_total counter',
+                                'things_total{kind="a"} 3', 'things_total{kind="b\\""} 1']
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram('took_seconds', 'Took', buckets=(0.1, 1.0))
+    for seconds in [0.05, 0.1, 0.5, 2.0]:
+        histogram.observe(seconds)
+    assert histogram.render()[2:] == ['took_seconds_bucket{le="0.1"} 2', 'took_seconds_bucket{le="1.0"} 3',
+                                      'took_seconds_bucket{le="+Inf"} 4', 'took_seconds_sum 2.65',
+                                      'took_seconds_count 4']
+
+
+def test_timer():
+    histogram = metrics.Histogram('took_seconds', 'Took', labels=('what',))
+
+    @histogram.time('f')
+    def f():
+        return 1
+
+    assert f() == 1
+    with histogram.time('g'):
+        pass
+    assert sorted(histogram.values) == [('f',), ('g',)]
+
+
+def test_metrics_page(client):
+    client.post('/inbound-call/')
+    client.post('/inbound-sms/', data={'AccountSid': 'ACtest', 'From': '+15552220001', 'Body': 'subscribe'})
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'text/plain; version=0.0.4'
+    lines = response.data.split('\n')
+    assert 'secretary_subscribers 1' in lines
+    assert any(line.startswith('secretary_webhook_seconds_count{endpoint="inbound_call"}') for line in lines)
+    assert any(line.startswith('secretary_command_seconds_count{command="subscribe"}') for line in lines)
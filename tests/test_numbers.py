@@ -0,0 +1,32 @@
+from twilio_api import numbers
+from twilio_secretary.secretary import SecretaryState
+
+
+def test_normalize_all():
+    assert numbers.normalize_all(['+13125550001', '(312) 555-0002', '1 312 555 0003', '44 20 7946 0004',
+                                  'TWILIO', '555-0005', '']) == [
+        '+13125550001', '+13125550002', '+13125550003', '+442079460004', None, None, None]
+    # a newline in one can't be told apart from two numbers
+    assert numbers.normalize_all(['312555\n0001', '3125550002']) == [None, '+13125550002']
+
+
+def test_keys_keep_what_isnt_a_number():
+    assert numbers.keys([u'3125550001', 'TWILIO', '12345']) == ['+13125550001', 'TWILIO', '12345']
+    assert numbers.key(u'(312) 555-0001') == '+13125550001'
+    assert type(numbers.key(u'+13125550001')) is str
+
+
+def test_ints():
+    assert numbers.to_int('+13125550001') == 13125550001
+    assert numbers.from_int(13125550001) == '+13125550001'
+    assert numbers.to_ints(['+13125550001', '+442079460004']) == [13125550001, 442079460004]
+    assert numbers.to_ints([]) == []
+
+
+def test_old_records_are_replayed_in_e164(settings):
+    SecretaryState.apply(['subscribe', u'(312) 555-0001'])
+    SecretaryState.apply(['name', u'312.555.0001', u'Alice'])
+    assert list(SecretaryState.SUBSCRIBERS) == ['+13125550001']
+    assert SecretaryState.NUMBER_MAP.name_of('+13125550001') == 'Alice'
+    SecretaryState.apply(['unsubscribe', u'3125550001'])
+    assert len(SecretaryState.SUBSCRIBERS) == 0
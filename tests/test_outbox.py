@@ -0,0 +1,97 @@
+from twilio_api import TwilioHttpError
+from twilio_secretary.outbox import Outbox
+
+
+def make_outbox(tmpdir, deliver, **kwargs):
+    kwargs.setdefault('backoff', 0.01)
+    return Outbox(deliver, str(tmpdir.join('outbox')), fsync=False, **kwargs)
+
+
+def test_same_text_twice_is_sent_twice(tmpdir):
+    sent = []
+    finished = []
+    outbox = make_outbox(tmpdir, lambda to, text: sent.append((to, text)), on_done=finished.extend)
+    outbox.put('+15552220001', 'OK!')
+    outbox.put('+15552220001', 'OK!')
+    outbox.put('+15552220002', 'OK!')
+    outbox.dispatch(outbox.take_batch())
+
+    assert sorted(sent) == [('+15552220001', 'OK!'), ('+15552220001', 'OK!'), ('+15552220002', 'OK!')]
+    assert len(set(message['id'] for (message, error) in finished)) == 3
+    assert outbox.depth() == 0
+
+
+def test_bulk_sends_each_number_once_per_call(tmpdir):
+    calls = []
+
+    def bulk(numbers, text):
+        calls.append(sorted(numbers))
+        return [(number, None) for number in numbers]
+
+    outbox = make_outbox(tmpdir, None, bulk=bulk)
+    outbox.put(['+15552220001', '+15552220002', '+15552220001', '+15552220002'], 'hello')
+    outbox.dispatch(outbox.take_batch())
+    assert calls == [['+15552220001', '+15552220002'], ['+15552220001', '+15552220002']]
+
+
+def test_transient_failures_are_retried(tmpdir):
+    attempts = []
+
+    def deliver(to, text):
+        attempts.append(to)
+        if len(attempts) < 3:
+            raise TwilioHttpError(503, 'try again')
+
+    finished = []
+    outbox = make_outbox(tmpdir, deliver, on_done=finished.extend)
+    outbox.put('+15552220001', 'hello')
+    while not finished:
+        outbox.dispatch(outbox.take_batch())
+    assert len(attempts) == 3
+    assert finished[0][1] is None
+
+
+def test_bad_messages_are_given_up_on(tmpdir):
+    def deliver(to, text):
+        raise TwilioHttpError(400, 'not a mobile number')
+
+    finished = []
+    outbox = make_outbox(tmpdir, deliver, on_done=finished.extend)
+    outbox.put('+15552220001', 'hello')
+    outbox.dispatch(outbox.take_batch())
+    assert finished[0][1].status == 400
+    assert outbox.depth() == 0
+
+
+def test_unsent_texts_are_replayed(tmpdir):
+    outbox = make_outbox(tmpdir, None)
+    outbox.put(['+15552220001', '+15552220002'], 'hello')
+    outbox.put('+15552220003', 'bye')
+    # the process goes away before sending anything
+    outbox.lock_fh.close()
+
+    sent = []
+    replayed = make_outbox(tmpdir, lambda to, text: sent.append((to, text)))
+    assert replayed.journal_fn == outbox.journal_fn
+    assert replayed.depth() == 3
+    replayed.dispatch(replayed.take_batch())
+    assert sorted(sent) == [('+15552220001', 'hello'), ('+15552220002', 'hello'), ('+15552220003', 'bye')]
+
+    replayed.lock_fh.close()
+    assert make_outbox(tmpdir, None).depth() == 0
+
+
+def test_replies_go_ahead_of_broadcasts(tmpdir):
+    outbox = make_outbox(tmpdir, None, rate=5)
+    outbox.put(['+1555222%04d' % i for i in range(20)], 'Broadcast: hello', job='abc')
+    outbox.put('+15551110000', 'Broadcast abc: 0 of 20 sent')
+
+    assert [message['body'] for message in outbox.take_batch()] == ['Broadcast abc: 0 of 20 sent']
+    # rate limited to 5 a second, so broadcast texts go 5 at a time
+    batch = outbox.take_batch()
+    assert [message['index'] for message in batch] == range(5)
+    assert outbox.depth() == 15
+
+    outbox.put('+15551110000', 'Broadcast abc: 5 of 20 sent')
+    assert [message['to'] for message in outbox.take_batch()] == ['+15551110000']
+    assert outbox.message_ids() == set('abc-%d' % i for i in range(5, 20))
@@ -0,0 +1,71 @@
+import pytest
+
+from conftest import ADMIN, text, wait_for
+from twilio_secretary.polls import Poll, MAX_ANSWERS
+from twilio_secretary.secretary import SecretaryState
+
+
+def test_archive_keeps_voters_that_are_not_e164():
+    poll = Poll('Lunch?', ['yes', 'no'], opened=1)
+    poll.answer('+15552220001', 0)
+    poll.answer('TWILIO', 1)
+    poll.answer('12345', 0)
+    poll.close(2)
+
+    archived = Poll.from_archive(poll.to_archive())
+    assert archived.responses == {'+15552220001': 0, 'TWILIO': 1, '12345': 0}
+    assert archived.counts == [2, 1]
+
+
+def test_polls_have_at_most_a_byte_of_answers():
+    Poll('Pick one', [str(i) for i in range(MAX_ANSWERS)])
+    with pytest.raises(ValueError):
+        Poll('Pick one', [str(i) for i in range(MAX_ANSWERS + 1)])
+
+
+def test_poll_with_too_many_answers_is_refused(client, sent):
+    text(client, ADMIN, 'poll Pick one? %s' % '/'.join(str(i) for i in range(MAX_ANSWERS + 1)))
+    wait_for(lambda: sent)
+    assert sent == [(ADMIN, 'A poll can have at most %d answers.' % MAX_ANSWERS)]
+    assert SecretaryState.POLLS == []
+
+
+def test_poll_stays_pending_until_archived(settings, monkeypatch):
+    SecretaryState.from_disk()
+    SecretaryState.add_poll('Lunch?', ['yes', 'no'])
+    SecretaryState.answer_poll('TWILIO', 1)
+    SecretaryState.close_poll()
+
+    archive_polls = SecretaryState.STORE.archive_polls
+
+    def full_disk(polls):
+        raise IOError('disk full')
+
+    monkeypatch.setattr(SecretaryState.STORE, 'archive_polls', full_disk)
+    with pytest.raises(IOError):
+        SecretaryState.save()
+    assert len(SecretaryState.POLL_ARCHIVE_PENDING) == 1
+
+    monkeypatch.setattr(SecretaryState.STORE, 'archive_polls', archive_polls)
+    SecretaryState.save()
+    assert SecretaryState.POLL_ARCHIVE_PENDING == []
+    assert SecretaryState.archived_poll_tallies(1, detailed=True)[3] == [set(['TWILIO']), set()]
+
+
+def test_tallies_follow_changed_answers():
+    poll = Poll('Lunch?', ['yes', 'no', 'maybe'], responses={'+15552220001': 0, '+15552220002': 0})
+    assert poll.counts == [2, 0, 0]
+    poll.answer('+15552220001', 2)
+    poll.answer('+15552220002', 0)
+    assert poll.counts == [1, 0, 1]
+    assert poll.respondents == [set(['+15552220002']), set(), set(['+15552220001'])]
+    assert Poll.from_doc(poll.to_doc()).counts == poll.counts
+
+
+def test_responses_command(client, sent):
+    text(client, ADMIN, 'poll Lunch? yes/no')
+    for (number, answer) in [('+15552220001', '1'), ('+15552220002', '2'), ('+15552220003', '1')]:
+        text(client, number, answer)
+    text(client, '+15552220003', '2')
+    text(client, ADMIN, 'responses')
+    wait_for(lambda: (ADMIN, 'Lunch?\n1: yes: 1 responses\n2: no: 2 responses') in sent)
@@ -0,0 +1,86 @@
+import time
+import socket
+import struct
+import threading
+
+import pytest
+
+from twilio_api.pool import ConnectionPool
+
+OK = 'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok'
+
+
+class Server(object):
+    """
+    An HTTP server that answers the nth request it reads with respond(n, conn), which returns whether to
+    keep the connection open.
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        thread = threading.Thread(target=self.accept)
+        thread.daemon = True
+        thread.start()
+
+    def accept(self):
+        while True:
+            conn = self.sock.accept()[0]
+            thread = threading.Thread(target=self.serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def serve(self, conn):
+        fh = conn.makefile('rb')
+        while True:
+            length = 0
+            line = fh.readline()
+            if not line:
+                conn.close()
+                return
+            while line.strip():
+                if line.lower().startswith('content-length:'):
+                    length = int(line.split(':')[1])
+                line = fh.readline()
+            self.requests.append(fh.read(length))
+            if not self.respond(len(self.requests), conn):
+                conn.close()
+                return
+
+    def pool(self):
+        return ConnectionPool('http://127.0.0.1:%d' % self.sock.getsockname()[1])
+
+
+def test_idle_connection_closed_by_the_server_is_retried():
+    def respond(n, conn):
+        conn.sendall(OK)
+        # without saying so
+        return False
+
+    server = Server(respond)
+    pool = server.pool()
+    assert pool.request('POST', '/', 'one') == (200, 'ok')
+    time.sleep(0.05)
+    assert pool.request('POST', '/', 'two') == (200, 'ok')
+    assert server.requests == ['one', 'two']
+
+
+def test_connection_reset_after_the_request_is_not_retried():
+    def respond(n, conn):
+        if n == 1:
+            conn.sendall(OK)
+            return True
+        # got it, then went away: a reset, not a clean close
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        return False
+
+    server = Server(respond)
+    pool = server.pool()
+    assert pool.request('POST', '/', 'one') == (200, 'ok')
+    with pytest.raises(socket.error):
+        pool.request('POST', '/', 'two')
+    time.sleep(0.05)
+    assert server.requests == ['one', 'two']
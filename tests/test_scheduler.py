@@ -0,0 +1,91 @@
+import time
+import threading
+
+import pytest
+
+from conftest import ADMIN, text, wait_for
+from twilio_secretary.backends import get_backend
+from twilio_secretary.datediff import Bad, duration2sec, hm2sec
+from twilio_secretary.scheduler import Scheduler
+from twilio_secretary.secretary import SecretaryState, TwilioSecretary
+
+
+def test_scheduler_fires_in_time_order():
+    fired = []
+    done = threading.Event()
+
+    def fire(key):
+        fired.append(key)
+        if len(fired) == 3:
+            done.set()
+
+    scheduler = Scheduler(fire)
+    scheduler.start()
+    now = time.time()
+    scheduler.add(now + 0.06, 'c')
+    scheduler.add(now + 0.02, 'a')
+    scheduler.add(now + 0.04, 'b')
+    assert done.wait(2)
+    assert fired == ['a', 'b', 'c']
+
+
+def test_scheduled_update_is_sent(settings, sent):
+    SecretaryState.from_disk()
+    SecretaryState.add_subscriber('+15552220001')
+    job_id = SecretaryState.schedule(time.time() + 3600, 'update', 'later on', ADMIN)
+
+    TwilioSecretary.run_scheduled(job_id)
+    wait_for(lambda: ('+15552220001', 'Broadcast: later on') in sent)
+    assert SecretaryState.scheduled() == []
+
+
+def test_scheduled_command_runs_in_one_process_only(settings, sent):
+    settings['STATE_BACKEND'] = 'sqlite'
+    SecretaryState.from_disk()
+    SecretaryState.add_subscriber('+15552220001')
+    job_id = SecretaryState.schedule(time.time() + 3600, 'update', 'later on', ADMIN)
+    SecretaryState.save()
+
+    # another worker on the same database fires it first
+    other = get_backend(settings)
+    assert other.claim('unschedule %s' % job_id)
+    assert not other.claim('unschedule %s' % job_id)
+
+    TwilioSecretary.run_scheduled(job_id)
+    time.sleep(0.05)
+    assert sent == []
+
+
+def test_cancelling_claims_the_command_too(settings):
+    settings['STATE_BACKEND'] = 'sqlite'
+    SecretaryState.from_disk()
+    job_id = SecretaryState.schedule(time.time() + 3600, 'update', 'later on', ADMIN)
+
+    assert SecretaryState.unschedule(job_id)[1:3] == ['update', 'later on']
+    assert SecretaryState.unschedule(job_id) is None
+
+
+def test_durations_and_times_of_day():
+    assert [duration2sec(s) for s in ['30m', '90min', '2h', '1h30m', '2hrs', '1:30']] == [
+        1800, 5400, 7200, 5400, 7200, 5400]
+    assert hm2sec('18:00') == 18 * 3600
+    for s in ['30', '2', 'h', 'm', '', '1:3', '1:75', 'soon']:
+        with pytest.raises(Bad):
+            duration2sec(s)
+    for s in ['18', '6pm', '1800']:
+        with pytest.raises(Bad):
+            hm2sec(s)
+
+
+def test_only_unmistakable_times_schedule(client, sent):
+    text(client, '+15552220001', 'subscribe')
+    for body in ['in 30m hello', 'at 18:00 dinner', 'IN 1:30 later']:
+        text(client, ADMIN, 'update ' + body)
+    assert sorted(job[2] for (job_id, job) in SecretaryState.scheduled()) == ['dinner', 'hello', 'later']
+    wait_for(lambda: any(body.startswith('Scheduled UPDATE') and '"hello"' in body for (to, body) in sent))
+
+    for body in ['In 2 hours the road reopens', 'at 5 pm the party starts', 'at 5:00 pm sharp', 'in 30 seconds',
+                 'at the park now', 'in 10 days']:
+        text(client, ADMIN, 'update ' + body)
+        wait_for(lambda: ('+15552220001', 'Broadcast: ' + body) in sent)
+    assert len(SecretaryState.scheduled()) == 3
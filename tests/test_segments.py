@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from conftest import ADMIN, text, wait_for
+from twilio_secretary import segments
+
+
+def test_encoding():
+    assert segments.encoding(u'Hello [world] €5') == segments.GSM7_ENCODING
+    assert segments.encoding('caf\xc3\xa9') == segments.GSM7_ENCODING
+    assert segments.encoding(u'caf\xea') == segments.UCS2_ENCODING
+    assert segments.encoding(u'日本') == segments.UCS2_ENCODING
+
+
+def test_gsm7_segments():
+    assert segments.segment_count(u'a' * 160) == 1
+    assert segments.segment_count(u'a' * 161) == 2
+    assert segments.segment_count(u'a' * 306) == 2
+    assert segments.segment_count(u'a' * 307) == 3
+    # the extension characters take two septets each, and aren't split between segments
+    assert segments.segment_count(u'{' * 80) == 1
+    assert segments.segment_count(u'{' * 81) == 2
+    assert segments.segment_count(u'a' + u'{' * 80) == 2
+    assert segments.segment_count(u'a' * 152 + u'{' + u'a' * 8) == 2
+    assert segments.segment_count(u'a' * 152 + u'{' + u'a' * 152) == 3
+
+
+def test_ucs2_segments():
+    assert segments.segment_count(u'日' * 70) == 1
+    assert segments.segment_count(u'日' * 71) == 2
+    assert segments.segment_count(u'日' * 134) == 2
+    assert segments.segment_count(u'日' * 135) == 3
+    # a character outside the BMP is a surrogate pair, and isn't split between segments
+    assert segments.segment_count(u'\U0001f600' * 35) == 1
+    assert segments.segment_count(u'日' * 2 + u'\U0001f600' * 34) == 1
+    assert segments.segment_count(u'日' * 3 + u'\U0001f600' * 34) == 2
+    assert segments.segment_count(u'日' * 66 + u'\U0001f600' + u'日' * 3) == 2
+    assert segments.segment_count(u'日' * 66 + u'\U0001f600' * 34) == 3
+
+
+def test_pack_keeps_ucs2_apart():
+    items = [u'a' * 70, u'日本', u'b' * 75, u'c' * 100]
+    assert segments.pack(items, u', ') == [u'a' * 70 + u', ' + u'b' * 75, u'c' * 100, u'日本']
+    assert segments.pack([u'a' * 200, u'b'], u'\n') == [u'a' * 200, u'b']
+
+
+def test_fewest_segments():
+    items = [u'a' * 70, u'b' * 75, u'日本']
+    assert segments.fewest_segments(items, u', ') == [u'a' * 70 + u', ' + u'b' * 75, u'日本']
+    # a tie goes to one text
+    items = [u'a' * 100, u'b' * 100]
+    assert segments.fewest_segments(items, u', ') == [u'a' * 100 + u', ' + u'b' * 100]
+
+
+def test_broadcasts_say_how_many_segments(client, sent):
+    for number in ['+15552220001', '+15552220002']:
+        text(client, number, 'subscribe')
+    text(client, ADMIN, 'update ' + 'a' * 200)
+    wait_for(lambda: any(to == ADMIN and body.startswith('Queued for 2 subscribers, 2 segments each (4 in all).')
+                         for (to, body) in sent))
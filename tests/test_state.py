@@ -0,0 +1,67 @@
+import threading
+
+from conftest import EMPTY_DOC
+from twilio_secretary.secretary import SecretaryState
+
+
+def saved_doc():
+    doc = SecretaryState.to_doc()
+    doc['number_map'].sort()
+    return doc
+
+
+def run_threads(target, count):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_changes_from_many_threads_are_all_saved(settings):
+    settings['COMPACT_EVERY'] = 50
+    SecretaryState.from_disk()
+    SecretaryState.add_poll('Lunch?', ['yes', 'no'])
+
+    def work(i):
+        for j in range(20):
+            number = '+1555%03d%04d' % (i, j)
+            SecretaryState.add_subscriber(number)
+            SecretaryState.answer_poll(number, 1 + j % 2)
+            SecretaryState.get_number_name(number)
+            if j % 5 == 0:
+                SecretaryState.save()
+            if j % 3 == 0:
+                SecretaryState.remove_subscriber(number)
+
+    run_threads(work, 8)
+    SecretaryState.save()
+    here = saved_doc()
+    assert len(SecretaryState.SUBSCRIBERS) == 8 * 13
+    assert sum(SecretaryState.POLLS[-1].counts) == 8 * 20
+
+    SecretaryState.from_doc(EMPTY_DOC)
+    SecretaryState.from_disk()
+    assert saved_doc() == here
+
+
+def test_reads_while_changing(settings):
+    SecretaryState.from_disk()
+    stop = threading.Event()
+    counts = [[], []]
+
+    def read(i):
+        while not stop.is_set():
+            counts[i].append(len(SecretaryState.subscribers().to_list()))
+
+    readers = [threading.Thread(target=read, args=(i,)) for i in range(2)]
+    for reader in readers:
+        reader.start()
+    for i in range(200):
+        SecretaryState.add_subscriber('+1555222%04d' % i)
+    stop.set()
+    for reader in readers:
+        reader.join()
+    # subscribers only came, never went
+    assert all(seen == sorted(seen) for seen in counts)
+    assert len(SecretaryState.SUBSCRIBERS) == 200
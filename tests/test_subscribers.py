@@ -0,0 +1,55 @@
+from twilio_secretary.subscribers import SubscriberStore, from_bytes, to_bytes
+
+NUMBERS = ['+13125550003', '+13125550001', '+442079460004', '+13125550002']
+
+
+def test_membership():
+    store = SubscriberStore(NUMBERS + ['TWILIO'])
+    assert len(store) == 5
+    assert '+13125550001' in store
+    assert 'TWILIO' in store
+    assert '+13125550009' not in store
+    assert '13125550001' not in store
+    assert store.to_list() == sorted(NUMBERS) + ['TWILIO']
+
+
+def test_add_and_discard():
+    store = SubscriberStore()
+    for number in NUMBERS + NUMBERS:
+        store.add(number)
+    store.add('12345')
+    assert len(store) == 5
+    store.discard('+13125550001')
+    store.discard('+13125550001')
+    store.discard('12345')
+    assert store.to_list() == ['+13125550002', '+13125550003', '+442079460004']
+
+
+def test_snapshots_dont_change():
+    store = SubscriberStore(NUMBERS)
+    snapshot = store.snapshot()
+    store.add('+13125550009')
+    store.discard('+13125550001')
+    assert snapshot.to_list() == sorted(NUMBERS)
+
+
+def test_shards():
+    store = SubscriberStore(NUMBERS + ['TWILIO'])
+    assert list(store.shards(3)) == [sorted(NUMBERS)[:3], sorted(NUMBERS)[3:], ['TWILIO']]
+
+
+def test_add_all():
+    store = SubscriberStore(NUMBERS[:2])
+    store.add_all(NUMBERS[1:] + ['TWILIO'])
+    assert store.to_list() == sorted(NUMBERS) + ['TWILIO']
+
+
+def test_packed_round_trip():
+    store = SubscriberStore(NUMBERS + ['TWILIO'])
+    others, packed = store.to_doc()
+    assert others == ['TWILIO']
+    loaded = SubscriberStore.load(others, packed)
+    assert loaded.to_list() == store.to_list()
+    # a list from an older snapshot and a packed array together
+    assert SubscriberStore.load(['+15552220001'], packed).to_list() == sorted(NUMBERS + ['+15552220001'])
+    assert list(from_bytes(to_bytes(store.packed))) == list(store.packed)
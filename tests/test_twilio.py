@@ -0,0 +1,52 @@
+import pytest
+
+from conftest import ADMIN, start_worker, text, wait_for
+from twilio_api import Twilio, TwilioHttpError
+from twilio_api.fake import FakeTwilio
+
+NUMBERS = ['+1555222000%d' % i for i in range(5)]
+
+
+@pytest.fixture
+def fake():
+    server = FakeTwilio().start()
+    yield server
+    server.shutdown()
+    Twilio.close_pools()
+
+
+def twilio(fake, **settings):
+    return Twilio(dict({'SID': 'ACtest', 'TOKEN': 'token', 'PHONE_NUMBER': '+15550000000', 'API_BASE': fake.base,
+                        'NOTIFY_BASE': fake.base}, **settings))
+
+
+def test_bulk_sends_a_request_per_batch(fake):
+    client = twilio(fake, NOTIFY_SERVICE_SID='IStest', BULK_BATCH_SIZE=2)
+    results = client.bulk_send_sms(NUMBERS, u'hello')
+    assert results == [(number, None) for number in NUMBERS]
+    assert sorted(to for (to, body, sid) in fake.messages) == NUMBERS
+    assert len(set(sid for (to, body, sid) in fake.messages)) == 3
+
+
+def test_bulk_without_notify_sends_one_at_a_time(fake):
+    results = twilio(fake).bulk_send_sms(NUMBERS[:2], u'hello')
+    assert results == [(NUMBERS[0], None), (NUMBERS[1], None)]
+    assert [sid[:2] for (to, body, sid) in fake.messages] == ['SM', 'SM']
+
+
+def test_a_failed_batch_fails_every_number_in_it(fake):
+    fake.error_rate = 1.0
+    results = twilio(fake, NOTIFY_SERVICE_SID='IStest').bulk_send_sms(NUMBERS[:2], u'hello')
+    assert [number for (number, error) in results] == NUMBERS[:2]
+    assert all(isinstance(error, TwilioHttpError) and error.status == 500 for (number, error) in results)
+
+
+def test_broadcasts_go_through_notify(settings, fake, monkeypatch):
+    settings.update(API_BASE=fake.base, NOTIFY_BASE=fake.base, NOTIFY_SERVICE_SID='IStest')
+    client = start_worker(monkeypatch).test_client()
+    for number in NUMBERS:
+        text(client, number, 'subscribe')
+    text(client, ADMIN, 'update hello')
+
+    wait_for(lambda: len([sid for (to, body, sid) in fake.messages if body == 'Broadcast: hello']) == 5)
+    assert all(sid.startswith('NT') for (to, body, sid) in fake.messages if body == 'Broadcast: hello')
@@ -0,0 +1,55 @@
+from conftest import EMPTY_DOC, start_worker
+from twilio_secretary.secretary import SecretaryState
+
+
+def add_updates(count):
+    for i in range(count):
+        SecretaryState.change('add_update', 1000.0 + i, 'update %d' % i)
+
+
+def test_only_the_latest_updates_stay_in_memory(settings):
+    settings['UPDATES_RETAIN'] = 3
+    SecretaryState.from_disk()
+    add_updates(10)
+    assert [text for (ts, text) in SecretaryState.UPDATES] == ['update 7', 'update 8', 'update 9']
+    assert len(SecretaryState.ARCHIVE_PENDING) == 7
+
+    SecretaryState.save()
+    assert SecretaryState.ARCHIVE_PENDING == []
+    assert [text for (ts, text) in SecretaryState.recent_updates(2)] == ['update 9', 'update 8']
+
+
+def test_older_updates_come_from_the_archive(settings):
+    settings['UPDATES_RETAIN'] = 3
+    SecretaryState.from_disk()
+    add_updates(10)
+    SecretaryState.save()
+
+    assert [text for (ts, text) in SecretaryState.updates_before(1008.0, count=4)] == [
+        'update 7', 'update 6', 'update 5', 'update 4']
+    assert SecretaryState.updates_before(1000.0) == []
+
+    # and after a restart
+    SecretaryState.from_doc(EMPTY_DOC)
+    SecretaryState.from_disk()
+    assert [text for (ts, text) in SecretaryState.updates_before(1003.0, count=5)] == [
+        'update 2', 'update 1', 'update 0']
+
+
+def test_archiving_twice_keeps_one_copy(settings):
+    SecretaryState.from_disk()
+    SecretaryState.STORE.archive_updates([(1.0, 'a'), (2.0, 'b')])
+    SecretaryState.STORE.archive_updates([(2.0, 'b'), (3.0, 'c')])
+    assert SecretaryState.STORE.archived_updates(10.0, 10) == [(3.0, 'c'), (2.0, 'b'), (1.0, 'a')]
+
+
+def test_updates_page_goes_back_through_the_archive(settings, sent, monkeypatch):
+    settings['UPDATES_RETAIN'] = 3
+    client = start_worker(monkeypatch).test_client()
+    # once the state is loaded
+    client.get('/updates/')
+    add_updates(10)
+    SecretaryState.save()
+    response = client.get('/updates/?before=1006.0')
+    assert response.status_code == 200
+    assert 'update 5' in response.data and 'update 1' in response.data and 'update 0' not in response.data
@@ -0,0 +1,94 @@
+import os
+import time
+
+from conftest import ADMIN, EMPTY_DOC, start_worker, text, wait_for
+from twilio_secretary.backends import get_backend
+from twilio_secretary.outbox import Outbox
+from twilio_secretary.secretary import SecretaryState, TwilioSecretary
+
+
+def test_state_loads_without_a_request(settings, sent, client):
+    from twilio_secretary import web
+    wait_for(lambda: web.STATE_LOADED)
+    assert SecretaryState.SCHEDULER is not None
+
+
+def test_due_commands_run_without_a_request(settings, sent, monkeypatch):
+    SecretaryState.from_disk()
+    SecretaryState.add_subscriber('+15552220001')
+    SecretaryState.schedule(time.time() - 60, 'update', 'while you were out', ADMIN)
+    SecretaryState.save()
+    SecretaryState.from_doc(EMPTY_DOC)
+
+    # a restart, with nobody texting in
+    start_worker(monkeypatch)
+    wait_for(lambda: ('+15552220001', 'Broadcast: while you were out') in sent)
+
+
+def test_unsent_texts_go_out_without_a_request(settings, sent, monkeypatch):
+    outbox = Outbox(None, settings['STORE_JSON'] + '.outbox', fsync=False)
+    outbox.put('+15552220001', 'sorry for the wait')
+    outbox.lock_fh.close()
+
+    start_worker(monkeypatch)
+    wait_for(lambda: ('+15552220001', 'sorry for the wait') in sent)
+
+
+def test_apps_share_the_seen_cache(settings, sent, monkeypatch):
+    settings['WEBHOOK_DEDUPE_PERSIST'] = True
+    app = start_worker(monkeypatch)
+    from twilio_secretary import web
+    assert web.create_app().seen_messages is app.seen_messages
+    text(app.test_client(), '+15552220001', 'help', sid='SM1')
+    assert not app.seen_messages.add('SM1')
+
+
+def in_child(run):
+    # runs run() in a forked process, like a pre-forking server's worker; returns whether it returned True
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os._exit(0 if run() else 1)
+        except:
+            import traceback
+            traceback.print_exc()
+            os._exit(2)
+    return os.waitpid(pid, 0)[1] == 0
+
+
+def test_workers_forked_after_the_import_start_their_own(settings, sent, monkeypatch):
+    settings['FLUSH_DEBOUNCE'] = 0.01
+    from twilio_secretary import web
+    start_worker(monkeypatch)
+    web.STATE_LOADER.join()
+    # what a server that imports the app before forking has
+    app = web.create_app(background=False)
+
+    def worker():
+        text(app.test_client(), '+15552220001', 'subscribe')
+        flusher = SecretaryState.FLUSHER
+        wait_for(lambda: not SecretaryState.DIRTY)
+        flusher.flush()
+        # the reply goes out through this process's outbox, not the one that didn't come along
+        wait_for(lambda: [to for (to, body) in sent] == ['+15552220001'])
+        return flusher.thread.is_alive()
+
+    # the state, outbox and flusher were started here, then this forked
+    SecretaryState.STORE.unlock_state()
+    assert in_child(worker)
+    doc, records = get_backend(settings).load()
+    assert records == [['subscribe', '+15552220001']]
+
+
+def test_nothing_starts_until_needed(settings, monkeypatch):
+    from twilio_secretary import web
+    for (name, value) in [('STATE_LOADED', False), ('STATE_LOADER', None), ('BACKGROUND_PID', None)]:
+        monkeypatch.setattr(web, name, value)
+    web.create_app(background=False)
+    assert web.BACKGROUND_PID is None
+    assert TwilioSecretary.OUTBOX is None and SecretaryState.FLUSHER is None
+
+    web.post_fork(None, None)
+    assert web.BACKGROUND_PID == os.getpid()
+    assert TwilioSecretary.OUTBOX is not None
+    web.STATE_LOADER.join()
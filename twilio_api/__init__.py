@@ -1,29 +1,131 @@
-from twilio.rest import TwilioRestClient
 import json
+import time
+import base64
+import urllib
+import atexit
+import threading
+
+from . import numbers
+from .pool import ConnectionPool
+
+
+class TwilioHttpError(Exception):
+
+    def __init__(self, status, body):
+        Exception.__init__(self, 'HTTP %d: %s' % (status, body))
+        self.status = status
+        self.body = body
 
 
 class Twilio(object):
+    # keep-alive connections for each API host, shared by every Twilio in the process
+    POOLS = {}
+    POOLS_LOCK = threading.Lock()
+    # when set, observe(api, status, seconds) is called after every request. status is None if there
+    # wasn't one (the connection failed or timed out).
+    OBSERVE = None
 
     def process_number(self, num):
-        num = str(num)
-        num = num.replace('-', '').replace(' ', '').replace('(', '').replace(')', '').replace('+', '')
-        if len(num) == 10:
-            # behold my amero-centrism
-            num = '1' + num
-        return '+' + num
-
-    def __init__(self, settings):
+        return numbers.key(num)
+
+    def __init__(self, settings, outbox=None):
         self.settings = settings
-        self.client = TwilioRestClient(self.settings['SID'], self.settings['TOKEN'])
+        self.auth = 'Basic %s' % base64.b64encode('%s:%s' % (self.settings['SID'], self.settings['TOKEN']))
+        # anything with a put(to, text) method; when set, send_sms queues instead of sending
+        self.outbox = outbox
+
+    @classmethod
+    def close_pools(cls):
+        with cls.POOLS_LOCK:
+            for pool in cls.POOLS.values():
+                pool.close()
+            cls.POOLS = {}
+
+    def pool(self, base):
+        with self.POOLS_LOCK:
+            if base not in self.POOLS:
+                self.POOLS[base] = ConnectionPool(base, size=self.settings.get('HTTP_POOL_SIZE', 10),
+                                                  timeout=self.settings.get('HTTP_TIMEOUT', 10))
+            return self.POOLS[base]
+
+    def post(self, base, path, params, api='messages'):
+        body = urllib.urlencode(params)
+        start = time.time()
+        status = None
+        try:
+            status, data = self.pool(base).request('POST', path, body, {
+                'Authorization': self.auth,
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'Accept': 'application/json',
+            })
+        finally:
+            if self.OBSERVE is not None:
+                self.OBSERVE(api, status, time.time() - start)
+        if status >= 400:
+            raise TwilioHttpError(status, data)
+        return json.loads(data)
+
+    def deliver_sms(self, to_number, text):
+        params = [
+            ('To', self.process_number(to_number)),
+            ('From', self.settings['PHONE_NUMBER']),
+            ('Body', text.encode('utf-8')),
+        ]
+        if 'STATUS_CALLBACK_URL' in self.settings:
+            params.append(('StatusCallback', self.settings['STATUS_CALLBACK_URL']))
+        return self.post(self.settings.get('API_BASE', 'https://api.twilio.com'),
+                         '/2010-04-01/Accounts/%s/Messages.json' % self.settings['SID'], params)
 
     def send_sms(self, to, text):
         if not isinstance(to, list):
             to = [to]
 
+        if self.outbox is not None:
+            return self.outbox.put(to, text)
+
         for to_number in to:
-            self.client.messages.create(body=text, to=self.process_number(to_number),
-                                        from_=self.settings['PHONE_NUMBER'])
+            self.deliver_sms(to_number, text)
+        return len(to)
+
+    def bulk_enabled(self):
+        return 'NOTIFY_SERVICE_SID' in self.settings
+
+    def bulk_send_sms(self, to, text):
+        """
+        Sends one text to a list of numbers with one Notify request per batch of numbers, or one message
+        at a time if there's no Notify service set up. Returns a list of tuples of number, exception (None
+        if the send worked). Notify only says whether it took the batch, so that's what each number gets.
+        """
+        results = []
+        if not self.bulk_enabled():
+            for to_number in to:
+                try:
+                    self.deliver_sms(to_number, text)
+                    results.append((to_number, None))
+                except Exception, e:
+                    results.append((to_number, e))
+            return results
+
+        base = self.settings.get('NOTIFY_BASE', 'https://notify.twilio.com')
+        path = '/v1/Services/%s/Notifications' % self.settings['NOTIFY_SERVICE_SID']
+        batch_size = self.settings.get('BULK_BATCH_SIZE', 1000)
+        for i in range(0, len(to), batch_size):
+            batch = to[i:i + batch_size]
+            params = [('Body', text.encode('utf-8'))]
+            params += [('ToBinding', json.dumps({'binding_type': 'sms', 'address': n}))
+                       for n in numbers.keys(batch)]
+            error = None
+            try:
+                self.post(base, path, params, api='notify')
+            except Exception, e:
+                error = e
+            results += [(to_number, error) for to_number in batch]
+
+        return results
 
     def check_sid(self, sid):
         # ugh constant time attack TODO
         return sid == self.settings['SID']
+
+
+atexit.register(Twilio.close_pools)
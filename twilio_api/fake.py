@@ -0,0 +1,116 @@
+"""
+A stand-in for the parts of the Twilio REST API we use, for trying things out without a network or a
+Twilio bill. Point API_BASE and NOTIFY_BASE in the settings at it. It can be made slow (seconds per
+request) and unreliable (the fraction of requests that get a 500), to see how the bot copes.
+
+    python -m twilio_api.fake 8089 [latency] [error rate]
+"""
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import urlparse
+import threading
+import BaseHTTPServer
+import SocketServer
+
+MESSAGES_PATH = re.compile('^/2010-04-01/Accounts/([^/]+)/Messages\\.json$')
+NOTIFY_PATH = re.compile('^/v1/Services/([^/]+)/Notifications$')
+
+
+class FakeTwilioHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # keep-alive, like the real thing
+    protocol_version = 'HTTP/1.1'
+    # send each response in one go rather than a packet per header
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, doc):
+        body = json.dumps(doc)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        form = urlparse.parse_qs(self.rfile.read(int(self.headers.getheader('Content-Length', 0))))
+        server = self.server
+
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and random.random() < server.error_rate:
+            with server.lock:
+                server.errors += 1
+            return self.reply(500, {'status': 500, 'message': 'something broke, on purpose'})
+
+        match = MESSAGES_PATH.match(self.path)
+        if match:
+            sid = 'SM' + uuid.uuid4().hex
+            server.record(form['To'][0], form['Body'][0], sid)
+            return self.reply(201, {
+                'sid': sid,
+                'account_sid': match.group(1),
+                'to': form['To'][0],
+                'from': form['From'][0],
+                'body': form['Body'][0],
+                'status': 'queued',
+            })
+
+        match = NOTIFY_PATH.match(self.path)
+        if match:
+            sid = 'NT' + uuid.uuid4().hex
+            for binding in form.get('ToBinding', []):
+                server.record(json.loads(binding)['address'], form['Body'][0], sid)
+            return self.reply(201, {
+                'sid': sid,
+                'service_sid': match.group(1),
+                'body': form['Body'][0],
+            })
+
+        self.reply(404, {'status': 404, 'message': 'no such thing here'})
+
+
+class FakeTwilio(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, error_rate=0.0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), FakeTwilioHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        # list of tuples of to, body, sid
+        self.messages = []
+        self.connections = 0
+        self.errors = 0
+
+    @property
+    def base(self):
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+    def record(self, to, body, sid):
+        with self.lock:
+            self.messages.append((to, body, sid))
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        SocketServer.ThreadingMixIn.process_request(self, request, client_address)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+
+if __name__ == '__main__':
+    server = FakeTwilio(int(sys.argv[1]) if len(sys.argv) > 1 else 8089,
+                        latency=float(sys.argv[2]) if len(sys.argv) > 2 else 0.0,
+                        error_rate=float(sys.argv[3]) if len(sys.argv) > 3 else 0.0)
+    print 'fake twilio listening on %s' % server.base
+    server.serve_forever()
@@ -0,0 +1,97 @@
+"""
+Phone numbers in E.164 (+ and up to 15 digits, what Twilio sends and takes), from however they were
+typed in. Ten digits without a + are taken to be North American.
+"""
+import re
+
+E164 = re.compile('^\\+[1-9][0-9]{1,14}\\Z')
+# a whole newline separated list of E.164 numbers, to check a batch with one match
+E164_LINES = re.compile('^(?:\\+[1-9][0-9]{1,14}\n)*\\Z')
+# every character but digits, + and the newlines batches are joined with, for str.translate
+FORMATTING = ''.join(chr(c) for c in range(256) if chr(c) not in '0123456789+\n')
+# lines of digits that get a + and country code: ten digits are North American, more than that
+# already start with a country code
+NATIONAL = re.compile('^(?=[0-9]{10}$)', re.M)
+INTERNATIONAL = re.compile('^(?=[0-9]{11})', re.M)
+
+# number as given -> E.164 number, or None if it isn't one. for numbers looked up one at a time,
+# which tend to be the same few over and over.
+CACHE = {}
+CACHE_SIZE = 10000
+
+
+def to_str(number):
+    if isinstance(number, unicode):
+        return number.encode('utf-8')
+    return str(number)
+
+
+def normalize_all(numbers):
+    """
+    Returns the E.164 form of each of numbers, or None for those that can't be one. They're converted
+    all together, with a few passes over them joined into one string rather than a few per number.
+    """
+    numbers = [number if type(number) is str else to_str(number) for number in numbers]
+    text = '\n'.join(numbers)
+    if E164_LINES.match(text + '\n'):
+        # already all E.164, which is what stored numbers and Twilio's are
+        return numbers
+    if text.count('\n') != len(numbers) - 1:
+        # one typed in with newlines in it can't be told apart from two numbers
+        return [None if '\n' in number else normalize_all([number])[0] for number in numbers]
+
+    text = text.translate(None, FORMATTING)
+    text = INTERNATIONAL.sub('+', NATIONAL.sub('+1', text))
+    if E164_LINES.match(text + '\n'):
+        return text.split('\n')
+    return [number if E164.match(number) else None for number in text.split('\n')]
+
+
+def normalize(number):
+    if type(number) is str and E164.match(number):
+        # every subscriber a broadcast goes to, which would only push the rest out of the cache
+        return number
+    try:
+        return CACHE[number]
+    except KeyError:
+        pass
+    normalized = normalize_all([number])[0]
+    if len(CACHE) >= CACHE_SIZE:
+        CACHE.clear()
+    CACHE[number] = normalized
+    return normalized
+
+
+def to_int(number):
+    # an E.164 number as an integer, to be packed: 15 digits fit in 64 bits
+    return int(number[1:])
+
+
+def from_int(n):
+    return '+%d' % n
+
+
+def to_ints(numbers):
+    """
+    to_int of each of numbers, which all have to be E.164, converted all together.
+    """
+    if not numbers:
+        return []
+    return map(int, '\n'.join(numbers).replace('+', '').split('\n'))
+
+
+def keys(numbers):
+    """
+    What each of numbers is stored and looked up by: its E.164 form, or the number as it is if it
+    hasn't got one (a short code, say).
+    """
+    numbers = [number if type(number) is str else to_str(number) for number in numbers]
+    return [number if normalized is None else normalized
+            for (number, normalized) in zip(numbers, normalize_all(numbers))]
+
+
+def key(number):
+    normalized = normalize(number)
+    if normalized is None:
+        return to_str(number)
+    return normalized
@@ -0,0 +1,93 @@
+import Queue
+import socket
+import httplib
+import urlparse
+
+
+class ConnectionPool(object):
+    """
+    Keep-alive HTTP(S) connections to one host, shared between threads. A connection is only ever used
+    by one thread at a time; when it's done it goes back in the pool for the next request.
+    """
+
+    def __init__(self, base, size=10, timeout=10):
+        parsed = urlparse.urlsplit(base)
+        self.https = parsed.scheme == 'https'
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.timeout = timeout
+        # most recently used first, it's the least likely to have been timed out by the server
+        self.idle = Queue.LifoQueue(size)
+
+    def connect(self):
+        if self.https:
+            return httplib.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def send(self, conn, method, path, body, headers):
+        conn.request(method, path, body, headers or {})
+        resp = conn.getresponse()
+        return resp, resp.read()
+
+    def send_reused(self, conn, method, path, body, headers):
+        """
+        Like send, on a connection that has sat idle. Returns None if the server had closed it before it
+        got the request, so the request can go again on a new connection. Any other error is raised: the
+        request might have got there, and sending it again could send a text twice.
+        """
+        try:
+            try:
+                conn.request(method, path, body, headers or {})
+            except socket.timeout:
+                raise
+            except socket.error:
+                # closed while it sat idle, so writing to it failed
+                return None
+            try:
+                resp = conn.getresponse()
+            except httplib.BadStatusLine:
+                # closed without a response, which the server only does to an idle connection
+                return None
+            return resp, resp.read()
+        except:
+            conn.close()
+            raise
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        Returns the response status and body.
+        """
+        sent = None
+        try:
+            conn = self.idle.get_nowait()
+            sent = self.send_reused(conn, method, path, body, headers)
+            if sent is None:
+                conn.close()
+        except Queue.Empty:
+            pass
+
+        if sent is None:
+            conn = self.connect()
+            try:
+                sent = self.send(conn, method, path, body, headers)
+            except:
+                conn.close()
+                raise
+        resp, data = sent
+
+        if resp.will_close:
+            conn.close()
+        else:
+            try:
+                self.idle.put_nowait(conn)
+            except Queue.Full:
+                conn.close()
+
+        return resp.status, data
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Queue.Empty:
+                return
@@ -0,0 +1,82 @@
+"""
+Subscribers and names in and out of the state, with the same SETTINGS_JSON the bot uses:
+
+    python -m twilio_secretary import subscribers.csv [--format csv|jsonl] [--names-only]
+    python -m twilio_secretary export subscribers.csv [--format csv|jsonl] [--names]
+
+A file of - is stdin or stdout. An import is one change to the state, so it all goes in or none of it
+does. With the json backend, only one process can change the state at a time, so the bot has to be
+stopped for an import.
+"""
+import sys
+import argparse
+
+from . import bulk
+from .backends import StateLocked
+from .secretary import SecretaryState
+
+
+def open_file(fn, mode):
+    if fn == '-':
+        return sys.stdin if mode.startswith('r') else sys.stdout
+    return open(fn, mode)
+
+
+def do_import(args):
+    try:
+        SecretaryState.from_disk()
+    except StateLocked, e:
+        print >> sys.stderr, '%s. Is the bot running? Stop it to import, or use the sqlite backend.' % e
+        sys.exit(1)
+    importer = bulk.Importer(subscribe=not args.names_only)
+    fh = open_file(args.file, 'rb')
+    for batch in bulk.batches(bulk.read(fh, bulk.format_of(args.file, args.format))):
+        importer.add(batch)
+
+    SecretaryState.sync()
+    subscribed, named = SecretaryState.import_numbers(importer.store(), importer.names)
+    SecretaryState.save()
+
+    print >> sys.stderr, 'read %d rows: %d new subscribers, %d names set' % (importer.rows, subscribed, named)
+    if importer.rejected_count:
+        print >> sys.stderr, '%d rows weren\'t phone numbers and were skipped, like: %s' % (
+            importer.rejected_count, ', '.join(repr(number) for number in importer.rejected))
+
+
+def do_export(args):
+    SecretaryState.from_disk(lock=False)
+    names = SecretaryState.NUMBER_MAP
+    if args.names:
+        rows = names.to_list()
+    else:
+        rows = ((number, names.name_of(number))
+                for shard in SecretaryState.subscribers().shards(bulk.BATCH_SIZE) for number in shard)
+
+    fh = open_file(args.file, 'wb')
+    bulk.write(fh, bulk.format_of(args.file, args.format), rows)
+    if fh is not sys.stdout:
+        fh.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m twilio_secretary')
+    commands = parser.add_subparsers()
+
+    importer = commands.add_parser('import', help='subscribe (and name) the numbers in a file')
+    importer.add_argument('file')
+    importer.add_argument('--format', choices=bulk.FORMATS, help='csv or jsonl; by default, from the file name')
+    importer.add_argument('--names-only', action='store_true', help="set names, but don't subscribe anyone")
+    importer.set_defaults(run=do_import)
+
+    exporter = commands.add_parser('export', help='write out the subscribers and their names')
+    exporter.add_argument('file')
+    exporter.add_argument('--format', choices=bulk.FORMATS, help='csv or jsonl; by default, from the file name')
+    exporter.add_argument('--names', action='store_true', help='every named number, subscribed or not')
+    exporter.set_defaults(run=do_export)
+
+    args = parser.parse_args(argv)
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
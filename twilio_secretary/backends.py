@@ -0,0 +1,536 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import sqlite3
+import threading
+
+# seconds claims are kept for
+CLAIMS_KEPT = 7 * 86400
+
+
+class StateLocked(Exception):
+    pass
+
+
+def reverse_lines(fn, block_size=65536):
+    """
+    Lines of a file, last one first, reading it a block at a time from the end.
+    """
+    fh = open(fn, 'rb')
+    fh.seek(0, os.SEEK_END)
+    position = fh.tell()
+    partial = ''
+    while position > 0:
+        read_size = min(block_size, position)
+        position -= read_size
+        fh.seek(position)
+        lines = (fh.read(read_size) + partial).split('\n')
+        partial = lines[0]
+        for line in reversed(lines[1:]):
+            if line:
+                yield line
+    if partial:
+        yield partial
+    fh.close()
+
+
+def sync_file(fh):
+    # make sure what's been written to fh is on the disk, not just in the OS's cache
+    fh.flush()
+    os.fsync(fh.fileno())
+
+
+def sync_dir(fn):
+    # make sure a rename to fn is on the disk
+    fd = os.open(os.path.dirname(os.path.abspath(fn)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class StateBackend(object):
+    """
+    Where SecretaryState keeps itself: a snapshot of the whole state plus a log of the changes
+    (records like ['subscribe', '+13125551234']) made since the snapshot was taken.
+    """
+    # whether other processes can be changing the same state at the same time. shared backends log each
+    # change as it's made, with log(), rather than a batch of them with append().
+    shared = False
+
+    def lock_state(self):
+        """
+        Claims the state for this process to change, if it can't be shared; raises StateLocked if another
+        process already has.
+        """
+        pass
+
+    def unlock_state(self):
+        pass
+
+    def load(self):
+        """
+        Returns the snapshot doc (None if there isn't one yet) and the list of records logged since it
+        was written.
+        """
+        raise NotImplementedError
+
+    def append(self, records):
+        raise NotImplementedError
+
+    def sync(self):
+        """
+        Returns a snapshot doc (usually None) and the records other processes have logged since this one
+        last looked, oldest first. If there's a doc, this process fell too far behind and has to start
+        over from the doc and then apply the records, its own included.
+        """
+        return None, []
+
+    def behind(self):
+        """
+        Whether other processes have logged anything this one hasn't synced yet. It's quick, and doesn't
+        wait for anybody that's in the middle of changing things.
+        """
+        return False
+
+    def needs_compaction(self):
+        raise NotImplementedError
+
+    def compact(self, doc):
+        """
+        Replaces the snapshot with doc, which has every record logged or synced so far applied, and
+        drops those records from the log.
+        """
+        raise NotImplementedError
+
+    def archive_updates(self, updates):
+        """
+        Adds updates (tuples of time, text, oldest first) that no longer fit in memory to the archive.
+        Ones that are already archived are skipped.
+        """
+        raise NotImplementedError
+
+    def archived_updates(self, before, count):
+        """
+        Returns up to count archived updates from before the time before, newest first.
+        """
+        raise NotImplementedError
+
+    def archive_polls(self, polls):
+        """
+        Adds closed polls (in the form of Poll.to_archive, oldest first) to the archive, giving each one
+        an id. Ones that are already archived (going by when they closed) are skipped.
+        """
+        raise NotImplementedError
+
+    def archived_polls(self, count):
+        """
+        Returns up to count of the most recently archived polls, newest first, each with its id.
+        """
+        raise NotImplementedError
+
+    def archived_poll(self, poll_id):
+        raise NotImplementedError
+
+    def claim(self, key):
+        """
+        Returns True to the first process to claim key, and False to every one after it, so that something
+        every process knows about (a scheduled command) is done by just one of them.
+        """
+        # nothing else is using the state
+        return True
+
+
+class JsonFileBackend(StateBackend):
+    """
+    Snapshot in a JSON file, with an append-only log next to it. Every change is a line like
+    [seq, 'subscribe', '+13125551234'] at the end of the log; every so often the state is written
+    out as a new snapshot and the log starts over.
+
+    The snapshot remembers the seq of the last record it includes, so a crash between writing
+    the snapshot and emptying the log doesn't apply anything twice.
+    """
+
+    def __init__(self, snapshot_fn, compact_every=1000, fsync=True):
+        self.snapshot_fn = snapshot_fn
+        self.log_fn = snapshot_fn + '.log'
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.seq = 0
+        self.log_length = 0
+        self.fh = None
+        self.archive_fn = snapshot_fn + '.updates'
+        self.archived_until = None
+        self.polls_fn = snapshot_fn + '.polls'
+        self.last_poll = None
+        self.lock_fh = None
+
+    def lock_state(self):
+        # like the outbox's journal, held for as long as the process is around
+        lock_fh = open(self.snapshot_fn + '.lock', 'w')
+        try:
+            fcntl.flock(lock_fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            lock_fh.close()
+            raise StateLocked('%s is being changed by another process' % self.snapshot_fn)
+        self.lock_fh = lock_fh
+
+    def unlock_state(self):
+        if self.lock_fh is not None:
+            self.lock_fh.close()
+            self.lock_fh = None
+
+    def load(self):
+        doc = None
+        if os.path.exists(self.snapshot_fn):
+            doc = json.load(open(self.snapshot_fn))
+            self.seq = doc.get('log_seq', 0)
+
+        records = []
+        if os.path.exists(self.log_fn):
+            for line in open(self.log_fn):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # torn write at the end of the log from a crash
+                    continue
+                if record[0] > self.seq:
+                    self.seq = record[0]
+                    records.append(record[1:])
+        self.log_length = len(records)
+
+        return doc, records
+
+    def append(self, records):
+        if not records:
+            return
+        if self.fh is None:
+            self.fh = open(self.log_fn, 'a')
+
+        lines = []
+        for record in records:
+            self.seq += 1
+            lines.append(json.dumps([self.seq] + list(record)) + '\n')
+        self.fh.write(''.join(lines))
+        if self.fsync:
+            sync_file(self.fh)
+        else:
+            self.fh.flush()
+        self.log_length += len(records)
+
+    def needs_compaction(self):
+        return self.log_length >= self.compact_every
+
+    def compact(self, doc):
+        doc = dict(doc)
+        doc['log_seq'] = self.seq
+
+        fn_inprog = self.snapshot_fn + '.inprog-%s' % str(uuid.uuid4())
+        fh = open(fn_inprog, 'w')
+        json.dump(doc, fh)
+        if self.fsync:
+            sync_file(fh)
+        fh.close()
+        os.rename(fn_inprog, self.snapshot_fn)
+        if self.fsync:
+            sync_dir(self.snapshot_fn)
+
+        if self.fh is not None:
+            self.fh.close()
+        self.fh = open(self.log_fn, 'w')
+        self.log_length = 0
+
+    def iter_archive(self):
+        if os.path.exists(self.archive_fn):
+            for line in reverse_lines(self.archive_fn):
+                try:
+                    yield tuple(json.loads(line))
+                except ValueError:
+                    # torn write at the end of the archive from a crash
+                    continue
+
+    def archive_updates(self, updates):
+        if self.archived_until is None:
+            self.archived_until = 0
+            for (ts, text) in self.iter_archive():
+                self.archived_until = ts
+                break
+
+        updates = [u for u in updates if u[0] > self.archived_until]
+        if updates:
+            fh = open(self.archive_fn, 'a')
+            fh.write(''.join([json.dumps(list(u)) + '\n' for u in updates]))
+            if self.fsync:
+                sync_file(fh)
+            fh.close()
+            self.archived_until = updates[-1][0]
+
+    def archived_updates(self, before, count):
+        updates = []
+        for update in self.iter_archive():
+            if update[0] < before:
+                updates.append(update)
+                if len(updates) == count:
+                    break
+        return updates
+
+    def iter_polls(self):
+        if os.path.exists(self.polls_fn):
+            for line in reverse_lines(self.polls_fn):
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def archive_polls(self, polls):
+        if self.last_poll is None:
+            self.last_poll = {'id': 0, 'closed': None}
+            for poll in self.iter_polls():
+                self.last_poll = poll
+                break
+
+        lines = []
+        for poll in polls:
+            if self.last_poll['closed'] is not None and poll['closed'] <= self.last_poll['closed']:
+                continue
+            poll = dict(poll, id=self.last_poll['id'] + 1)
+            lines.append(json.dumps(poll) + '\n')
+            self.last_poll = poll
+
+        if lines:
+            fh = open(self.polls_fn, 'a')
+            fh.write(''.join(lines))
+            if self.fsync:
+                sync_file(fh)
+            fh.close()
+
+    def archived_polls(self, count):
+        polls = []
+        for poll in self.iter_polls():
+            polls.append(poll)
+            if len(polls) == count:
+                break
+        return polls
+
+    def archived_poll(self, poll_id):
+        for poll in self.iter_polls():
+            if poll['id'] == poll_id:
+                return poll
+
+
+class SqliteBackend(StateBackend):
+    """
+    Snapshot and log in a SQLite database (in WAL mode), so that several processes, each with their
+    own copy of the state in memory, can share it. Every process logs its own changes with log(), and
+    picks up everybody else's through sync(). Reads go through a connection of their own, which doesn't
+    wait for writers, in this process or any other.
+
+    A new database starts out with whatever is in the JSON files at seed_fn, if there are any, so a
+    deployment can move over from JsonFileBackend without losing its state.
+    """
+    shared = True
+
+    def __init__(self, fn, compact_every=1000, fsync=True, seed_fn=None):
+        self.compact_every = compact_every
+        self.seed_fn = seed_fn
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(fn, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        # NORMAL only syncs at checkpoints, so the last transactions can be lost if the machine goes down
+        self.db.execute('PRAGMA synchronous=%s' % ('FULL' if fsync else 'NORMAL'))
+        self.db.execute('CREATE TABLE IF NOT EXISTS snapshot (id INTEGER PRIMARY KEY, seq INTEGER, doc TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS log (seq INTEGER PRIMARY KEY AUTOINCREMENT, record TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS updates (ts REAL PRIMARY KEY, text TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS polls (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                        'closed REAL UNIQUE, doc TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS claims (key TEXT PRIMARY KEY, claimed REAL)')
+        self.read_lock = threading.Lock()
+        self.read_db = sqlite3.connect(fn, timeout=30, isolation_level=None, check_same_thread=False)
+
+        # every record up to this seq is applied in memory
+        self.seen = 0
+        self.log_length = 0
+
+    def transaction(self, fn, *args):
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(*args)
+            except:
+                self.db.execute('ROLLBACK')
+                raise
+            self.db.execute('COMMIT')
+            return result
+
+    def read_transaction(self, fn, *args):
+        # deferred, so in WAL mode it reads what was committed when it started without taking any lock
+        with self.read_lock:
+            self.read_db.execute('BEGIN')
+            try:
+                return fn(self.read_db, *args)
+            finally:
+                self.read_db.execute('COMMIT')
+
+    def last_seq(self):
+        return self.db.execute('SELECT COALESCE(MAX(seq), 0) FROM log').fetchone()[0]
+
+    def read_snapshot(self, db):
+        doc = None
+        row = db.execute('SELECT seq, doc FROM snapshot WHERE id = 1').fetchone()
+        if row is not None:
+            self.seen = row[0]
+            doc = json.loads(row[1])
+        return doc, self.read_log(db)
+
+    def seed(self):
+        if self.seed_fn is None or self.db.execute('SELECT COUNT(*) FROM snapshot').fetchone()[0] or self.last_seq():
+            return
+        json_backend = JsonFileBackend(self.seed_fn)
+        doc, records = json_backend.load()
+        if doc is not None:
+            doc = dict(doc)
+            doc.pop('log_seq', None)
+            # seq 0, so it comes before the log, which is where the JSON log's records go
+            self.db.execute('INSERT INTO snapshot (id, seq, doc) VALUES (1, 0, ?)', (json.dumps(doc),))
+        self.db.executemany('INSERT INTO log (record) VALUES (?)', [(json.dumps(r),) for r in records])
+        self.db.executemany('INSERT OR IGNORE INTO updates (ts, text) VALUES (?, ?)', json_backend.iter_archive())
+        self.db.executemany('INSERT OR IGNORE INTO polls (id, closed, doc) VALUES (?, ?, ?)',
+                            [(poll['id'], poll['closed'], json.dumps(poll)) for poll in json_backend.iter_polls()])
+
+    def load(self):
+        def load():
+            self.seed()
+            return self.read_snapshot(self.db)
+
+        doc, records = self.transaction(load)
+        self.log_length = len(records)
+        return doc, records
+
+    def read_log(self, db):
+        records = []
+        for (seq, record) in db.execute('SELECT seq, record FROM log WHERE seq > ? ORDER BY seq',
+                                             (self.seen,)):
+            records.append(json.loads(record))
+            self.seen = seq
+        return records
+
+    def read_unseen(self, db):
+        first = db.execute('SELECT MIN(seq) FROM log WHERE seq > ?', (self.seen,)).fetchone()[0]
+        snapshot_seq = db.execute('SELECT COALESCE(MAX(seq), 0) FROM snapshot').fetchone()[0]
+        if snapshot_seq > self.seen and (first is None or first > self.seen + 1):
+            # what we haven't seen yet has already been compacted away
+            return self.read_snapshot(db)
+        return None, self.read_log(db)
+
+    def count_read(self, doc, records):
+        if doc is not None:
+            self.log_length = 0
+        self.log_length += len(records)
+
+    def log(self, record, catch_up):
+        """
+        Logs record after whatever other processes have logged so far. Before it's logged, and while
+        nobody else can log anything, catch_up(doc, records) is called with what sync() would have
+        returned plus record itself, to apply them in memory. So every process applies the same records
+        in the same order, the order of the log.
+        """
+        def log():
+            doc, records = self.read_unseen(self.db)
+            records.append(record)
+            catch_up(doc, records)
+            self.seen = self.db.execute('INSERT INTO log (record) VALUES (?)', (json.dumps(record),)).lastrowid
+            return doc, records
+
+        self.count_read(*self.transaction(log))
+
+    def append(self, records):
+        def append():
+            if self.last_seq() != self.seen:
+                # these would come after records this process hasn't applied; log() them instead
+                raise ValueError('appending to a log with unseen records')
+            for record in records:
+                self.seen = self.db.execute('INSERT INTO log (record) VALUES (?)', (json.dumps(record),)).lastrowid
+
+        if records:
+            self.transaction(append)
+            self.log_length += len(records)
+
+    def sync(self):
+        doc, records = self.read_transaction(self.read_unseen)
+        self.count_read(doc, records)
+        return doc, records
+
+    def behind(self):
+        with self.read_lock:
+            latest = self.read_db.execute('SELECT MAX((SELECT COALESCE(MAX(seq), 0) FROM log), '
+                                          '(SELECT COALESCE(MAX(seq), 0) FROM snapshot))').fetchone()[0]
+        return latest > self.seen
+
+    def needs_compaction(self):
+        return self.log_length >= self.compact_every
+
+    def compact(self, doc):
+        def compact():
+            if self.last_seq() != self.seen:
+                # somebody else logged something doc doesn't have yet; try again next time
+                return
+            # the log since the last snapshot is kept for a while for processes that are behind
+            previous_seq = self.db.execute('SELECT COALESCE(MAX(seq), 0) FROM snapshot').fetchone()[0]
+            self.db.execute('INSERT OR REPLACE INTO snapshot (id, seq, doc) VALUES (1, ?, ?)',
+                            (self.seen, json.dumps(doc)))
+            self.db.execute('DELETE FROM log WHERE seq <= ?', (previous_seq,))
+            self.log_length = 0
+
+        self.transaction(compact)
+
+    def archive_updates(self, updates):
+        def archive():
+            # every process archives the same updates; the first one in wins
+            self.db.executemany('INSERT OR IGNORE INTO updates (ts, text) VALUES (?, ?)', updates)
+
+        if updates:
+            self.transaction(archive)
+
+    def archived_updates(self, before, count):
+        with self.read_lock:
+            return [tuple(row) for row in self.read_db.execute(
+                'SELECT ts, text FROM updates WHERE ts < ? ORDER BY ts DESC LIMIT ?', (before, count))]
+
+    def archive_polls(self, polls):
+        def archive():
+            self.db.executemany('INSERT OR IGNORE INTO polls (closed, doc) VALUES (?, ?)',
+                                [(poll['closed'], json.dumps(poll)) for poll in polls])
+
+        if polls:
+            self.transaction(archive)
+
+    def archived_polls(self, count):
+        with self.read_lock:
+            return [dict(json.loads(doc), id=poll_id) for (poll_id, doc) in self.read_db.execute(
+                'SELECT id, doc FROM polls ORDER BY id DESC LIMIT ?', (count,))]
+
+    def archived_poll(self, poll_id):
+        with self.read_lock:
+            row = self.read_db.execute('SELECT doc FROM polls WHERE id = ?', (poll_id,)).fetchone()
+        if row is not None:
+            return dict(json.loads(row[0]), id=poll_id)
+
+    def claim(self, key):
+        def claim():
+            # a week on, nobody is still trying
+            self.db.execute('DELETE FROM claims WHERE claimed < ?', (time.time() - CLAIMS_KEPT,))
+            return self.db.execute('INSERT OR IGNORE INTO claims (key, claimed) VALUES (?, ?)',
+                                   (key, time.time())).rowcount == 1
+
+        return self.transaction(claim)
+
+
+def get_backend(settings):
+    compact_every = settings.get('COMPACT_EVERY', 1000)
+    fsync = settings.get('STATE_FSYNC', True)
+    if settings.get('STATE_BACKEND', 'json') == 'sqlite':
+        return SqliteBackend(settings.get('STORE_SQLITE', settings['STORE_JSON'] + '.sqlite'),
+                             compact_every=compact_every, fsync=fsync, seed_fn=settings['STORE_JSON'])
+    return JsonFileBackend(settings['STORE_JSON'], compact_every=compact_every, fsync=fsync)
@@ -0,0 +1,116 @@
+import time
+import threading
+import Queue
+
+from .segments import segment_count
+
+# segments a second a Twilio number can send, by the kind of number it is
+THROUGHPUT_CLASSES = {
+    'long_code': 1,
+    'toll_free': 3,
+    'short_code': 100,
+}
+
+
+def summary(sent, failed):
+    send_msg = "Sent to %d subscribers." % sent
+    if failed > 0:
+        send_msg += " Failed to send to %d." % failed
+    return send_msg
+
+
+class RateLimiter(object):
+    """
+    Token bucket shared by all the workers of a broadcast. rate is in messages (or segments) per
+    second; a rate of None means don't limit at all.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        if not self.rate:
+            return
+
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(max(self.burst, tokens), self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class BroadcastResult(object):
+
+    def __init__(self):
+        # list of tuples of number, exception (None if the send worked)
+        self.results = []
+        self.lock = threading.Lock()
+
+    def record(self, number, error=None):
+        with self.lock:
+            self.results.append((number, error))
+
+    @property
+    def sent(self):
+        return len([r for r in self.results if r[1] is None])
+
+    @property
+    def failed(self):
+        return len(self.results) - self.sent
+
+    def failures(self):
+        return [(number, error) for (number, error) in self.results if error is not None]
+
+
+class Broadcaster(object):
+    """
+    Sends one text to a lot of numbers using a bounded pool of worker threads. send is called
+    as send(number, text) and should raise if the message could not be sent. The rate is in segments
+    per second, since that's what carriers limit.
+    """
+
+    def __init__(self, send, concurrency=8, rate=None, burst=1):
+        self.send = send
+        self.concurrency = max(1, int(concurrency))
+        self.limiter = RateLimiter(rate, burst=burst)
+
+    def worker(self, numbers, text, segments, result):
+        while True:
+            try:
+                number = numbers.get_nowait()
+            except Queue.Empty:
+                return
+
+            self.limiter.acquire(segments)
+            try:
+                self.send(number, text)
+                result.record(number)
+            except Exception, e:
+                result.record(number, e)
+
+    def run(self, numbers, text):
+        result = BroadcastResult()
+
+        work = Queue.Queue()
+        for number in numbers:
+            work.put(number)
+
+        segments = segment_count(text)
+        workers = [threading.Thread(target=self.worker, args=(work, text, segments, result))
+                   for i in range(min(self.concurrency, work.qsize()))]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        return result
@@ -0,0 +1,134 @@
+"""
+Subscribers and their names in and out of the state in bulk, as CSV (rows of number, name) or JSONL
+(lines of {"number": ..., "name": ...}, or just numbers). Files are read and written a batch of rows at
+a time, so going through a big one takes no more memory than the numbers in it need.
+"""
+import csv
+import json
+import array
+import itertools
+
+from twilio_api import numbers
+from .subscribers import SubscriberStore, TYPECODE
+
+BATCH_SIZE = 10000
+FORMATS = ['csv', 'jsonl']
+
+
+def format_of(fn, fmt=None):
+    if fmt is not None:
+        return fmt
+    if fn.endswith('.jsonl') or fn.endswith('.json'):
+        return 'jsonl'
+    return 'csv'
+
+
+def clean_name(name):
+    # names are one word, like the NAME command makes them
+    if not name:
+        return None
+    if isinstance(name, str):
+        name = name.decode('utf-8')
+    name = name.strip().split(' ', 1)[0]
+    return name or None
+
+
+def read_csv(fh):
+    for (i, row) in enumerate(csv.reader(fh)):
+        if not row or not row[0].strip():
+            continue
+        if i == 0 and not any(c.isdigit() for c in row[0]):
+            # a header
+            continue
+        yield row[0], clean_name(row[1] if len(row) > 1 else None)
+
+
+def read_jsonl(fh):
+    for line in fh:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line, None
+            continue
+        if isinstance(row, dict):
+            yield row.get('number', ''), clean_name(row.get('name'))
+        elif isinstance(row, list):
+            yield row[0], clean_name(row[1] if len(row) > 1 else None)
+        else:
+            yield row, None
+
+
+def read(fh, fmt):
+    return read_csv(fh) if fmt == 'csv' else read_jsonl(fh)
+
+
+def batches(rows, size=BATCH_SIZE):
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Importer(object):
+    """
+    Collects the numbers to subscribe, and names for them, from batches of rows of number, name. The
+    numbers are normalized a batch at a time and kept packed, with duplicates dropped every so often.
+    """
+
+    def __init__(self, subscribe=True):
+        self.subscribe = subscribe
+        self.packed = array.array(TYPECODE)
+        self.unique = 0
+        # number -> name, the last one given for it
+        self.names = {}
+        self.rows = 0
+        # the first few rows that weren't phone numbers, and how many there were altogether
+        self.rejected = []
+        self.rejected_count = 0
+
+    def add(self, batch):
+        self.rows += len(batch)
+        normalized = numbers.normalize_all([number for (number, name) in batch])
+        for ((number, name), e164) in itertools.izip(batch, normalized):
+            if e164 is None:
+                self.rejected_count += 1
+                if len(self.rejected) < 10:
+                    self.rejected.append(number)
+            elif name is not None:
+                self.names[e164] = name
+        if self.subscribe:
+            self.packed.extend([numbers.to_int(e164) for e164 in normalized if e164 is not None])
+
+        if len(self.packed) > 2 * self.unique + BATCH_SIZE:
+            self.dedupe()
+
+    def dedupe(self):
+        self.packed = array.array(TYPECODE, set(self.packed))
+        self.unique = len(self.packed)
+
+    def store(self):
+        return SubscriberStore(packed=array.array(TYPECODE, sorted(set(self.packed))), others=frozenset())
+
+
+def write_csv(fh, rows):
+    writer = csv.writer(fh)
+    writer.writerow(['number', 'name'])
+    for batch in batches(rows):
+        writer.writerows([[number, name.encode('utf-8') if name else ''] for (number, name) in batch])
+
+
+def write_jsonl(fh, rows):
+    for batch in batches(rows):
+        fh.write(''.join([json.dumps({'number': number, 'name': name}) + '\n' for (number, name) in batch]))
+
+
+def write(fh, fmt, rows):
+    if fmt == 'csv':
+        write_csv(fh, rows)
+    else:
+        write_jsonl(fh, rows)
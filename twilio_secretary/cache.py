@@ -0,0 +1,27 @@
+import time
+import hashlib
+
+
+class RenderCache(object):
+    """
+    Holds on to the last thing rendered, for as long as it's asked for with the same key. Reading it
+    doesn't lock; if two threads render the same thing at once, one of them just wins.
+    """
+
+    def __init__(self):
+        # tuple of key, body, etag, time rendered
+        self.entry = None
+
+    def get(self, key, render):
+        """
+        Returns body, etag and the time body was rendered for key, only calling render() if the last
+        thing rendered was for some other key.
+        """
+        entry = self.entry
+        if entry is None or entry[0] != key:
+            body = render()
+            if isinstance(body, unicode):
+                body = body.encode('utf-8')
+            entry = (key, body, hashlib.md5(body).hexdigest(), time.time())
+            self.entry = entry
+        return entry[1:]
@@ -0,0 +1,68 @@
+class Usage(Exception):
+    """
+    Raised by an argument parser; the message is sent back to whoever texted the command.
+    """
+    pass
+
+
+def no_arguments(argument):
+    return []
+
+
+def optional_argument(argument):
+    return [argument]
+
+
+def text_argument(usage):
+    def parse(argument):
+        if argument is None:
+            raise Usage(usage)
+        return [argument]
+    return parse
+
+
+def two_arguments(arguments_needed):
+    def parse(argument):
+        if argument is None:
+            raise Usage("Send %s" % arguments_needed)
+        frags = argument.split(' ', 1)
+        if len(frags) == 1:
+            raise Usage("You have to send %s." % arguments_needed)
+        return frags
+    return parse
+
+
+class Command(object):
+
+    def __init__(self, name, handler, admin=False, parser=no_arguments, help=None):
+        self.name = name
+        self.handler = handler
+        self.admin = admin
+        self.parser = parser
+        self.help = help
+
+
+class CommandRegistry(object):
+    """
+    Table of the commands that can be texted in, by name. Handlers are registered with the command
+    decorator and called as handler(secretary, from_number, *parsed_arguments).
+    """
+
+    def __init__(self):
+        self.commands = {}
+        # in the order they were registered, for the help text
+        self.ordered = []
+
+    def command(self, name, admin=False, parser=no_arguments, help=None):
+        def register(handler):
+            command = Command(name, handler, admin=admin, parser=parser, help=help)
+            self.commands[name] = command
+            self.ordered.append(command)
+            return handler
+        return register
+
+    def lookup(self, name):
+        return self.commands.get(name)
+
+    def help_lines(self, admin):
+        return [command.help for command in self.ordered if command.help is not None and command.admin == admin]
@@ -1,3 +1,16 @@
+import re
+import time
+import datetime
+
+# a duration with its units spelled out: 90m, 2h, 1h30m
+DURATION = re.compile('^(?:(\\d+)(?:h|hr|hrs))?(?:(\\d+)(?:m|min|mins))?$')
+# hours and minutes: 18:00, 1:30
+HOURS_MINUTES = re.compile('^(\\d{1,2}):([0-5]\\d)$')
+# words that, after a number, make it part of what's being said rather than when to say it
+TIME_WORDS = frozenset(['second', 'seconds', 'sec', 'secs', 'minute', 'minutes', 'min', 'mins', 'hour', 'hours',
+                        'hr', 'hrs', 'day', 'days', 'week', 'weeks', 'am', 'pm', 'a.m.', 'p.m.', "o'clock"])
+
+
 class Bad(Exception):
     pass
 
@@ -58,3 +71,40 @@ def dur2sec(s):
     if r < 0:
         raise Bad
     return r
+
+
+def next_time_of_day(sec, now=None):
+    """
+    Returns the timestamp of the next time (local time) it's sec seconds past midnight.
+    """
+    if sec >= 24 * 3600:
+        raise Bad
+    now = datetime.datetime.fromtimestamp(now if now is not None else time.time())
+    when = now.replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(seconds=sec)
+    if when <= now:
+        when += datetime.timedelta(days=1)
+    return time.mktime(when.timetuple())
+
+
+def hm2sec(s):
+    """
+    Returns the seconds in hours and minutes with a colon between them, like 18:00 or 1:30.
+    """
+    match = HOURS_MINUTES.match(s)
+    if match is None:
+        raise Bad
+    return 3600 * int(match.group(1)) + 60 * int(match.group(2))
+
+
+def duration2sec(s):
+    """
+    Returns the seconds in a duration that can't be mistaken for anything else: 1:30, 90m, 2h or 1h30m.
+    A bare number isn't one.
+    """
+    if ':' in s:
+        return hm2sec(s)
+    match = DURATION.match(s.lower())
+    if match is None or match.groups() == (None, None):
+        raise Bad
+    hours, minutes = match.groups()
+    return 3600 * int(hours or 0) + 60 * int(minutes or 0)
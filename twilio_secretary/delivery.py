@@ -0,0 +1,106 @@
+import os
+import time
+import json
+import uuid
+import threading
+
+DELIVERED = 'delivered'
+FAILED_STATUSES = frozenset(['failed', 'undelivered'])
+# error codes that mean the number is never going to get a text: it's been unsubscribed at the carrier
+# (21610), doesn't exist (30005) or is a landline (30006)
+PERMANENT_ERRORS = frozenset(['21610', '30005', '30006'])
+# error codes that are about the number rather than our account, Twilio or the carrier's filtering: it's
+# unreachable (30003), blocked (30004), invalid (21211) or can't take texts (21614). only these and the
+# permanent ones count towards pruning; queue overflow (30001) and the like would take everyone with them.
+RECIPIENT_ERRORS = PERMANENT_ERRORS | frozenset(['21211', '21614', '30003', '30004'])
+
+
+class DeliveryLog(object):
+    """
+    Takes delivery status callbacks as fast as they come in and writes them out in batches, to a file
+    of JSON lines. Keeps count of how many texts in a row haven't got through to each number, and when
+    that reaches prune_after (or the error says the number is dead) hands the number to prune(number).
+    Failures that aren't the number's fault are logged but don't count either way.
+
+    The counts are saved to log_fn with .failures on the end whenever a batch is written.
+    """
+
+    def __init__(self, log_fn, prune, prune_after=3, batch_size=500, interval=1.0, max_log_size=50000000):
+        self.log_fn = log_fn
+        self.failures_fn = log_fn + '.failures'
+        self.prune = prune
+        self.prune_after = prune_after
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_log_size = max_log_size
+
+        self.cond = threading.Condition()
+        self.events = []
+        # number -> how many texts in a row didn't get there
+        self.failures = {}
+        if os.path.exists(self.failures_fn):
+            self.failures = json.load(open(self.failures_fn))
+        self.thread = None
+
+    def record(self, event):
+        """
+        Takes a dict of the callback's MessageSid, MessageStatus, To and ErrorCode.
+        """
+        with self.cond:
+            self.events.append(event)
+            if len(self.events) >= self.batch_size:
+                self.cond.notify()
+
+    def take_batch(self):
+        with self.cond:
+            if len(self.events) < self.batch_size:
+                self.cond.wait(self.interval)
+            events = self.events
+            self.events = []
+            return events
+
+    def flush(self, events):
+        if not events:
+            return
+
+        now = time.time()
+        fh = open(self.log_fn, 'a')
+        fh.write(''.join([json.dumps(dict(event, received=now)) + '\n' for event in events]))
+        fh.close()
+        if os.path.getsize(self.log_fn) > self.max_log_size:
+            os.rename(self.log_fn, self.log_fn + '.1')
+
+        dead = []
+        for event in events:
+            number, status = event.get('To'), event.get('MessageStatus')
+            if number is None:
+                continue
+            if status == DELIVERED:
+                self.failures.pop(number, None)
+            elif status in FAILED_STATUSES and event.get('ErrorCode') in RECIPIENT_ERRORS:
+                self.failures[number] = self.failures.get(number, 0) + 1
+                if self.failures[number] >= self.prune_after or event.get('ErrorCode') in PERMANENT_ERRORS:
+                    dead.append(number)
+
+        for number in dead:
+            if self.failures.pop(number, None) is not None:
+                self.prune(number)
+
+        fn_inprog = self.failures_fn + '.inprog-%s' % str(uuid.uuid4())
+        fh = open(fn_inprog, 'w')
+        json.dump(self.failures, fh)
+        fh.close()
+        os.rename(fn_inprog, self.failures_fn)
+
+    def run(self):
+        while True:
+            try:
+                self.flush(self.take_batch())
+            except:
+                import traceback
+                traceback.print_exc()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
@@ -0,0 +1,65 @@
+import uuid
+import random
+import collections
+
+
+class NumberDirectory(object):
+    """
+    Names people go by, looked up either by their number or (case insensitively) by their name. More than
+    one number can have the same name; looking it up gives the one that was named first, and the name
+    isn't free for generate_name() until none of them has it.
+    """
+    NAME_PREFIXES = ['red', 'pup', 'rocket', 'turtle', 'blue']
+
+    def __init__(self, pairs=()):
+        # number -> name, in the order the numbers were first named
+        self.names = collections.OrderedDict()
+        # number -> where it comes in that order
+        self.positions = {}
+        # lowercased name -> set of numbers
+        self.numbers = {}
+        # generated names below this index are all taken
+        self.next_index = 1
+
+        for (number, name) in pairs:
+            self.set(number, name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def to_list(self):
+        return [[number, name] for (number, name) in self.names.iteritems()]
+
+    def name_of(self, number):
+        return self.names.get(number)
+
+    def number_of(self, name):
+        numbers = self.numbers.get(name.lower())
+        if not numbers:
+            return None
+        return min(numbers, key=self.positions.get)
+
+    def set(self, number, name):
+        old_name = self.names.get(number)
+        if old_name is not None:
+            numbers = self.numbers[old_name.lower()]
+            numbers.discard(number)
+            if not numbers:
+                del self.numbers[old_name.lower()]
+        else:
+            self.positions[number] = len(self.positions)
+
+        self.names[number] = name
+        self.numbers.setdefault(name.lower(), set()).add(number)
+
+    def generate_name(self):
+        while self.next_index < 1000:
+            prefixes = list(self.NAME_PREFIXES)
+            random.shuffle(prefixes)
+            for prefix in prefixes:
+                name = '%s%d' % (prefix, self.next_index)
+                if name not in self.numbers:
+                    return name
+            self.next_index += 1
+
+        return str(uuid.uuid4())[0:8]
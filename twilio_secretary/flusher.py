@@ -0,0 +1,87 @@
+import time
+import threading
+
+
+class Flusher(object):
+    """
+    Calls save() in a thread of its own some time after mark() is called, rather than after every
+    change. A save happens once no more marks have come in for debounce seconds, or max_delay seconds
+    after the first mark, whichever is sooner; everything marked in between goes in that one save.
+    """
+
+    def __init__(self, save, debounce=0.05, max_delay=1.0):
+        self.save = save
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.cond = threading.Condition()
+        # times of the first and last marks since the last save
+        self.first = None
+        self.last = None
+        # whether flush() wants what's marked saved now, and whether save() is running
+        self.hurry = False
+        self.saving = False
+        self.stopping = False
+        self.thread = None
+
+    def mark(self):
+        with self.cond:
+            self.last = time.time()
+            if self.first is None:
+                self.first = self.last
+                self.cond.notify_all()
+
+    def wait(self):
+        # returns False if stopped with nothing to save
+        with self.cond:
+            while self.first is None:
+                if self.stopping:
+                    return False
+                self.cond.wait()
+
+            while not self.stopping and not self.hurry:
+                wait = min(self.last + self.debounce, self.first + self.max_delay) - time.time()
+                if wait <= 0:
+                    break
+                self.cond.wait(wait)
+
+            self.first = self.last = None
+            self.hurry = False
+            self.saving = True
+            return True
+
+    def run(self):
+        while self.wait():
+            try:
+                self.save()
+            except:
+                import traceback
+                traceback.print_exc()
+            with self.cond:
+                self.saving = False
+                self.cond.notify_all()
+
+    def flush(self):
+        """
+        Saves whatever is marked now rather than later, and returns once it's saved.
+        """
+        with self.cond:
+            if self.first is not None:
+                self.hurry = True
+                self.cond.notify_all()
+            while (self.first is not None or self.saving) and self.thread is not None and self.thread.is_alive():
+                self.cond.wait(1)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout=10):
+        """
+        Saves whatever is still marked and stops the thread.
+        """
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
@@ -0,0 +1,93 @@
+import os
+import time
+import json
+import uuid
+import threading
+import collections
+
+
+class SeenCache(object):
+    """
+    The ids (MessageSids) of the last size webhooks handled within the last ttl seconds, so that a
+    webhook Twilio sends again can be told apart from a new one. If fn is given they're also appended
+    there and read back on start up, so a restart doesn't forget them.
+    """
+
+    def __init__(self, size=10000, ttl=3600, fn=None):
+        self.size = size
+        self.ttl = ttl
+        self.fn = fn
+        self.lock = threading.Lock()
+        # id -> when it was seen, oldest first
+        self.seen = collections.OrderedDict()
+        self.fh = None
+        self.lines = 0
+
+        if fn is not None:
+            self.load()
+
+    def load(self):
+        now = time.time()
+        if os.path.exists(self.fn):
+            for line in open(self.fn):
+                try:
+                    key, when = json.loads(line)
+                except ValueError:
+                    continue
+                self.seen.pop(key, None)
+                if when > now - self.ttl:
+                    self.seen[key] = when
+            self.expire(now)
+        self.compact()
+
+    def compact(self):
+        if self.fh is not None:
+            self.fh.close()
+
+        fn_inprog = self.fn + '.inprog-%s' % str(uuid.uuid4())
+        fh = open(fn_inprog, 'w')
+        fh.write(''.join([json.dumps([key, when]) + '\n' for (key, when) in self.seen.items()]))
+        fh.close()
+        os.rename(fn_inprog, self.fn)
+
+        self.fh = open(self.fn, 'a')
+        self.lines = len(self.seen)
+
+    def expire(self, now):
+        # caller holds lock (or nothing else is running)
+        while self.seen:
+            key, when = next(self.seen.iteritems())
+            if len(self.seen) <= self.size and when > now - self.ttl:
+                break
+            del self.seen[key]
+
+    def add(self, key):
+        """
+        Returns True if key hasn't been seen (in the time it's remembered for), False if it has.
+        """
+        now = time.time()
+        with self.lock:
+            when = self.seen.get(key)
+            if when is not None and when > now - self.ttl:
+                return False
+
+            self.seen.pop(key, None)
+            self.seen[key] = now
+            self.expire(now)
+
+            if self.fh is not None:
+                self.fh.write(json.dumps([key, now]) + '\n')
+                self.fh.flush()
+                self.lines += 1
+                if self.lines > 2 * self.size:
+                    self.compact()
+            return True
+
+    def forget(self, key):
+        # for when handling it didn't work out, so it can be tried again
+        with self.lock:
+            if self.seen.pop(key, None) is not None and self.fh is not None:
+                # as good as forgotten when it's read back
+                self.fh.write(json.dumps([key, 0]) + '\n')
+                self.fh.flush()
+                self.lines += 1
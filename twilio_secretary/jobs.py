@@ -0,0 +1,297 @@
+import os
+import time
+import json
+import uuid
+import threading
+import collections
+
+from .segments import segment_count
+from .subscribers import SubscriberStore, to_bytes, from_bytes
+
+PENDING = 0
+SENT = 1
+FAILED = 2
+
+
+class BroadcastJob(object):
+    """
+    One text going to a fixed set of recipients (a SubscriberStore snapshot, in the order its shards()
+    go in). cursor is how many of them have been put in the outbox; statuses has what happened to each one.
+    """
+
+    def __init__(self, job_id, body, recipients, created, cursor=0):
+        self.id = job_id
+        self.body = body
+        self.recipients = recipients
+        self.total = len(recipients)
+        self.created = created
+        self.cursor = cursor
+        self.statuses = bytearray(self.total)
+        self.sent = 0
+        self.failed = 0
+        self.finished = created if self.total == 0 else None
+
+    def to_doc(self):
+        # the E.164 recipients go in a file of their own, packed
+        return {'id': self.id, 'body': self.body, 'others': sorted(self.recipients.others), 'created': self.created}
+
+    def done(self):
+        return self.sent + self.failed == self.total
+
+    def set_status(self, index, status, when):
+        if self.statuses is None or self.statuses[index] != PENDING:
+            return
+        self.statuses[index] = status
+        if status == SENT:
+            self.sent += 1
+        else:
+            self.failed += 1
+        if self.done():
+            self.finished = when
+            # nothing more is going to happen to them
+            self.recipients = None
+            self.statuses = None
+
+    def progress(self):
+        elapsed = (self.finished or time.time()) - self.created
+        return {
+            'id': self.id,
+            'body': self.body,
+            'total': self.total,
+            'queued': self.cursor,
+            'sent': self.sent,
+            'failed': self.failed,
+            'segments': self.total * segment_count(self.body),
+            'created': self.created,
+            'finished': self.finished,
+            'per_second': (self.sent + self.failed) / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+class BroadcastJobs(object):
+    """
+    Broadcasts in progress, kept in a journal of JSON lines next to the outbox's: ["create", job],
+    ["cursor", id, cursor] and ["status", id, [[index, status], ...]]. Each job's E.164 recipients are
+    written packed to the journal's name with the job id on the end, so starting a job takes no longer
+    than writing those bytes; they're put in the outbox a shard at a time by a thread of its own.
+
+    A job that was cut off while its recipients were being queued picks up from its cursor in resume().
+    A shard that made it into the outbox just before the crash, but not into the cursor, is recognized
+    by its message ids.
+    """
+    KEEP_FINISHED = 20
+
+    def __init__(self, outbox, journal_fn, shard_size=1000):
+        self.outbox = outbox
+        self.journal_fn = journal_fn
+        self.shard_size = shard_size
+        self.lock = threading.Lock()
+        # id -> BroadcastJob, and the ids oldest first
+        self.jobs = {}
+        self.order = []
+        self.journal = None
+        self.journal_lines = 0
+        # tuples of job, ids of messages already in the outbox (or None), for the thread to queue
+        self.cond = threading.Condition()
+        self.waiting = collections.deque()
+        self.thread = None
+
+        self.replay()
+
+    def recipients_fn(self, job_id):
+        return '%s.%s' % (self.journal_fn, job_id)
+
+    def replay(self):
+        if os.path.exists(self.journal_fn):
+            for line in open(self.journal_fn):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self.apply(entry)
+        self.compact()
+
+    def apply(self, entry):
+        op = entry[0]
+        if op == 'create':
+            doc = entry[1]
+            try:
+                packed = from_bytes(open(self.recipients_fn(doc['id']), 'rb').read())
+            except IOError:
+                print 'the recipients of broadcast %s are gone' % doc['id']
+                return
+            recipients = SubscriberStore(packed=packed, others=frozenset(doc['others']))
+            job = BroadcastJob(doc['id'], doc['body'], recipients, doc['created'])
+            self.jobs[job.id] = job
+            self.order.append(job.id)
+        elif op == 'finished':
+            # what compact() keeps of a finished job
+            doc = entry[1]
+            job = BroadcastJob(doc['id'], doc['body'], SubscriberStore(), doc['created'])
+            job.total, job.cursor, job.sent, job.failed, job.finished = (
+                doc['total'], doc['queued'], doc['sent'], doc['failed'], doc['finished'])
+            job.statuses = None
+            self.jobs[job.id] = job
+            self.order.append(job.id)
+        elif op == 'cursor':
+            job = self.jobs.get(entry[1])
+            if job is not None:
+                job.cursor = max(job.cursor, entry[2])
+        elif op == 'status':
+            job = self.jobs.get(entry[1])
+            if job is not None:
+                for (index, status) in entry[2]:
+                    job.set_status(index, status, entry[3])
+
+    def compact(self):
+        if self.journal is not None:
+            self.journal.close()
+
+        finished = [job_id for job_id in self.order if self.jobs[job_id].finished is not None]
+        for job_id in finished[:-self.KEEP_FINISHED]:
+            del self.jobs[job_id]
+        self.order = [job_id for job_id in self.order if job_id in self.jobs]
+
+        fn_inprog = self.journal_fn + '.inprog-%s' % str(uuid.uuid4())
+        fh = open(fn_inprog, 'w')
+        for job_id in self.order:
+            job = self.jobs[job_id]
+            if job.finished is not None:
+                fh.write(json.dumps(['finished', job.progress()]) + '\n')
+                continue
+            fh.write(json.dumps(['create', job.to_doc()]) + '\n')
+            fh.write(json.dumps(['cursor', job.id, job.cursor]) + '\n')
+            statuses = [[i, status] for (i, status) in enumerate(job.statuses) if status != PENDING]
+            fh.write(json.dumps(['status', job.id, statuses, None]) + '\n')
+        fh.close()
+        os.rename(fn_inprog, self.journal_fn)
+
+        # finished ones' recipients aren't needed now they're written as finished
+        for job_id in self.order:
+            fn = self.recipients_fn(job_id)
+            if self.jobs[job_id].finished is not None and os.path.exists(fn):
+                os.remove(fn)
+
+        self.journal = open(self.journal_fn, 'a')
+        self.journal_lines = 3 * len(self.order)
+
+    def write_journal(self, entries):
+        # caller holds lock
+        self.journal.write(''.join([json.dumps(entry) + '\n' for entry in entries]))
+        self.journal.flush()
+        self.journal_lines += len(entries)
+
+    def start(self, recipients, body):
+        """
+        Starts a job sending body to each of recipients (a SubscriberStore snapshot) and hands it to the
+        thread to queue. Returns the job.
+        """
+        job = BroadcastJob(uuid.uuid4().hex[:8], body, recipients, time.time())
+        fh = open(self.recipients_fn(job.id), 'wb')
+        fh.write(to_bytes(recipients.packed))
+        fh.close()
+        with self.lock:
+            self.jobs[job.id] = job
+            self.order.append(job.id)
+            self.write_journal([['create', job.to_doc()]])
+        with self.cond:
+            self.waiting.append((job, None))
+            self.cond.notify()
+        return job
+
+    def queue(self, job, outstanding=None):
+        # when resuming, outstanding has the ids of messages already in the outbox, not to be put there twice
+        for shard in job.recipients.shards(self.shard_size, job.cursor):
+            first = job.cursor
+            if outstanding is None:
+                indexes = shard
+            else:
+                indexes = [first + i for i in range(len(shard))
+                           if message_id(job.id, first + i) not in outstanding and job.statuses[first + i] == PENDING]
+            if len(indexes) == len(shard):
+                self.outbox.put(shard, job.body, job=job.id, first=first)
+            else:
+                for index in indexes:
+                    self.outbox.put(shard[index - first], job.body, job=job.id, first=index)
+            with self.lock:
+                job.cursor = first + len(shard)
+                self.write_journal([['cursor', job.id, job.cursor]])
+
+    def resume(self):
+        outstanding = self.outbox.message_ids()
+        with self.cond:
+            for job_id in list(self.order):
+                job = self.jobs[job_id]
+                if job.finished is None and job.cursor < job.total:
+                    print 'resuming broadcast %s from %d of %d' % (job.id, job.cursor, job.total)
+                    self.waiting.append((job, outstanding))
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.waiting:
+                    self.cond.wait()
+                job, outstanding = self.waiting[0]
+            try:
+                self.queue(job, outstanding)
+            except:
+                # the rest of it is queued when the bot next starts
+                import traceback
+                traceback.print_exc()
+            with self.cond:
+                self.waiting.popleft()
+
+    def start_thread(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def record(self, results):
+        """
+        Takes the status of sent (or given up on) outbox messages, as tuples of message, error. Returns the
+        jobs they finished.
+        """
+        now = time.time()
+        by_job = {}
+        for (message, error) in results:
+            if 'job' in message:
+                by_job.setdefault(message['job'], []).append([message['index'], SENT if error is None else FAILED])
+        if not by_job:
+            return []
+
+        with self.lock:
+            entries = []
+            finished = []
+            for (job_id, statuses) in by_job.items():
+                job = self.jobs.get(job_id)
+                if job is None or job.done():
+                    continue
+                for (index, status) in statuses:
+                    job.set_status(index, status, now)
+                entries.append(['status', job_id, statuses, now])
+                if job.done():
+                    finished.append(job)
+            self.write_journal(entries)
+            if self.journal_lines > 1000:
+                self.compact()
+            return finished
+
+    def progress(self, job_id=None):
+        """
+        Returns the progress of the job with id job_id (the latest one if not given) as a dict, or None
+        if there's no such job.
+        """
+        with self.lock:
+            if job_id is None:
+                job_id = self.order[-1] if self.order else None
+            job = self.jobs.get(job_id)
+            return job.progress() if job is not None else None
+
+    def all_progress(self):
+        with self.lock:
+            return [self.jobs[job_id].progress() for job_id in reversed(self.order)]
+
+
+def message_id(job_id, index):
+    return '%s-%d' % (job_id, index)
@@ -0,0 +1,159 @@
+"""
+Counters, gauges and timing histograms, rendered in the Prometheus text format for /metrics. Recording
+something is a dict lookup and a few additions under a lock, so it can go on every request.
+"""
+import time
+import bisect
+import functools
+import threading
+
+# seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join(['%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                              for (name, value) in zip(names, values)])
+
+
+class Counter(object):
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.lock = threading.Lock()
+        # tuple of label values -> count
+        self.values = {}
+
+    def inc(self, *label_values, **kwargs):
+        amount = kwargs.get('amount', 1)
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s counter' % self.name]
+        with self.lock:
+            values = sorted(self.values.items())
+        for (label_values, value) in values:
+            lines.append('%s%s %s' % (self.name, format_labels(self.labels, label_values), value))
+        return lines
+
+
+class Gauge(object):
+    """
+    A value that's read by calling get() when the metrics are rendered.
+    """
+
+    def __init__(self, name, help, get):
+        self.name = name
+        self.help = help
+        self.get = get
+
+    def render(self):
+        return ['# HELP %s %s' % (self.name, self.help), '# TYPE %s gauge' % self.name,
+                '%s %s' % (self.name, self.get())]
+
+
+class Histogram(object):
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # tuple of label values -> [count in each bucket (not cumulative) and one for +Inf, sum]
+        self.values = {}
+
+    def observe(self, seconds, *label_values):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            value = self.values.get(label_values)
+            if value is None:
+                value = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            value[0][i] += 1
+            value[1] += seconds
+
+    def time(self, *label_values):
+        return Timer(self, label_values)
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s histogram' % self.name]
+        with self.lock:
+            values = sorted([(label_values, (list(counts), total))
+                             for (label_values, (counts, total)) in self.values.items()])
+        names = tuple(self.labels) + ('le',)
+        for (label_values, (counts, total)) in values:
+            cumulative = 0
+            for (bound, count) in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (self.name, format_labels(names, label_values + (bound,)),
+                                                 cumulative))
+            labels = format_labels(self.labels, label_values)
+            lines.append('%s_sum%s %r' % (self.name, labels, total))
+            lines.append('%s_count%s %d' % (self.name, labels, cumulative))
+        return lines
+
+
+class Timer(object):
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.time() - self.start, *self.label_values)
+
+    def __call__(self, f):
+        @functools.wraps(f)
+        def timed(*args, **kwargs):
+            with Timer(self.histogram, self.label_values):
+                return f(*args, **kwargs)
+        return timed
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+WEBHOOK_SECONDS = REGISTRY.add(Histogram('secretary_webhook_seconds', 'Time taken handling a request, by endpoint',
+                                         labels=('endpoint',)))
+WEBHOOK_ERRORS = REGISTRY.add(Counter('secretary_webhook_errors_total', 'Requests that raised, by endpoint',
+                                      labels=('endpoint',)))
+WEBHOOK_DUPLICATES = REGISTRY.add(Counter('secretary_webhook_duplicates_total',
+                                          'Inbound texts Twilio sent again, which were ignored'))
+COMMAND_SECONDS = REGISTRY.add(Histogram('secretary_command_seconds', 'Time taken handling a texted command',
+                                         labels=('command',)))
+TWILIO_SECONDS = REGISTRY.add(Histogram('secretary_twilio_request_seconds', 'Time taken by Twilio API requests',
+                                        labels=('api', 'status')))
+SAVE_SECONDS = REGISTRY.add(Histogram('secretary_save_seconds', 'Time taken writing the state to its backend'))
+
+SMS_SENT = REGISTRY.add(Counter('secretary_sms_sent_total', 'Texts Twilio took'))
+SMS_SEGMENTS = REGISTRY.add(Counter('secretary_sms_segments_total', 'Segments (what Twilio bills for) in texts sent'))
+SMS_FAILED = REGISTRY.add(Counter('secretary_sms_failed_total', 'Texts that failed to send, by whether they will be retried',
+                                  labels=('retry',)))
+
+
+def observe_twilio(api, status, seconds):
+    TWILIO_SECONDS.observe(seconds, api, status if status is not None else 'error')
@@ -0,0 +1,258 @@
+import os
+import time
+import json
+import uuid
+import fcntl
+import heapq
+import threading
+
+from . import metrics
+from .backends import sync_file, sync_dir
+from .broadcast import Broadcaster
+from .jobs import message_id
+from .segments import segment_count
+
+
+def is_transient(error):
+    # twilio tells us 4xx when the message itself is no good; retrying those won't help.
+    # anything else (5xx, 429, sockets timing out...) is worth another go.
+    status = getattr(error, 'status', None)
+    if status is None:
+        return True
+    return status == 429 or status >= 500
+
+
+class Outbox(object):
+    """
+    Durable queue of outbound texts. put() only appends to the journal and returns, the
+    dispatcher thread does the actual sending through a Broadcaster (or bulk, if given, for a text going
+    to more than one number) and retries transient failures with exponential backoff.
+
+    The journal is a file of JSON lines, either ["put", message] or ["done", message id]. A
+    message that has been put again (for a retry) replaces the earlier copy on replay. When several
+    processes share a journal_fn, each one takes a journal of its own (journal_fn, journal_fn-1, ...),
+    and picks up whatever a process before it left unsent there.
+
+    Messages put for a broadcast job have their job id and index in its recipients, and on_done hears
+    about them when they've been sent or given up on. Every other message (a reply, mostly) goes ahead of
+    them, and when sending is rate limited they go a second's worth at a time, so that a reply never
+    waits behind more than that.
+    """
+
+    def __init__(self, deliver, journal_fn, concurrency=8, rate=None, burst=1, batch_size=100, max_attempts=5,
+                 backoff=2.0, bulk=None, on_done=None, fsync=True):
+        self.deliver = deliver
+        # bulk(numbers, text) returns a list of tuples of number, exception (None if it worked)
+        self.bulk = bulk
+        # on_done(results) is given a list of tuples of message, exception (None if it was sent)
+        self.on_done = on_done
+        self.lock_fh = None
+        self.journal_fn = self.claim_journal(journal_fn)
+        self.broadcaster = Broadcaster(deliver, concurrency=concurrency, rate=rate, burst=burst)
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.fsync = fsync
+
+        self.cond = threading.Condition()
+        # heaps of tuples of not_before, sequence, message: messages on their own, and ones for jobs
+        self.pending = []
+        self.job_pending = []
+        self.seq = 0
+        self.journal = None
+        self.journal_lines = 0
+        self.thread = None
+
+        self.replay()
+
+    def claim_journal(self, journal_fn):
+        i = 0
+        while True:
+            fn = journal_fn if i == 0 else '%s-%d' % (journal_fn, i)
+            lock_fh = open(fn + '.lock', 'w')
+            try:
+                fcntl.flock(lock_fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                # some other process is using this one
+                lock_fh.close()
+                i += 1
+                continue
+            self.lock_fh = lock_fh
+            return fn
+
+    def replay(self):
+        messages = {}
+        if os.path.exists(self.journal_fn):
+            for line in open(self.journal_fn):
+                try:
+                    op, arg = json.loads(line)
+                except ValueError:
+                    # torn write at the end of the journal from a crash
+                    continue
+                if op == 'put':
+                    messages[arg['id']] = arg
+                elif op == 'done':
+                    messages.pop(arg, None)
+
+        for message in messages.values():
+            self.push(message)
+        self.compact()
+
+    def compact(self):
+        # rewrite the journal with only what's still outstanding so it doesn't grow forever
+        if self.journal is not None:
+            self.journal.close()
+
+        fn_inprog = self.journal_fn + '.inprog-%s' % str(uuid.uuid4())
+        fh = open(fn_inprog, 'w')
+        for (not_before, seq, message) in self.pending + self.job_pending:
+            fh.write(json.dumps(['put', message]) + '\n')
+        if self.fsync:
+            sync_file(fh)
+        fh.close()
+        os.rename(fn_inprog, self.journal_fn)
+        if self.fsync:
+            sync_dir(self.journal_fn)
+
+        self.journal = open(self.journal_fn, 'a')
+        self.journal_lines = len(self.pending) + len(self.job_pending)
+
+    def push(self, message):
+        self.seq += 1
+        heapq.heappush(self.job_pending if 'job' in message else self.pending,
+                       (message['not_before'], self.seq, message))
+
+    def write_journal(self, entries):
+        self.journal.write(''.join([json.dumps(entry) + '\n' for entry in entries]))
+        if self.fsync:
+            sync_file(self.journal)
+        else:
+            self.journal.flush()
+        self.journal_lines += len(entries)
+
+    def put(self, to, body, job=None, first=0):
+        if not isinstance(to, list):
+            to = [to]
+
+        now = time.time()
+        messages = [{'id': str(uuid.uuid4()), 'to': number, 'body': body, 'attempt': 0, 'not_before': now}
+                    for number in to]
+        if job is not None:
+            for (i, message) in enumerate(messages):
+                message['id'] = message_id(job, first + i)
+                message['job'] = job
+                message['index'] = first + i
+        with self.cond:
+            self.write_journal([['put', message] for message in messages])
+            for message in messages:
+                self.push(message)
+            self.cond.notify()
+
+        return len(messages)
+
+    def depth(self):
+        with self.cond:
+            return len(self.pending) + len(self.job_pending)
+
+    def message_ids(self):
+        with self.cond:
+            return set(message['id'] for (not_before, seq, message) in self.pending + self.job_pending)
+
+    def take_batch(self):
+        with self.cond:
+            while True:
+                heads = [heap[0][0] for heap in (self.pending, self.job_pending) if heap]
+                if heads:
+                    wait = min(heads) - time.time()
+                    if wait <= 0:
+                        break
+                    self.cond.wait(wait)
+                else:
+                    self.cond.wait()
+
+            batch = []
+            now = time.time()
+            while self.pending and self.pending[0][0] <= now and len(batch) < self.batch_size:
+                batch.append(heapq.heappop(self.pending)[2])
+            if batch:
+                return batch
+
+            size = self.batch_size
+            if self.broadcaster.limiter.rate:
+                size = max(1, min(size, int(self.broadcaster.limiter.rate)))
+            while self.job_pending and self.job_pending[0][0] <= now and len(batch) < size:
+                batch.append(heapq.heappop(self.job_pending)[2])
+            return batch
+
+    def dispatch(self, batch):
+        # body -> rounds of number -> message. the same text twice to one number is two texts, so the
+        # second goes in a later round rather than being sent once for both.
+        by_body = {}
+        for message in batch:
+            rounds = by_body.setdefault(message['body'], [])
+            for by_number in rounds:
+                if message['to'] not in by_number:
+                    break
+            else:
+                by_number = {}
+                rounds.append(by_number)
+            by_number[message['to']] = message
+
+        entries = []
+        retries = []
+        finished = []
+        segments = 0
+        for body, rounds in by_body.items():
+            body_segments = segment_count(body)
+            for by_number in rounds:
+                if self.bulk is not None and len(by_number) > 1:
+                    results = self.bulk(by_number.keys(), body)
+                else:
+                    results = self.broadcaster.run(by_number.keys(), body).results
+
+                for (number, error) in results:
+                    message = by_number[number]
+                    if error is None:
+                        entries.append(['done', message['id']])
+                        finished.append((message, None))
+                        segments += body_segments
+                    elif is_transient(error) and message['attempt'] + 1 < self.max_attempts:
+                        message['attempt'] += 1
+                        message['not_before'] = time.time() + self.backoff * 2 ** (message['attempt'] - 1)
+                        entries.append(['put', message])
+                        retries.append(message)
+                    else:
+                        # on_done hears about it
+                        entries.append(['done', message['id']])
+                        finished.append((message, error))
+
+        failed = sum(1 for (message, error) in finished if error is not None)
+        metrics.SMS_SENT.inc(amount=len(finished) - failed)
+        metrics.SMS_SEGMENTS.inc(amount=segments)
+        metrics.SMS_FAILED.inc('no', amount=failed)
+        metrics.SMS_FAILED.inc('yes', amount=len(retries))
+
+        with self.cond:
+            self.write_journal(entries)
+            for message in retries:
+                self.push(message)
+            # nothing is in flight right now, so the heap is everything that's outstanding
+            if self.journal_lines > 2 * (len(self.pending) + len(self.job_pending)) + 1000:
+                self.compact()
+
+        if self.on_done is not None:
+            self.on_done(finished)
+
+    def run(self):
+        while True:
+            batch = self.take_batch()
+            try:
+                self.dispatch(batch)
+            except:
+                import traceback
+                traceback.print_exc()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
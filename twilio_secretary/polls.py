@@ -0,0 +1,109 @@
+import base64
+import struct
+
+from twilio_api.numbers import E164, to_int, from_int
+
+OPEN = 'open'
+CLOSED = 'closed'
+# answers are archived a byte each
+MAX_ANSWERS = 255
+
+
+def pack_numbers(numbers):
+    # E.164 numbers as little endian 64 bit integers
+    return base64.b64encode(struct.pack('<%dQ' % len(numbers), *[to_int(n) for n in numbers]))
+
+
+def unpack_numbers(packed):
+    raw = base64.b64decode(packed)
+    return [from_int(n) for n in struct.unpack('<%dQ' % (len(raw) / 8), raw)]
+
+
+class Poll(object):
+    """
+    A question with numbered answers. Besides who answered what, keeps a running count and set of
+    respondents for each answer so summaries don't have to go through every response.
+
+    A poll is open until it's closed; after that it only takes up space in the archive, where who
+    answered what is kept as two arrays (numbers and answers) instead of a dict.
+    """
+
+    def __init__(self, question, answers, responses=None, opened=None, state=OPEN, closed=None):
+        if len(answers) > MAX_ANSWERS:
+            raise ValueError('a poll can have at most %d answers' % MAX_ANSWERS)
+        self.question = question
+        self.answers = answers
+        self.opened = opened
+        self.state = state
+        self.closed = closed
+        # number -> answer, 0 based
+        self.responses = {}
+        self.counts = [0 for a in answers]
+        self.respondents = [set() for a in answers]
+
+        for (number, answer_number) in (responses or {}).items():
+            self.answer(number, answer_number)
+
+    @classmethod
+    def from_doc(cls, doc):
+        return cls(doc['question'], doc['answers'], doc['responses'], opened=doc.get('opened'),
+                   state=doc.get('state', OPEN), closed=doc.get('closed'))
+
+    def to_doc(self):
+        return {
+            'question': self.question,
+            'answers': list(self.answers),
+            'responses': dict(self.responses),
+            'opened': self.opened,
+            'state': self.state,
+            'closed': self.closed,
+        }
+
+    @classmethod
+    def from_archive(cls, doc):
+        voters = unpack_numbers(doc['voters']) + doc.get('other_voters', [])
+        votes = bytearray(base64.b64decode(doc['votes']))
+        return cls(doc['question'], doc['answers'], dict(zip(voters, votes)), opened=doc['opened'], state=CLOSED,
+                   closed=doc['closed'])
+
+    def to_archive(self):
+        # numbers that aren't E.164 (short codes, say) can't be packed, so they're kept as they are.
+        # votes are in the same order as voters and then other_voters.
+        voters = [number for number in self.responses if E164.match(number)]
+        others = [number for number in self.responses if not E164.match(number)]
+        return {
+            'question': self.question,
+            'answers': self.answers,
+            'opened': self.opened,
+            'closed': self.closed,
+            'tallies': self.counts,
+            'voters': pack_numbers(voters),
+            'other_voters': others,
+            'votes': base64.b64encode(str(bytearray([self.responses[v] for v in voters + others]))),
+        }
+
+    def is_open(self):
+        return self.state == OPEN
+
+    def close(self, when):
+        self.state = CLOSED
+        self.closed = when
+
+    def text(self):
+        return "Poll: %s\n%s\nReply with answer number to vote" % (self.question, '\n'.join([
+            '%d: %s' % (i + 1, self.answers[i])
+            for i in range(len(self.answers))
+        ]))
+
+    def has_answered(self, number):
+        return number in self.responses
+
+    def answer(self, number, answer_number):
+        existing_answer = self.responses.get(number)
+        if existing_answer is not None:
+            self.counts[existing_answer] -= 1
+            self.respondents[existing_answer].discard(number)
+
+        self.responses[number] = answer_number
+        self.counts[answer_number] += 1
+        self.respondents[answer_number].add(number)
@@ -0,0 +1,48 @@
+import time
+import heapq
+import threading
+
+
+class Scheduler(object):
+    """
+    Calls fire(key) at (or as soon as it can after) the time each key was added for. The thread sleeps
+    until the earliest one is due, or until something earlier is added.
+    """
+
+    def __init__(self, fire):
+        self.fire = fire
+        self.cond = threading.Condition()
+        # heap of tuples of when, key
+        self.pending = []
+        self.thread = None
+
+    def add(self, when, key):
+        with self.cond:
+            heapq.heappush(self.pending, (when, key))
+            if self.pending[0][1] == key:
+                self.cond.notify()
+
+    def take_due(self):
+        with self.cond:
+            while True:
+                if self.pending:
+                    wait = self.pending[0][0] - time.time()
+                    if wait <= 0:
+                        return heapq.heappop(self.pending)[1]
+                    self.cond.wait(wait)
+                else:
+                    self.cond.wait()
+
+    def run(self):
+        while True:
+            key = self.take_due()
+            try:
+                self.fire(key)
+            except:
+                import traceback
+                traceback.print_exc()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
@@ -1,28 +1,72 @@
-import uuid
-import random
 import time
 import twilio_api
+from twilio_api import numbers
 import os
 import re
-import copy
+import uuid
 
 import json
+import atexit
+import itertools
 import threading
 
-from .datediff import differ
+from . import metrics
+from .datediff import differ, hm2sec, duration2sec, next_time_of_day, Bad, TIME_WORDS
+from .outbox import Outbox
+from .broadcast import THROUGHPUT_CLASSES, BroadcastResult, summary
+from .jobs import BroadcastJobs
+from .delivery import DeliveryLog
+from .flusher import Flusher
+from .scheduler import Scheduler
+from .backends import get_backend
+from .directory import NumberDirectory
+from .subscribers import SubscriberStore
+from .polls import Poll, MAX_ANSWERS
+from .segments import segment_count, fewest_segments
+from .commands import CommandRegistry, Usage, text_argument, two_arguments, optional_argument
+
+NOT_ALPHANUMERIC = re.compile('[^a-zA-Z0-9]')
+ALL_DIGITS = re.compile('^[0-9]+$')
+
+COMMANDS = CommandRegistry()
+
+twilio_api.Twilio.OBSERVE = staticmethod(metrics.observe_twilio)
 
 
 class SecretaryState(object):
-    LOCK = threading.Lock()
+    # each collection has its own lock, held by whatever is changing it. reading doesn't need the lock:
+    # collections are only changed by a single operation on them, or replaced whole (UPDATES).
+    # when more than one lock is needed, take them in the order of LOCKS.
+    SUBSCRIBERS_LOCK = threading.Lock()
+    UPDATES_LOCK = threading.Lock()
+    NAMES_LOCK = threading.Lock()
+    POLLS_LOCK = threading.Lock()
+    SCHEDULE_LOCK = threading.Lock()
+    LOCKS = [SUBSCRIBERS_LOCK, UPDATES_LOCK, NAMES_LOCK, POLLS_LOCK, SCHEDULE_LOCK]
+
+    # StateBackend the state is persisted to, and the records changed since it was last written.
+    # CHANGES_LOCK is only ever held on its own, briefly.
+    STORE = None
+    SAVE_LOCK = threading.Lock()
+    CHANGES = []
+    CHANGES_LOCK = threading.Lock()
     DIRTY = False
-
-    # set of text formatted phone numbers
-    SUBSCRIBERS = set()
-    # list of tuples of time, text
-    UPDATES = []
-    # list of tuples of number, name
-    NUMBER_MAP = []
-    # polls are like this:
+    # when set, saves in the background a little while after changes, instead of whoever made them saving
+    FLUSHER = None
+    # changes whenever something on the public updates page (updates, subscriber count) does
+    PAGE_VERSIONS = itertools.count(1)
+    PAGE_VERSION = 0
+
+    # SubscriberStore of text formatted phone numbers
+    SUBSCRIBERS = SubscriberStore()
+    # tuple of tuples of time, text; just the most recent UPDATES_RETAIN of them. older ones are
+    # put in ARCHIVE_PENDING until they're written to the backend's archive.
+    UPDATES = ()
+    UPDATES_RETAIN = 20
+    ARCHIVE_PENDING = []
+    # number <-> name, stored on disk as a list of [number, name]
+    NUMBER_MAP = NumberDirectory()
+    # list of Poll; just the open one, if there is one. stored on disk like this:
     """
     [
         {
@@ -31,121 +75,413 @@ class SecretaryState(object):
             'responses': {
                 '312.......': <integer answer, translated from based on 1 to base 0>,
                 ...
-            }
-        },
-        ...
+            },
+            'opened': <time>,
+            'state': 'open',
+            'closed': None
+        }
     ]
     """
     POLLS = []
+    # closed polls, until they're written to the backend's archive
+    POLL_ARCHIVE_PENDING = []
+    # commands to run later, id -> [time, command name, argument, number of the admin who sent it]
+    SCHEDULED = {}
+    # Scheduler that runs them, if one has been started
+    SCHEDULER = None
 
     @classmethod
     def to_doc(cls):
+        # callers hold all the LOCKS (or nothing else is running). everything in here is a copy, so it can
+        # be serialized after they're let go.
+        subscribers, subscribers_packed = cls.SUBSCRIBERS.to_doc()
         return {
-            'subscribers': list(cls.SUBSCRIBERS),
+            'subscribers': subscribers,
+            'subscribers_packed': subscribers_packed,
             'updates': [list(u) for u in cls.UPDATES],
-            'number_map': [list(nn) for nn in cls.NUMBER_MAP],
-            'polls': cls.POLLS
+            'number_map': cls.NUMBER_MAP.to_list(),
+            'polls': [poll.to_doc() for poll in cls.POLLS],
+            'scheduled': dict((job_id, list(job)) for (job_id, job) in cls.SCHEDULED.items()),
         }
 
     @classmethod
     def from_doc(cls, doc):
-        cls.SUBSCRIBERS = set(doc['subscribers'])
-        cls.UPDATES = [tuple(u) for u in doc['updates']]
-        cls.NUMBER_MAP = [tuple(nn) for nn in doc['number_map']]
+        # numbers from before they were all kept in E.164 are converted to it
+        cls.SUBSCRIBERS = SubscriberStore.load(numbers.keys(doc['subscribers']), doc.get('subscribers_packed'))
+        cls.UPDATES = ()
+        cls.add_updates([tuple(u) for u in doc['updates']])
+        names = doc['number_map']
+        cls.NUMBER_MAP = NumberDirectory(zip(numbers.keys([pair[0] for pair in names]), [pair[1] for pair in names]))
         if 'polls' in doc:
-            cls.POLLS = doc['polls']
+            polls = [Poll.from_doc(poll) for poll in doc['polls']]
+            # older state files kept every poll there ever was. the ones before the last are closed,
+            # and without a time they're told apart in the archive by where they were in the list.
+            for (i, poll) in enumerate(polls[:-1]):
+                if poll.is_open():
+                    poll.close(poll.opened or i)
+                cls.POLL_ARCHIVE_PENDING = cls.POLL_ARCHIVE_PENDING + [poll]
+            cls.POLLS = polls[-1:]
+        cls.SCHEDULED = dict(doc.get('scheduled', {}))
+        if cls.SCHEDULER is not None:
+            for (job_id, job) in cls.SCHEDULED.items():
+                cls.SCHEDULER.add(job[0], job_id)
         cls.DIRTY = False
+        cls.PAGE_VERSION = next(cls.PAGE_VERSIONS)
+
+    @classmethod
+    def from_disk(cls, lock=True):
+        """
+        Loads the state. Unless lock is False (to only read it), this process claims it first, and
+        StateLocked is raised if another process that can't share it with this one has.
+        """
+        settings = SecretarySettings.get_settings()
+        cls.UPDATES_RETAIN = settings.get('UPDATES_RETAIN', 20)
+        if cls.STORE is not None:
+            cls.STORE.unlock_state()
+        cls.STORE = get_backend(settings)
+        if lock:
+            cls.STORE.lock_state()
+        if cls.STORE.shared:
+            cls.share_locks()
+        doc, records = cls.STORE.load()
+        if doc is not None:
+            cls.from_doc(doc)
+        for record in records:
+            cls.apply(record)
+
+    @classmethod
+    def share_locks(cls):
+        # a change has to catch up on what other processes changed first, which can be anything, so with
+        # a shared backend one lock covers every collection
+        lock = threading.RLock()
+        cls.SUBSCRIBERS_LOCK = cls.UPDATES_LOCK = cls.NAMES_LOCK = cls.POLLS_LOCK = cls.SCHEDULE_LOCK = lock
+        cls.LOCKS = [lock]
+
+    @classmethod
+    def start_flusher(cls):
+        settings = SecretarySettings.get_settings()
+        debounce = settings.get('FLUSH_DEBOUNCE', 0.05)
+        if not debounce:
+            return
+        cls.FLUSHER = Flusher(cls.save, debounce=debounce, max_delay=settings.get('FLUSH_MAX_DELAY', 1.0))
+        cls.FLUSHER.start()
+        atexit.register(cls.FLUSHER.stop)
+
+    @classmethod
+    def apply(cls, record):
+        # numbers in records logged before they were all kept in E.164 are converted, like from_doc does
+        op, args = record[0], record[1:]
+        if op == 'subscribe':
+            cls.SUBSCRIBERS.add(numbers.key(args[0]))
+            cls.PAGE_VERSION = next(cls.PAGE_VERSIONS)
+        elif op == 'unsubscribe':
+            cls.SUBSCRIBERS.discard(numbers.key(args[0]))
+            cls.PAGE_VERSION = next(cls.PAGE_VERSIONS)
+        elif op == 'add_update':
+            cls.add_updates([(args[0], args[1])])
+            cls.PAGE_VERSION = next(cls.PAGE_VERSIONS)
+        elif op == 'add_poll':
+            opened = args[2] if len(args) > 2 else None
+            if cls.POLLS:
+                # only logged before polls were closed explicitly
+                cls.close_current_poll(opened or time.time())
+            cls.POLLS = [Poll(args[0], args[1], opened=opened)]
+        elif op == 'close_poll':
+            cls.close_current_poll(args[0])
+        elif op == 'answer_poll':
+            # another process can close the poll (and open the next one) before an answer to it is logged
+            if cls.POLLS and (len(args) < 3 or cls.POLLS[-1].opened == args[2]):
+                cls.POLLS[-1].answer(args[0], args[1])
+        elif op == 'name':
+            cls.NUMBER_MAP.set(numbers.key(args[0]), args[1])
+        elif op == 'import':
+            cls.SUBSCRIBERS.add_all(args[0])
+            for (number, name) in args[1]:
+                cls.NUMBER_MAP.set(number, name)
+            cls.PAGE_VERSION = next(cls.PAGE_VERSIONS)
+        elif op == 'schedule':
+            cls.SCHEDULED[args[0]] = list(args[1:])
+            if cls.SCHEDULER is not None:
+                cls.SCHEDULER.add(args[1], args[0])
+        elif op == 'unschedule':
+            cls.SCHEDULED.pop(args[0], None)
+        else:
+            raise ValueError('unknown state change %s' % op)
+
+    @classmethod
+    def add_updates(cls, updates):
+        # caller holds UPDATES_LOCK (or nothing else is running)
+        updates = cls.UPDATES + tuple(updates)
+        if len(updates) > cls.UPDATES_RETAIN:
+            cls.ARCHIVE_PENDING = cls.ARCHIVE_PENDING + list(updates[:-cls.UPDATES_RETAIN])
+            updates = updates[-cls.UPDATES_RETAIN:]
+        cls.UPDATES = updates
+
+    @classmethod
+    def take_archive(cls):
+        # caller holds UPDATES_LOCK
+        archive = cls.ARCHIVE_PENDING
+        cls.ARCHIVE_PENDING = []
+        return archive
+
+    @classmethod
+    def close_current_poll(cls, when):
+        # caller holds POLLS_LOCK (or nothing else is running)
+        if not cls.POLLS:
+            return
+        poll = cls.POLLS[-1]
+        poll.close(when)
+        cls.POLLS = []
+        cls.POLL_ARCHIVE_PENDING = cls.POLL_ARCHIVE_PENDING + [poll]
+
+    @classmethod
+    def change(cls, *record):
+        # caller holds the lock for the collection being changed, so changes to it are logged in order
+        if cls.STORE is not None and cls.STORE.shared:
+            # logged right away, after what other processes logged before it, so it's applied here in the
+            # same order as everywhere else. saving still archives and compacts.
+            cls.STORE.log(record, cls.catch_up)
+            with cls.CHANGES_LOCK:
+                cls.DIRTY = True
+        else:
+            cls.apply(record)
+            with cls.CHANGES_LOCK:
+                cls.CHANGES.append(record)
+                cls.DIRTY = True
+        if cls.FLUSHER is not None:
+            cls.FLUSHER.mark()
+
+    @classmethod
+    def take_changes(cls):
+        with cls.CHANGES_LOCK:
+            changes = cls.CHANGES
+            cls.CHANGES = []
+            cls.DIRTY = False
+            return changes
+
+    @classmethod
+    @metrics.SAVE_SECONDS.time()
+    def save(cls):
+        """
+        Writes out changes made since the last save. Returns how many there were.
+        """
+        with cls.SAVE_LOCK:
+            if cls.STORE is None:
+                cls.STORE = get_backend(SecretarySettings.get_settings())
+
+            if not cls.STORE.needs_compaction():
+                changes = cls.take_changes()
+                cls.STORE.append(changes)
+                with cls.UPDATES_LOCK:
+                    archive = cls.take_archive()
+                cls.STORE.archive_updates(archive)
+                # closed polls aren't changed any more, so they're serialized without the lock. they're
+                # only let go of once they're archived, so one that can't be isn't lost.
+                polls = cls.POLL_ARCHIVE_PENDING
+                cls.STORE.archive_polls([poll.to_archive() for poll in polls])
+                with cls.POLLS_LOCK:
+                    cls.POLL_ARCHIVE_PENDING = cls.POLL_ARCHIVE_PENDING[len(polls):]
+                return len(changes)
+
+            # the snapshot has to line up exactly with the end of the log, so nothing can change between
+            # logging the last changes and copying the state. the serializing and writing happens after.
+            for lock in cls.LOCKS:
+                lock.acquire()
+            try:
+                cls.apply_sync()
+                changes = cls.take_changes()
+                cls.STORE.append(changes)
+                # the snapshot won't have these any more
+                cls.STORE.archive_updates(cls.take_archive())
+                cls.STORE.archive_polls([poll.to_archive() for poll in cls.POLL_ARCHIVE_PENDING])
+                cls.POLL_ARCHIVE_PENDING = []
+                doc = cls.to_doc()
+            finally:
+                for lock in reversed(cls.LOCKS):
+                    lock.release()
+
+            cls.STORE.compact(doc)
+            return len(changes)
 
     @classmethod
-    def from_disk(cls):
-        fn = SecretarySettings.get_settings()['STORE_JSON']
-        if os.path.exists(fn):
-            cls.from_doc(json.load(open(fn)))
+    def sync(cls):
+        """
+        Applies changes other processes sharing the backend have made.
+        """
+        # the locks are only taken when there's something to apply, so reads don't wait for changes
+        if cls.STORE is None or not cls.STORE.shared or not cls.STORE.behind():
+            return
+
+        for lock in cls.LOCKS:
+            lock.acquire()
+        try:
+            cls.apply_sync()
+        finally:
+            for lock in reversed(cls.LOCKS):
+                lock.release()
+
+    @classmethod
+    def apply_sync(cls):
+        # caller holds all the LOCKS
+        doc, records = cls.STORE.sync()
+        cls.catch_up(doc, records)
+        if doc is not None:
+            # changes made here that aren't saved yet aren't in doc either
+            for record in cls.CHANGES:
+                cls.apply(record)
+            cls.DIRTY = bool(cls.CHANGES)
+
+    @classmethod
+    def catch_up(cls, doc, records):
+        # caller holds all the LOCKS
+        if doc is not None:
+            # too far behind, start over
+            cls.from_doc(doc)
+        for record in records:
+            cls.apply(record)
 
     @classmethod
     def remove_subscriber(cls, number):
-        with cls.LOCK:
+        with cls.SUBSCRIBERS_LOCK:
             if number in cls.SUBSCRIBERS:
-                cls.SUBSCRIBERS.remove(number)
-                cls.DIRTY = True
+                cls.change('unsubscribe', number)
                 return True
             else:
                 return False
 
     @classmethod
     def add_subscriber(cls, number):
-        with cls.LOCK:
+        with cls.SUBSCRIBERS_LOCK:
             if number in cls.SUBSCRIBERS:
                 return False
             else:
-                cls.SUBSCRIBERS.add(number)
-                cls.DIRTY = True
+                cls.change('subscribe', number)
                 return True
 
     @classmethod
-    def poll_text(cls, poll_structure):
-        return "Poll: %s\n%s\nReply with answer number to vote" % (poll_structure['question'], '\n'.join([
-            '%d: %s' % (i + 1, poll_structure['answers'][i])
-            for i in range(len(poll_structure['answers']))
-        ]))
+    def import_numbers(cls, store, names):
+        """
+        Subscribes a SubscriberStore of numbers and names numbers (a dict of number -> name) all in one
+        change. Returns how many of each weren't already.
+        """
+        with cls.SUBSCRIBERS_LOCK:
+            with cls.NAMES_LOCK:
+                existing = set(cls.SUBSCRIBERS.packed)
+                subscribers = [numbers.from_int(n) for n in store.packed if n not in existing]
+                subscribers += [number for number in store.others if number not in cls.SUBSCRIBERS]
+                names = [[number, name] for (number, name) in names.items()
+                         if cls.NUMBER_MAP.name_of(number) != name]
+                if subscribers or names:
+                    cls.change('import', subscribers, names)
+                return len(subscribers), len(names)
+
+    @classmethod
+    def subscribers(cls):
+        """
+        Returns a snapshot of the subscribers, which stays the same while they change.
+        """
+        return cls.SUBSCRIBERS.snapshot()
 
     @classmethod
     def add_poll(cls, question, answers):
-        with cls.LOCK:
-            poll_structure = {
-                'question': question,
-                'answers': answers,
-                'responses': {},
-            }
-            cls.POLLS.append(poll_structure)
-            cls.DIRTY = True
-            return cls.poll_text(poll_structure)
-
-    @classmethod
-    def get_poll(cls):
-        with cls.LOCK:
-            if len(cls.POLLS) > 0:
-                return copy.deepcopy(cls.POLLS[-1])
-            else:
+        with cls.POLLS_LOCK:
+            now = time.time()
+            if cls.POLLS:
+                cls.change('close_poll', now)
+            cls.change('add_poll', question, answers, now)
+            return cls.POLLS[-1].text()
+
+    @classmethod
+    def close_poll(cls):
+        """
+        Closes the current poll and returns its question, or None if there is no poll open.
+        """
+        with cls.POLLS_LOCK:
+            if len(cls.POLLS) == 0:
+                return None
+            question = cls.POLLS[-1].question
+            cls.change('close_poll', time.time())
+            return question
+
+    @classmethod
+    def poll_prompt(cls, phone_number):
+        # text of the current poll, if there is one this number hasn't answered yet
+        with cls.POLLS_LOCK:
+            if len(cls.POLLS) > 0 and not cls.POLLS[-1].has_answered(phone_number):
+                return cls.POLLS[-1].text()
+
+    @classmethod
+    def poll_tallies(cls, detailed=False):
+        """
+        Returns question, answers, count for each answer and (if detailed) set of numbers for each answer
+        for the current poll, or None if there is no poll.
+        """
+        with cls.POLLS_LOCK:
+            if len(cls.POLLS) == 0:
                 return None
+            return cls.tallies_of(cls.POLLS[-1], detailed)
+
+    @classmethod
+    def tallies_of(cls, poll, detailed):
+        respondents = None
+        if detailed:
+            respondents = [set(r) for r in poll.respondents]
+        return poll.question, list(poll.answers), list(poll.counts), respondents
+
+    @classmethod
+    def archived_polls(cls, count=5):
+        """
+        Returns id, question and number of responses for up to count closed polls, newest first.
+        """
+        if cls.STORE is None:
+            return []
+        return [(doc['id'], doc['question'], sum(doc['tallies'])) for doc in cls.STORE.archived_polls(count)]
+
+    @classmethod
+    def archived_poll_tallies(cls, poll_id, detailed=False):
+        """
+        Like poll_tallies, for the closed poll with id poll_id.
+        """
+        doc = cls.STORE.archived_poll(poll_id) if cls.STORE is not None else None
+        if doc is None:
+            return None
+        if not detailed:
+            return doc['question'], doc['answers'], doc['tallies'], None
+        return cls.tallies_of(Poll.from_archive(doc), detailed)
 
     @classmethod
     def answer_poll(cls, phone_number, answer_number):
-        with cls.LOCK:
+        with cls.POLLS_LOCK:
             if len(cls.POLLS) == 0:
                 return 'There is no poll to answer. Text HELP for help.'
 
             poll = cls.POLLS[-1]
 
-            if answer_number < 1 or answer_number > len(poll['answers']):
-                return 'Poll answers range from %d to %d.. sorry.' % (1, len(poll['answers']))
+            if answer_number < 1 or answer_number > len(poll.answers):
+                return 'Poll answers range from %d to %d.. sorry.' % (1, len(poll.answers))
 
             # 0 base
             answer_number -= 1
 
-            existing_answer = poll['responses'].get(phone_number)
+            existing_answer = poll.responses.get(phone_number)
 
             if existing_answer is None:
-                poll['responses'][phone_number] = answer_number
-                cls.DIRTY = True
+                cls.change('answer_poll', phone_number, answer_number, poll.opened)
                 return 'OK!'
             elif existing_answer == answer_number:
                 return 'That was already your answer :)'
             else:
-                poll['responses'][phone_number] = answer_number
-                cls.DIRTY = True
+                cls.change('answer_poll', phone_number, answer_number, poll.opened)
                 return 'OK, changed your answer!'
 
     @classmethod
     def subscriber_count(cls):
-        with cls.LOCK:
-            return len(cls.SUBSCRIBERS)
+        return len(cls.SUBSCRIBERS)
 
     @classmethod
     def add_update(cls, update_text):
-        with cls.LOCK:
-            cls.UPDATES.append((time.time(), update_text))
-            cls.DIRTY = True
+        with cls.UPDATES_LOCK:
+            cls.change('add_update', time.time(), update_text)
 
     @classmethod
     def format_update(cls, update):
@@ -154,93 +490,99 @@ class SecretaryState(object):
 
     @classmethod
     def current_update(cls):
-        if len(cls.UPDATES) == 0:
+        updates = cls.UPDATES
+        if len(updates) == 0:
             return 'There is no info saved right now.'
         else:
-            with cls.LOCK:
-                return cls.format_update(cls.UPDATES[-1])
+            return cls.format_update(updates[-1])
 
     @classmethod
     def recent_updates(cls, count=3):
-        with cls.LOCK:
-            updates = cls.UPDATES[-count:]
-            updates.reverse()
-            return updates
+        updates = list(cls.UPDATES[-count:])
+        updates.reverse()
+        return updates
+
+    @classmethod
+    def updates_before(cls, before, count=5):
+        """
+        Returns up to count updates from before the time before, newest first, going to the archive if
+        the ones in memory don't go back far enough.
+        """
+        updates = [u for u in reversed(cls.UPDATES) if u[0] < before][:count]
+        if len(updates) < count and cls.STORE is not None:
+            oldest = updates[-1][0] if updates else before
+            updates += cls.STORE.archived_updates(oldest, count - len(updates))
+        return updates
 
     @classmethod
     def get_number_name(cls, number, generate_name=True):
-        with cls.LOCK:
-            seen_names = set()
-            for (stored_number, stored_name) in cls.NUMBER_MAP:
-                if number == stored_number:
-                    return stored_name
-                seen_names.add(stored_name.lower())
-
-            if not generate_name:
-                return None
+        name = cls.NUMBER_MAP.name_of(number)
+        if name is not None or not generate_name:
+            return name
+
+        with cls.NAMES_LOCK:
+            name = cls.NUMBER_MAP.name_of(number)
+            if name is not None:
+                return name
 
-            namefrags = ['red', 'pup', 'rocket', 'turtle', 'blue']
-            random.shuffle(namefrags)
             # ok we didn't get a name for this person.
-            name = None
-            for i in range(1, 1000):
-                for prefix in namefrags:
-                    potential_name = '%s%d' % (prefix, i)
-                    if potential_name not in seen_names:
-                        name = potential_name
-                        break
-                if name is not None:
-                    break
-
-            if name is None:
-                name = str(uuid.uuid4())[0:8]
-
-            cls.NUMBER_MAP.append((number, name))
-            cls.DIRTY = True
+            name = cls.NUMBER_MAP.generate_name()
+            cls.change('name', number, name)
 
             return name
 
     @classmethod
     def rename(cls, old_name, new_name):
-        with cls.LOCK:
-            old_name = old_name.lower()
-            for i in range(len(cls.NUMBER_MAP)):
-                existing_number, existing_name = cls.NUMBER_MAP[i]
-                if old_name.lower() == existing_name.lower():
-                    cls.NUMBER_MAP[i] = (existing_number, new_name)
-                    cls.DIRTY = True
-                    return True
-            return False
+        with cls.NAMES_LOCK:
+            number = cls.NUMBER_MAP.number_of(old_name)
+            if number is None:
+                return False
+            cls.change('name', number, new_name)
+            return True
 
     @classmethod
     def name(cls, number, name):
-        for i in range(len(cls.NUMBER_MAP)):
-            existing_number, existing_name = cls.NUMBER_MAP[i]
-            if number == existing_number:
-                cls.NUMBER_MAP[i] = (existing_number, name)
-                cls.DIRTY = True
-                return True
-        cls.NUMBER_MAP.append((number, name))
-        cls.DIRTY = True
-        return True
+        with cls.NAMES_LOCK:
+            cls.change('name', number, name)
+            return True
 
     @classmethod
-    def sanitize_number(cls, num):
-        num = re.compile('[^0-9]').sub('', num)
-        nlen = len(num)
-        if nlen < 11:
-            return num
+    def schedule(cls, when, command, argument, from_number):
+        """
+        Saves a command to be run at the time when, and returns its id.
+        """
+        with cls.SCHEDULE_LOCK:
+            job_id = uuid.uuid4().hex[:6]
+            cls.change('schedule', job_id, when, command, argument, from_number)
+            return job_id
+
+    @classmethod
+    def unschedule(cls, job_id):
+        """
+        Takes a scheduled command out of the schedule and returns it, or None if there's no such command
+        (any more).
+        """
+        with cls.SCHEDULE_LOCK:
+            job = cls.SCHEDULED.get(job_id)
+            if job is None:
+                return None
+            if cls.STORE is not None and not cls.STORE.claim('unschedule %s' % job_id):
+                # another process sharing the state got to it first, and will log taking it out
+                return None
+            cls.change('unschedule', job_id)
+            return job
 
-        if nlen == 11 and num[0] == '1':
-            return num[1:]
+    @classmethod
+    def scheduled(cls):
+        return sorted(cls.SCHEDULED.items(), key=lambda item: item[1][0])
 
-        return num
+    @classmethod
+    def sanitize_number(cls, num):
+        return numbers.key(num)
 
     @classmethod
     def get_name_number(cls, name):
-        for (stored_number, stored_name) in cls.NUMBER_MAP:
-            if name.lower() == stored_name.lower():
-                return stored_number
+        return cls.NUMBER_MAP.number_of(name)
 
 
 class SecretarySettings(object):
@@ -251,47 +593,163 @@ class SecretarySettings(object):
     def get_settings(cls):
         if cls.SETTINGS_DATA is None:
             with cls.SETTINGS_RDLOCK:
-                cls.SETTINGS_DATA = json.load(open(os.getenv('SETTINGS_JSON')))
+                settings = json.load(open(os.getenv('SETTINGS_JSON')))
+                settings['MASTERS'] = cls.check_masters(settings['MASTERS'])
+                cls.SETTINGS_DATA = settings
         return cls.SETTINGS_DATA
 
+    @classmethod
+    def check_masters(cls, masters):
+        """
+        Returns MASTERS in the same form as the numbers texts come from, so they're recognised.
+        """
+        for (number, normalized) in zip(masters, numbers.normalize_all(masters)):
+            if normalized is None:
+                print 'MASTERS has %s in it, which isn\'t a phone number' % number
+        return numbers.keys(masters)
+
 
 class TwilioSecretary(twilio_api.Twilio):
+    # one outbox per process, shared by every TwilioSecretary, and the broadcasts going through it
+    OUTBOX = None
+    JOBS = None
+    # delivery status callbacks, also one per process
+    DELIVERY = None
+    DELIVERY_LOCK = threading.Lock()
+    OUTBOX_LOCK = threading.Lock()
+    # help texts to send, by whether they're for an admin and MASTERS_NAME
+    HELP_TEXTS = {}
 
     def __init__(self):
         twilio_api.Twilio.__init__(self, SecretarySettings.get_settings())
 
-    def write_if_dirty(self):
-        with SecretaryState.LOCK:
-            if SecretaryState.DIRTY:
-                fn = self.settings['STORE_JSON']
-                fn_inprog = fn + '.inprog-%s' % str(uuid.uuid4())
-                fh = open(fn_inprog, 'w')
+    def send_sms(self, to, text):
+        # looked up every time rather than when this was made, which might have been before a fork
+        self.outbox = self.get_outbox()
+        return twilio_api.Twilio.send_sms(self, to, text)
 
-                json.dump(SecretaryState.to_doc(), fh)
-                fh.close()
+    @classmethod
+    def get_outbox(cls):
+        with cls.OUTBOX_LOCK:
+            if cls.OUTBOX is None:
+                settings = SecretarySettings.get_settings()
+                sender = twilio_api.Twilio(settings)
+                cls.OUTBOX = Outbox(sender.deliver_sms, settings['STORE_JSON'] + '.outbox',
+                                    concurrency=settings.get('BROADCAST_CONCURRENCY', 8),
+                                    rate=settings.get('BROADCAST_RATE',
+                                                      THROUGHPUT_CLASSES.get(settings.get('NUMBER_CLASS'))),
+                                    burst=settings.get('BROADCAST_BURST', 1),
+                                    max_attempts=settings.get('OUTBOX_MAX_ATTEMPTS', 5),
+                                    backoff=settings.get('OUTBOX_BACKOFF', 2.0),
+                                    bulk=sender.bulk_send_sms if sender.bulk_enabled() else None,
+                                    fsync=settings.get('STATE_FSYNC', True))
+                cls.JOBS = BroadcastJobs(cls.OUTBOX, cls.OUTBOX.journal_fn + '.jobs',
+                                         shard_size=settings.get('BROADCAST_SHARD_SIZE', 1000))
+                cls.OUTBOX.on_done = cls.on_sent
+                cls.JOBS.resume()
+                cls.JOBS.start_thread()
+                cls.OUTBOX.start()
+            return cls.OUTBOX
+
+    @classmethod
+    def on_sent(cls, finished):
+        # texts the outbox has sent or given up on, as tuples of message, error
+        result = BroadcastResult()
+        for (message, error) in finished:
+            result.record(message['to'], error)
+        for (number, error) in result.failures():
+            print 'giving up on sending to %s: %s' % (number, error)
+
+        for job in cls.JOBS.record(finished):
+            cls().send_sms_to_masters('Broadcast %s finished. %s' % (job.id, summary(job.sent, job.failed)))
+
+    @classmethod
+    def get_jobs(cls):
+        cls.get_outbox()
+        return cls.JOBS
+
+    @classmethod
+    def get_delivery(cls):
+        outbox = cls.get_outbox()
+        with cls.DELIVERY_LOCK:
+            if cls.DELIVERY is None:
+                settings = SecretarySettings.get_settings()
+                cls.DELIVERY = DeliveryLog(outbox.journal_fn + '.delivery', cls.prune_number,
+                                           prune_after=settings.get('PRUNE_AFTER_FAILURES', 3))
+                cls.DELIVERY.start()
+            return cls.DELIVERY
 
-                os.rename(fn_inprog, fn)
-                SecretaryState.DIRTY = False
+    @classmethod
+    def start_scheduler(cls):
+        SecretaryState.SCHEDULER = Scheduler(cls.run_scheduled)
+        for (job_id, job) in SecretaryState.scheduled():
+            SecretaryState.SCHEDULER.add(job[0], job_id)
+        SecretaryState.SCHEDULER.start()
+
+    @classmethod
+    def run_scheduled(cls, job_id):
+        SecretaryState.sync()
+        # whoever takes it out of the schedule runs it
+        job = SecretaryState.unschedule(job_id)
+        if job is None:
+            return
+
+        when, name, argument, from_number = job
+        tws = cls()
+        command = COMMANDS.lookup(name)
+        command.handler(tws, from_number, *command.parser(argument), scheduled=True)
+        tws.write_if_dirty()
+
+    def schedule_if_asked(self, name, from_number, argument):
+        """
+        If argument starts with AT [time of day, like 18:00] or IN [duration, like 90m, 2h or 1:30],
+        schedules the command to run with the rest of it then and returns True. Anything less clear than
+        that (IN 2 HOURS THE ROAD REOPENS) is what to send, not when.
+        """
+        frags = argument.split(' ', 2)
+        if len(frags) < 3 or frags[0].lower() not in ('at', 'in'):
+            return False
+        if frags[2].split(' ', 1)[0].lower().rstrip(',;:') in TIME_WORDS:
+            return False
 
-                print 'wrote json to disk'
+        try:
+            if frags[0].lower() == 'at':
+                when = next_time_of_day(hm2sec(frags[1]))
             else:
-                print 'nothing to write, no change'
+                when = time.time() + duration2sec(frags[1])
+        except Bad:
+            # just text that starts with 'at' or 'in'
+            return False
 
-    def broadcast_msg(self, argument):
-        sent = 0
-        failed_send = 0
-        for sub_number in SecretaryState.SUBSCRIBERS:
-            try:
-                self.send_sms(sub_number, argument)
-                sent += 1
-            except:
-                # TODO Log exception
-                failed_send += 1
-        send_msg = "Sent to %d subscribers." % sent
-        if failed_send > 0:
-            send_msg += " Failed to send to %d." % failed_send
+        job_id = SecretaryState.schedule(when, name, frags[2], from_number)
+        self.send_sms(from_number, 'Scheduled %s %s for %s, %s from now: "%s". Text CANCEL %s to cancel it.' % (
+            name.upper(), job_id, time.strftime('%H:%M', time.localtime(when)), differ(int(when - time.time())),
+            frags[2], job_id))
+        return True
+
+    @classmethod
+    def prune_number(cls, number):
+        if SecretaryState.remove_subscriber(number):
+            print 'unsubscribed %s, texts to it keep failing' % number
+            SecretaryState.save()
+
+    def write_if_dirty(self):
+        if SecretaryState.FLUSHER is not None:
+            # it'll get written soon enough
+            return
+
+        if SecretaryState.DIRTY:
+            changes = SecretaryState.save()
+
+            print 'wrote %d changes to disk' % changes
+        else:
+            print 'nothing to write, no change'
 
-        return send_msg
+    def broadcast_msg(self, argument):
+        job = self.get_jobs().start(SecretaryState.subscribers(), argument)
+        segments = segment_count(argument)
+        return "Queued for %d subscribers, %d segment%s each (%d in all). Text STATUS %s for progress." % (
+            job.total, segments, '' if segments == 1 else 's', job.total * segments, job.id)
 
     def get_descriptor(self, phone_number):
         sub_name = SecretaryState.get_number_name(phone_number, generate_name=False)
@@ -301,184 +759,260 @@ class TwilioSecretary(twilio_api.Twilio):
             return '%s (%s)' % (sub_name, phone_number)
 
     def poll_summary(self, detailed=False):
-        current_poll = SecretaryState.get_poll()
-        if current_poll is None:
+        tallies = SecretaryState.poll_tallies(detailed=detailed)
+        if tallies is None:
             return 'There is no poll to have responses.'
+        return self.format_tallies(tallies, detailed)
 
-        n_answers = len(current_poll['answers'])
-        respondents = [list() for i in range(n_answers)]
-        for phone_number, answer_number in current_poll['responses'].items():
-            descriptor = self.get_descriptor(phone_number)
-            respondents[answer_number].append(descriptor)
+    def format_tallies(self, tallies, detailed):
+        question, answers, counts, respondents = tallies
+        n_answers = len(answers)
 
         if detailed:
+            descriptors = [[self.get_descriptor(phone_number) for phone_number in respondents[anum]]
+                           for anum in range(n_answers)]
             response_text = '\n'.join([
-                '%d: %s: %s' % (anum + 1, current_poll['answers'][anum],
-                                ', '.join(respondents[anum]) if respondents[anum] else 'nobody')
+                '%d: %s: %s' % (anum + 1, answers[anum],
+                                ', '.join(descriptors[anum]) if descriptors[anum] else 'nobody')
                 for anum in range(n_answers)
             ])
         else:
             response_text = '\n'.join([
-                '%d: %s: %d responses' % (anum + 1, current_poll['answers'][anum], len(respondents[anum]))
+                '%d: %s: %d responses' % (anum + 1, answers[anum], counts[anum])
                 for anum in range(n_answers)
             ])
 
-        return '%s\n%s' % (current_poll['question'], response_text)
+        return '%s\n%s' % (question, response_text)
+
+    @COMMANDS.command('update', admin=True, parser=text_argument("Hey, give some text after Update to send an update."),
+                      help='UPDATE [AT 18:00 or IN 30m] [Followed by broadcast message]')
+    def on_update(self, from_number, argument, scheduled=False):
+        if not scheduled and self.schedule_if_asked('update', from_number, argument):
+            return
+
+        SecretaryState.add_update(argument)
+
+        reply_msg = self.broadcast_msg("Broadcast: " + argument)
+        self.send_sms(from_number, reply_msg)
+
+    @COMMANDS.command('tell', admin=True, parser=two_arguments("name and a message"),
+                      help='TELL [name] [message]')
+    def on_tell(self, from_number, name, text):
+        number = SecretaryState.get_name_number(name)
+        if number is None:
+            self.send_sms(from_number, "Sorry, I don't know who %s is." % name)
+            return
+
+        self.send_sms(number, text)
+
+    @COMMANDS.command('rename', admin=True, parser=two_arguments("oldname and newname"),
+                      help='RENAME [oldname] [newname]')
+    def on_rename(self, from_number, oldname, newname):
+        newname = newname.split(' ', 1)[0]  # in case we were silly and sent a name with a space in it
+        if SecretaryState.rename(oldname, newname):
+            self.send_sms(from_number, "Renamed %s to %s." % (oldname, newname))
+        else:
+            self.send_sms(from_number, "I don't know who %s is." % oldname)
+
+    @COMMANDS.command('name', admin=True, parser=two_arguments('number and name'),
+                      help='NAME [number] [name]')
+    def on_name(self, from_number, number, name):
+        number = SecretaryState.sanitize_number(number)
+        name = name.split(' ', 1)[0]  # in case we have a space in a name, cut it
+        if SecretaryState.name(number, name):
+            self.send_sms(from_number, "Stored name %s for number %s." % (name, number))
+
+    @COMMANDS.command('subscribers', admin=True, help='SUBSCRIBERS (lists subscribers)')
+    def on_subscribers(self, from_number):
+        subscribers = []
+        for sub_number in SecretaryState.subscribers():
+            sub_name = self.get_descriptor(sub_number)
+            subscribers.append(sub_name)
+
+        if not subscribers:
+            self.send_sms(from_number, 'There are no subscribers.')
+            return
+
+        for sub_text in fewest_segments(subscribers, ', '):
+            self.send_sms(from_number, sub_text)
+
+    @COMMANDS.command('poll', admin=True, parser=text_argument("Usage: poll question text? answer1 / answer2/answer3"))
+    def on_poll(self, from_number, argument, scheduled=False):
+        if not scheduled and self.schedule_if_asked('poll', from_number, argument):
+            return
+
+        last_q = argument.rfind('?')
+        question = argument[:last_q + 1]
+        answers = [a.strip() for a in argument[last_q + 1:].split('/')]
+        if len(answers) < 2:
+            self.send_sms(from_number, "You need at least 2 answers for the polll.")
+            return
+        if len(answers) > MAX_ANSWERS:
+            self.send_sms(from_number, "A poll can have at most %d answers." % MAX_ANSWERS)
+            return
+
+        poll_msg = SecretaryState.add_poll(question, answers)
+        reply_msg = self.broadcast_msg(poll_msg)
+        self.send_sms(from_number, reply_msg)
+
+    @COMMANDS.command('responses', admin=True, parser=optional_argument)
+    def on_responses(self, from_number, argument):
+        detailed = False
+        if argument:
+            if argument.strip().lower() == 'detail':
+                detailed = True
+        self.send_sms(from_number, self.poll_summary(detailed=detailed))
+
+    @COMMANDS.command('close', admin=True)
+    def on_close(self, from_number):
+        question = SecretaryState.close_poll()
+        if question is None:
+            self.send_sms(from_number, 'There is no poll open.')
+        else:
+            self.send_sms(from_number, 'Closed the poll: %s' % question)
+
+    @COMMANDS.command('polls', admin=True, parser=optional_argument)
+    def on_polls(self, from_number, argument):
+        if not argument:
+            polls = SecretaryState.archived_polls()
+            if not polls:
+                self.send_sms(from_number, 'There are no closed polls.')
+                return
+            self.send_sms(from_number, '\n'.join([
+                '%d: %s (%d responses)' % poll for poll in polls
+            ] + ['Text POLLS [number] for results']))
+            return
+
+        frags = argument.strip().lower().split()
+        if not ALL_DIGITS.match(frags[0]):
+            self.send_sms(from_number, 'Usage: polls [number] [detail]')
+            return
+
+        detailed = len(frags) > 1 and frags[1] == 'detail'
+        tallies = SecretaryState.archived_poll_tallies(int(frags[0]), detailed=detailed)
+        if tallies is None:
+            self.send_sms(from_number, "There is no closed poll %s." % frags[0])
+            return
+        self.send_sms(from_number, self.format_tallies(tallies, detailed))
+
+    @COMMANDS.command('scheduled', admin=True)
+    def on_scheduled(self, from_number):
+        jobs = SecretaryState.scheduled()
+        if not jobs:
+            self.send_sms(from_number, 'Nothing is scheduled.')
+            return
+
+        for text in fewest_segments(['%s at %s: %s %s' % (job_id, time.strftime('%H:%M', time.localtime(when)),
+                                                         name.upper(), argument)
+                                     for (job_id, (when, name, argument, admin)) in jobs], '\n'):
+            self.send_sms(from_number, text)
+
+    @COMMANDS.command('cancel', admin=True, parser=text_argument('Usage: cancel [id of scheduled command]'))
+    def on_cancel(self, from_number, argument):
+        job = SecretaryState.unschedule(argument.strip().lower())
+        if job is None:
+            self.send_sms(from_number, 'There is nothing scheduled called %s.' % argument)
+        else:
+            self.send_sms(from_number, 'Cancelled %s %s.' % (job[1].upper(), job[2]))
+
+    @COMMANDS.command('status', admin=True, parser=optional_argument)
+    def on_status(self, from_number, argument):
+        progress = self.get_jobs().progress(argument.strip().lower() if argument else None)
+        if progress is None:
+            self.send_sms(from_number, 'There is no broadcast %s.' % argument if argument else 'There are no broadcasts.')
+            return
+
+        self.send_sms(from_number, 'Broadcast %s: %d of %d sent, %d failed, %d queued, %d segments, %.1f texts/sec%s' % (
+            progress['id'], progress['sent'], progress['total'], progress['failed'], progress['queued'],
+            progress['segments'], progress['per_second'], ' (finished)' if progress['finished'] is not None else ''))
+
+    @COMMANDS.command('subscribe', help='SUBSCRIBE (Get text updates)')
+    def on_subscribe(self, from_number):
+        if SecretaryState.add_subscriber(from_number):
+            self.send_sms(from_number, "Subscribed. Current info: %s" % SecretaryState.current_update())
+            poll_text = SecretaryState.poll_prompt(from_number)
+            if poll_text is not None:
+                self.send_sms(from_number, poll_text)
+        else:
+            self.send_sms(from_number, "You are already subscribed!")
+
+    @COMMANDS.command('msg', parser=text_argument("Hey, give some text after MSG to send a message."),
+                      help='MSG [Followed by message for %(MASTERS_NAME)s]')
+    def on_msg(self, from_number, argument):
+        from_name = SecretaryState.get_number_name(from_number)
+        self.send_sms_to_masters("From %s (%s): %s" % (from_name, from_number, argument))
+        self.send_sms(from_number, "Passed that along for you!")
+
+    @COMMANDS.command('stop', help='STOP (Stop text updates)')
+    def on_stop(self, from_number):
+        if SecretaryState.remove_subscriber(from_number):
+            self.send_sms(from_number, "You are now unsubscribed!")
+        else:
+            self.send_sms(from_number, "You are already unsubscribed!")
+
+    @COMMANDS.command('info')
+    def on_info(self, from_number):
+        self.send_sms(from_number, SecretaryState.current_update())
+
+    def on_vote(self, from_number, answer_number):
+        self.send_sms(from_number, SecretaryState.answer_poll(from_number, answer_number))
+
+    def help_texts(self, is_admin):
+        key = (is_admin, self.settings['MASTERS_NAME'])
+        if key not in self.HELP_TEXTS:
+            lines = COMMANDS.help_lines(admin=False)
+            if is_admin:
+                lines += COMMANDS.help_lines(admin=True)
+            self.HELP_TEXTS[key] = fewest_segments([line % self.settings for line in ['Text options:'] + lines],
+                                                   '\n')
+        return self.HELP_TEXTS[key]
 
     def on_sms(self, from_number, text):
+        from_number = numbers.key(from_number)
         text = text.strip()
 
         print 'hey handling text from %s, text is %s' % (from_number, text)
 
-        send_help = False
+        start = time.time()
+        handled = self.handle_sms(from_number, text)
+        metrics.COMMAND_SECONDS.observe(time.time() - start, handled)
+
+    def handle_sms(self, from_number, text):
+        # returns what the text turned out to be, for the metrics
         is_admin = self.is_master(from_number)
 
         tokens = text.split(' ', 1)
-        if len(tokens) < 1 or tokens[0].lower() == 'help':
-            send_help = True
-
-        if not send_help:
-            command = re.compile('[^a-zA-Z0-9]').sub('', tokens[0].lower())
+        command = None
+        if tokens[0].lower() != 'help':
+            name = NOT_ALPHANUMERIC.sub('', tokens[0].lower())
+            command = COMMANDS.lookup(name)
 
             argument = None
             if len(tokens) == 2:
                 argument = tokens[1]
 
-            if command in ['update', 'tell', 'rename', 'name', 'subscribers', 'poll', 'responses']:
-                if not is_admin:
-                    self.send_sms(from_number, "You can't use that feature, sorry.")
-                    return
-
-                if command == 'update':
-                    if argument is None:
-                        self.send_sms(from_number, "Hey, give some text after Update to send an update.")
-                        return
-                    SecretaryState.add_update(argument)
-
-                    reply_msg = self.broadcast_msg("Broadcast: " + argument)
-                    self.send_sms(from_number, reply_msg)
-                    return
-                elif command == 'subscribers':
-                    subscribers = []
-                    for sub_number in SecretaryState.SUBSCRIBERS:
-                        sub_name = self.get_descriptor(sub_number)
-                        subscribers.append(sub_name)
-
-                    if not subscribers:
-                        self.send_sms(from_number, 'There are no subscribers.')
-                        return
-
-                    sub_text = subscribers[0]
-                    for subscriber in subscribers[1:]:
-                        if len(sub_text) + len(subscriber) + 2 > 160:
-                            self.send_sms(from_number, sub_text)
-                            sub_text = subscriber
-                        else:
-                            sub_text += ', ' + subscriber
-                    self.send_sms(from_number, sub_text)
-                    return
-                elif command == 'poll':
-                    if argument is None:
-                        self.send_sms(from_number, "Usage: poll question text? answer1 / answer2/answer3")
-                        return
-
-                    last_q = argument.rfind('?')
-                    question = argument[:last_q + 1]
-                    answers = [a.strip() for a in argument[last_q + 1:].split('/')]
-                    if len(answers) < 2:
-                        self.send_sms(from_number, "You need at least 2 answers for the polll.")
-                        return
-
-                    poll_msg = SecretaryState.add_poll(question, answers)
-                    reply_msg = self.broadcast_msg(poll_msg)
-                    self.send_sms(from_number, reply_msg)
-                    return
-                elif command == 'responses':
-                    detailed = False
-                    if argument:
-                        if argument.strip().lower() == 'detail':
-                            detailed = True
-                    self.send_sms(from_number, self.poll_summary(detailed=detailed))
-                    return
-                elif command in ['tell', 'rename', 'name']:
-                    arguments_needed = {
-                        'tell': "name and a message",
-                        'rename': "oldname and newname",
-                        'name': 'number and name'
-                    }[command]
-
-                    if argument is None:
-                        self.send_sms(from_number, "Send %s" % arguments_needed)
-                        return
-                    frags = argument.split(' ', 1)
-                    if len(frags) == 1:
-                        self.send_sms(from_number, "You have to send %s." % arguments_needed)
-                        return
-
-                    if command == 'tell':
-                        name, text = frags
-                        number = SecretaryState.get_name_number(name)
-                        if number is None:
-                            self.send_sms(from_number, "Sorry, I don't know who %s is." % name)
-                            return
-
-                        self.send_sms(number, text)
-                        return
-                    elif command == 'rename':
-                        oldname, newname = frags
-                        newname = newname.split(' ', 1)[0]  # in case we were silly and sent a name with a space in it
-                        if SecretaryState.rename(oldname, newname):
-                            self.send_sms(from_number, "Renamed %s to %s." % (oldname, newname))
-                        else:
-                            self.send_sms(from_number, "I don't know who %s is." % oldname)
-                        return
-                    elif command == 'name':
-                        number, name = frags
-                        number = SecretaryState.sanitize_number(number)
-                        name = name.split(' ', 1)[0]  # in case we have a space in a name, cut it
-                        if SecretaryState.name(number, name):
-                            self.send_sms(from_number, "Stored name %s for number %s." % (name, number))
-                        return
-            elif command == 'msg':
-                if argument is None:
-                    self.send_sms(from_number, "Hey, give some text after MSG to send a message.")
-                else:
-                    from_name = SecretaryState.get_number_name(from_number)
-                    self.send_sms_to_masters("From %s (%s): %s" % (from_name, from_number, argument))
-                    self.send_sms(from_number, "Passed that along for you!")
-                return
-            elif command == 'info':
-                self.send_sms(from_number, SecretaryState.current_update())
-                return
-            elif command == 'subscribe':
-                if SecretaryState.add_subscriber(from_number):
-                    self.send_sms(from_number, "Subscribed. Current info: %s" % SecretaryState.current_update())
-                    poll_structure = SecretaryState.get_poll()
-                    if poll_structure is not None:
-                        if from_number not in poll_structure['responses']:
-                            self.send_sms(from_number, SecretaryState.poll_text(poll_structure))
-                else:
-                    self.send_sms(from_number, "You are already subscribed!")
-                return
-            elif command == 'stop':
-                if SecretaryState.remove_subscriber(from_number):
-                    self.send_sms(from_number, "You are now unsubscribed!")
-                else:
-                    self.send_sms(from_number, "You are already unsubscribed!")
-                return
-            elif re.compile('^[0-9]+$').match(command):
-                answer_number = int(command)
-                self.send_sms(from_number, SecretaryState.answer_poll(from_number, answer_number))
-                return
+            if command is None and ALL_DIGITS.match(name):
+                self.on_vote(from_number, int(name))
+                return 'vote'
+
+        if command is None:
+            print 'sending help to %s' % from_number
+            for help_text in self.help_texts(is_admin):
+                self.send_sms(from_number, help_text)
+            return 'help'
 
-        help_text = 'Text options:\nSUBSCRIBE (Get text updates)\nMSG [Followed by message for %s]\nSTOP (Stop text updates)' % self.settings[
-            'MASTERS_NAME']
+        if command.admin and not is_admin:
+            self.send_sms(from_number, "You can't use that feature, sorry.")
+            return 'denied'
 
-        if is_admin:
-            help_text += '\nUPDATE [Followed by broadcast message]\nTELL [name] [message]\nRENAME [oldname] [newname]\nNAME [number] [name]\nSUBSCRIBERS (lists subscribers)'
+        try:
+            arguments = command.parser(argument)
+        except Usage, e:
+            self.send_sms(from_number, str(e))
+            return command.name
 
-        print 'sending help to %s' % from_number
-        self.send_sms(from_number, help_text)
+        command.handler(self, from_number, *arguments)
+        return command.name
 
     def is_master(self, number):
         return number in self.settings['MASTERS']
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+How many segments (what carriers bill for, and rate limit) a text takes. A text that's all GSM-7
+characters fits 160 of them in one segment, or 153 in each segment when it's split into several; one
+with anything else in it is sent as UCS-2, 70 UTF-16 units in one segment or 67 in each of several.
+"""
+GSM7 = frozenset(u'@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !"#¤%&\'()*+,-./0123456789:;<=>?¡'
+                 u'ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà')
+# these take an escape character as well, so two septets each
+GSM7_EXTENSION = frozenset(u'^{}\\[~]|€\f')
+
+GSM7_ENCODING = 'GSM-7'
+UCS2_ENCODING = 'UCS-2'
+# characters in one segment, and in each of several
+LIMITS = {
+    GSM7_ENCODING: (160, 153),
+    UCS2_ENCODING: (70, 67),
+}
+
+
+def to_unicode(text):
+    if isinstance(text, str):
+        return text.decode('utf-8')
+    return text
+
+
+def encoding(text):
+    for c in to_unicode(text):
+        if c not in GSM7 and c not in GSM7_EXTENSION:
+            return UCS2_ENCODING
+    return GSM7_ENCODING
+
+
+def widths(text, text_encoding):
+    """
+    Returns how many units (septets or UTF-16 code units) each character takes. Characters are never
+    split between segments.
+    """
+    text = to_unicode(text)
+    if text_encoding == GSM7_ENCODING:
+        return [2 if c in GSM7_EXTENSION else 1 for c in text]
+
+    result = []
+    i = 0
+    while i < len(text):
+        code = ord(text[i])
+        if 0xD800 <= code < 0xDC00 and i + 1 < len(text):
+            # a surrogate pair, on narrow builds
+            result.append(2)
+            i += 2
+            continue
+        result.append(2 if code > 0xFFFF else 1)
+        i += 1
+    return result
+
+
+def segment_count(text):
+    text_encoding = encoding(text)
+    single, each = LIMITS[text_encoding]
+    units = widths(text, text_encoding)
+    if sum(units) <= single:
+        return 1
+
+    segments = 1
+    filled = 0
+    for width in units:
+        if filled + width > each:
+            segments += 1
+            filled = 0
+        filled += width
+    return segments
+
+
+def length(text, text_encoding):
+    return sum(widths(text, text_encoding))
+
+
+def pack(items, separator):
+    """
+    Joins items with separator into as few texts as fit in a segment each. Items that need UCS-2 go
+    together after the others, so they don't make the others UCS-2 too. An item too long for a segment
+    of its own gets a text (of several segments) to itself.
+    """
+    gsm = [item for item in items if encoding(item) == GSM7_ENCODING]
+    ucs = [item for item in items if encoding(item) != GSM7_ENCODING]
+
+    texts = []
+    for (group, text_encoding) in [(gsm, GSM7_ENCODING), (ucs, UCS2_ENCODING)]:
+        limit = LIMITS[text_encoding][0]
+        separator_length = length(separator, text_encoding)
+        current = []
+        current_length = 0
+        for item in group:
+            item_length = length(item, text_encoding)
+            if current and current_length + separator_length + item_length > limit:
+                texts.append(separator.join(current))
+                current = []
+                current_length = 0
+            if current:
+                current_length += separator_length
+            current.append(item)
+            current_length += item_length
+        if current:
+            texts.append(separator.join(current))
+    return texts
+
+
+def fewest_segments(items, separator):
+    """
+    Returns the texts to send items in, either joined into one text or packed into several, whichever
+    is fewer segments altogether (one text if it's a tie, since several may arrive out of order).
+    """
+    joined = separator.join(items)
+    packed = pack(items, separator)
+    if sum(segment_count(text) for text in packed) < segment_count(joined):
+        return packed
+    return [joined]
@@ -0,0 +1,127 @@
+import sys
+import array
+import base64
+import bisect
+import struct
+
+from twilio_api.numbers import E164, E164_LINES, to_int, from_int, to_ints
+
+# E.164 numbers are at most 15 digits, which needs 64 bits
+TYPECODE = 'L' if array.array('L').itemsize >= 8 else 'd'
+
+
+def to_bytes(packed):
+    # little endian 64 bit integers, like polls.pack_numbers
+    if TYPECODE == 'L' and sys.byteorder == 'little':
+        return packed.tostring()
+    return struct.pack('<%dQ' % len(packed), *[int(n) for n in packed])
+
+
+def from_bytes(raw):
+    if TYPECODE == 'L' and sys.byteorder == 'little':
+        packed = array.array(TYPECODE)
+        packed.fromstring(raw)
+        return packed
+    return array.array(TYPECODE, struct.unpack('<%dQ' % (len(raw) / 8), raw))
+
+
+class SubscriberStore(object):
+    """
+    A set of phone numbers. E.164 ones (which should be all of them) are kept sorted as 64 bit integers
+    in an array; anything else goes in a plain set on the side.
+
+    Changing it makes new arrays rather than changing the old ones, so snapshot() is free and whatever
+    is going through a snapshot isn't affected by numbers being added or removed.
+    """
+
+    def __init__(self, numbers=(), packed=None, others=None):
+        if packed is None:
+            numbers = list(numbers)
+            text = '\n'.join(numbers)
+            if E164_LINES.match(text + '\n'):
+                # all E.164 (as they should be), so they can be packed in one go
+                packed = array.array(TYPECODE, sorted(set(to_ints(numbers))))
+                others = frozenset()
+            else:
+                packed = array.array(TYPECODE, sorted(set(to_int(n) for n in numbers if E164.match(n))))
+                others = frozenset(n for n in numbers if not E164.match(n))
+        self.packed = packed
+        self.others = others
+
+    @classmethod
+    def load(cls, numbers, packed=None):
+        """
+        Makes a store from what to_doc returned: a list of numbers, and the rest (if any) as one string
+        of packed integers, which is a lot quicker to read than a list of a million numbers.
+        """
+        store = cls(numbers)
+        if packed:
+            loaded = from_bytes(base64.b64decode(packed))
+            if store.packed:
+                loaded = array.array(TYPECODE, sorted(set(loaded).union(store.packed)))
+            store.packed = loaded
+        return store
+
+    def to_doc(self):
+        return list(self.others), base64.b64encode(to_bytes(self.packed))
+
+    def __len__(self):
+        return len(self.packed) + len(self.others)
+
+    def __contains__(self, number):
+        if not E164.match(number):
+            return number in self.others
+        packed, n = self.packed, to_int(number)
+        i = bisect.bisect_left(packed, n)
+        return i < len(packed) and packed[i] == n
+
+    def __iter__(self):
+        packed, others = self.packed, self.others
+        for n in packed:
+            yield from_int(n)
+        for number in others:
+            yield number
+
+    def to_list(self):
+        return list(self)
+
+    def snapshot(self):
+        return SubscriberStore(packed=self.packed, others=self.others)
+
+    def shards(self, size, start=0):
+        """
+        Splits a snapshot into lists of up to size numbers, from the start'th one on. The numbers that
+        aren't E.164 come last, sorted, so every snapshot of the same numbers has them in the same order.
+        """
+        packed = self.packed
+        for first in xrange(start, len(packed), size):
+            yield [from_int(n) for n in packed[first:first + size]]
+        others = sorted(self.others)[max(0, start - len(packed)):]
+        if others:
+            yield others
+
+    def add(self, number):
+        if not E164.match(number):
+            self.others = self.others | frozenset([number])
+            return
+        packed, n = self.packed, to_int(number)
+        i = bisect.bisect_left(packed, n)
+        if i < len(packed) and packed[i] == n:
+            return
+        self.packed = packed[:i] + array.array(TYPECODE, [n]) + packed[i:]
+
+    def add_all(self, numbers):
+        added = SubscriberStore(numbers)
+        new = sorted(set(added.packed).difference(self.packed))
+        # two sorted runs, which sorted() merges in one pass
+        self.packed = array.array(TYPECODE, sorted(self.packed.tolist() + new))
+        self.others = self.others | added.others
+
+    def discard(self, number):
+        if not E164.match(number):
+            self.others = self.others - frozenset([number])
+            return
+        packed, n = self.packed, to_int(number)
+        i = bisect.bisect_left(packed, n)
+        if i < len(packed) and packed[i] == n:
+            self.packed = packed[:i] + packed[i + 1:]
@@ -1,54 +1,273 @@
-from flask import request, Flask, render_template
+import os
+import hmac
+import json
+import time
+import functools
+import threading
 
-from .secretary import TwilioSecretary, SecretaryState
+from flask import request, current_app, Blueprint, Flask, render_template, make_response
 
-SecretaryState.from_disk()
+from .secretary import TwilioSecretary, SecretaryState, SecretarySettings
+from .cache import RenderCache
+from .idempotency import SeenCache
+from . import metrics
 
-app = Flask(__name__)
+pages = Blueprint('secretary', __name__)
 
+# whether this process has loaded the state yet. create_app() starts loading it in STATE_LOADER, and requests
+# that come in before it's done wait for it.
+STATE_LOADED = False
+STATE_LOCK = threading.Lock()
+STATE_LOADER = None
+# the process the background work was started in
+BACKGROUND_PID = None
+# MessageSids of texts already handled, one SeenCache for the process however many apps it makes
+SEEN_MESSAGES = None
 
-@app.route('/')
+CALL_TWIML = RenderCache()
+UPDATES_PAGE = RenderCache()
+UPDATES_PER_PAGE = 5
+
+
+def seen_messages(settings):
+    global SEEN_MESSAGES
+    with STATE_LOCK:
+        if SEEN_MESSAGES is None:
+            fn = None
+            if settings.get('WEBHOOK_DEDUPE_PERSIST', False):
+                fn = settings['STORE_JSON'] + '.seen'
+            SEEN_MESSAGES = SeenCache(size=settings.get('WEBHOOK_DEDUPE_SIZE', 10000),
+                                      ttl=settings.get('WEBHOOK_DEDUPE_TTL', 3600), fn=fn)
+        return SEEN_MESSAGES
+
+
+def load_state():
+    # before every request, so the state is there when a handler needs it but a worker can start without it
+    global STATE_LOADED
+    if STATE_LOADED:
+        return
+    with STATE_LOCK:
+        if not STATE_LOADED:
+            SecretaryState.from_disk()
+            # it has the scheduled commands
+            TwilioSecretary.start_scheduler()
+            STATE_LOADED = True
+
+
+def start_background():
+    """
+    Starts what runs in the background, once for each process: the outbox (which sends whatever was left
+    unsent), the flusher, and loading the state, after which the scheduler starts too. In a process forked
+    from one that had started them, the threads didn't come along, so they're started over.
+    """
+    global STATE_LOADER, STATE_LOADED, BACKGROUND_PID
+    pid = os.getpid()
+    if BACKGROUND_PID == pid:
+        return
+    with STATE_LOCK:
+        if BACKGROUND_PID == pid:
+            return
+        if BACKGROUND_PID is not None:
+            print 'starting background work again in %d, forked from %d' % (pid, BACKGROUND_PID)
+            TwilioSecretary.OUTBOX = TwilioSecretary.JOBS = TwilioSecretary.DELIVERY = None
+            SecretaryState.FLUSHER = SecretaryState.SCHEDULER = None
+            STATE_LOADED = False
+        BACKGROUND_PID = pid
+        STATE_LOADER = threading.Thread(target=load_state)
+        STATE_LOADER.daemon = True
+    TwilioSecretary.get_outbox()
+    SecretaryState.start_flusher()
+    STATE_LOADER.start()
+
+
+def post_fork(server, worker):
+    """
+    For gunicorn's post_fork setting, so a worker starts its background work as soon as it's forked rather
+    than with its first request.
+    """
+    start_background()
+
+
+def create_app(background=True):
+    """
+    Makes the app, once for each worker: the settings are read and the Twilio client is set up here rather
+    than for every request. Unless background is False the background work starts too; otherwise it
+    starts with the first request. The state is loaded in the background, so this returns straight away;
+    requests that come in first wait for it.
+    """
+    app = Flask(__name__)
+    app.settings = SecretarySettings.get_settings()
+    app.secretary = TwilioSecretary()
+    app.seen_messages = seen_messages(app.settings)
+    app.before_request(start_background)
+    app.before_request(load_state)
+    app.register_blueprint(pages)
+    if background:
+        start_background()
+    return app
+
+
+def instrumented(f):
+    # times the request, and logs and counts it if it raises
+    endpoint = f.__name__
+
+    @functools.wraps(f)
+    def handle(*args, **kwargs):
+        start = time.time()
+        try:
+            return f(*args, **kwargs)
+        except:
+            metrics.WEBHOOK_ERRORS.inc(endpoint)
+            import traceback
+            traceback.print_exc()
+            return 'something went wrong', 500
+        finally:
+            metrics.WEBHOOK_SECONDS.observe(time.time() - start, endpoint)
+    return handle
+
+
+def token_required(f):
+    # for pages showing what admins sent: they need STATUS_TOKEN, as ?token= or a bearer token
+    @functools.wraps(f)
+    def check(*args, **kwargs):
+        token = current_app.settings.get('STATUS_TOKEN')
+        given = request.args.get('token', '')
+        authorization = request.headers.get('Authorization', '')
+        if authorization.startswith('Bearer '):
+            given = authorization[len('Bearer '):]
+        if isinstance(given, unicode):
+            given = given.encode('utf-8')
+        if not token or not hmac.compare_digest(str(token), given):
+            return 'sorry but i dunno who you are buddy', 403
+        return f(*args, **kwargs)
+    return check
+
+
+def cached_response(cache, key, render, mimetype='text/html'):
+    body, etag, rendered_at = cache.get(key, render)
+    response = make_response(body)
+    response.mimetype = mimetype
+    response.set_etag(etag)
+    response.last_modified = rendered_at
+    return response.make_conditional(request)
+
+
+@pages.route('/')
 def root():
     return 'Hello, you have reached a place you do not belong. Revel in your rebellious nature.'
 
 
-@app.route('/inbound-sms/', methods=['POST'])
+@pages.route('/inbound-sms/', methods=['POST'])
+@instrumented
 def inbound_sms():
-    try:
-        tws = TwilioSecretary()
-        if not tws.check_sid(request.form['AccountSid']):
-            return 'sorry but i dunno who you are buddy', 403
+    tws = current_app.secretary
+    if not tws.check_sid(request.form['AccountSid']):
+        return 'sorry but i dunno who you are buddy', 403
 
-        tws.on_sms(request.form['From'], request.form['Body'])
-        tws.write_if_dirty()
+    message_sid = request.form.get('MessageSid')
+    if message_sid is not None and not current_app.seen_messages.add(message_sid):
+        metrics.WEBHOOK_DUPLICATES.inc()
         return "OK", 200
+
+    try:
+        SecretaryState.sync()
+        tws.on_sms(request.form['From'], request.form['Body'])
     except:
-        import traceback
-        traceback.print_exc()
+        if message_sid is not None:
+            current_app.seen_messages.forget(message_sid)
+        raise
+    tws.write_if_dirty()
+    return "OK", 200
+
+
+@pages.route('/sms-status/', methods=['POST'])
+@instrumented
+def sms_status():
+    tws = current_app.secretary
+    if not tws.check_sid(request.form['AccountSid']):
+        return 'sorry but i dunno who you are buddy', 403
+
+    TwilioSecretary.get_delivery().record({
+        'MessageSid': request.form.get('MessageSid'),
+        'MessageStatus': request.form.get('MessageStatus'),
+        'To': request.form.get('To'),
+        'ErrorCode': request.form.get('ErrorCode'),
+    })
+    return "OK", 200
 
 
-@app.route('/inbound-call/', methods=['POST'])
+@pages.route('/inbound-call/', methods=['POST'])
+@instrumented
 def inbound_call():
-    try:
-        tws = TwilioSecretary()
+    SecretaryState.sync()
+    current_update = SecretaryState.current_update()
 
-        return '<?xml version="1.0" encoding="UTF-8"?><Response><Say voice="woman">%s. To find out more, text this number.</Say></Response>' % SecretaryState.current_update(), 200
-    except:
-        import traceback
-        traceback.print_exc()
+    return cached_response(CALL_TWIML, current_update, lambda: '<?xml version="1.0" encoding="UTF-8"?><Response><Say voice="woman">%s. To find out more, text this number.</Say></Response>' % current_update,
+                           mimetype='text/xml')
 
 
-@app.route('/updates/')
+@pages.route('/updates/')
+@instrumented
 def updates():
-    try:
-        updates = [SecretaryState.format_update(update) for update in SecretaryState.recent_updates(count=5)]
-        tws = TwilioSecretary()
-        return render_template('latest.html', phone_number=tws.settings['PHONE_NUMBER'], updates=updates,
-                               master_name=tws.settings['MASTERS_NAME'],
+    SecretaryState.sync()
+    settings = current_app.settings
+    before = request.args.get('before', type=float)
+
+    def render(updates):
+        older = None
+        if len(updates) == UPDATES_PER_PAGE:
+            older = repr(updates[-1][0])
+        return render_template('latest.html', phone_number=settings['PHONE_NUMBER'], before=before,
+                               updates=[SecretaryState.format_update(update) for update in updates], older=older,
+                               master_name=settings['MASTERS_NAME'],
                                subscriber_count=SecretaryState.subscriber_count())
-    except:
-        import traceback
-        traceback.print_exc()
+
+    if before is not None:
+        return render(SecretaryState.updates_before(before, count=UPDATES_PER_PAGE))
+
+    # the page only has to be rendered again when something on it changes, including the "so long ago"s
+    version = SecretaryState.PAGE_VERSION
+    updates = SecretaryState.recent_updates(count=UPDATES_PER_PAGE)
+    texts = tuple([SecretaryState.format_update(update) for update in updates])
+
+    return cached_response(UPDATES_PAGE, (version, texts), lambda: render(updates))
+
+
+@pages.route('/broadcasts/')
+@pages.route('/broadcasts/<job_id>/')
+@instrumented
+@token_required
+def broadcasts(job_id=None):
+    jobs = TwilioSecretary.get_jobs()
+    if job_id is None:
+        doc = {'broadcasts': jobs.all_progress()}
+    else:
+        doc = jobs.progress(job_id)
+        if doc is None:
+            return 'no such broadcast', 404
+
+    response = make_response(json.dumps(doc))
+    response.mimetype = 'application/json'
+    response.cache_control.no_cache = True
+    return response
+
+
+metrics.REGISTRY.add(metrics.Gauge('secretary_subscribers', 'Number of subscribers', SecretaryState.subscriber_count))
+metrics.REGISTRY.add(metrics.Gauge('secretary_outbox_depth', 'Texts waiting to be sent',
+                                   lambda: TwilioSecretary.get_outbox().depth()))
+
+
+@pages.route('/metrics')
+def metrics_page():
+    response = make_response(metrics.REGISTRY.render())
+    response.mimetype = 'text/plain'
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4'
+    return response
+
+
+# a pre-forking server (gunicorn --preload) imports this before it forks, so nothing is started here
+app = create_app(background=False)
 
 if __name__ == '__main__':
+    start_background()
     app.run('0.0.0.0')